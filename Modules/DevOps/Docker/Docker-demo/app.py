@@ -1,12 +1,37 @@
-from flask import Flask, redirect, render_template, request
+from flask import (Flask, abort, jsonify, redirect, render_template, request,
+                   stream_template)
 import platform
 import os
+import threading
 import psycopg2
+from psycopg2.pool import PoolError
+
+from db_pool import ConnectionPool
 
 
 app = Flask(__name__)
 
 DATABASE_URL = os.environ['DATABASE_URL']
+
+# One connection pool per process, shared by the request threads
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_HEALTH_CHECK_AFTER = float(
+    os.environ.get('DB_POOL_HEALTH_CHECK_AFTER', '30'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+
+# /todos shows one page of todos at a time, by id; ?limit= can ask for up to
+# TODOS_MAX_PAGE_SIZE. /todos/export streams all of them, fetching
+# TODOS_EXPORT_FETCH_ROWS rows at a time
+TODOS_PAGE_SIZE = int(os.environ.get('TODOS_PAGE_SIZE', '50'))
+TODOS_MAX_PAGE_SIZE = int(os.environ.get('TODOS_MAX_PAGE_SIZE', '500'))
+TODOS_EXPORT_FETCH_ROWS = int(os.environ.get('TODOS_EXPORT_FETCH_ROWS', '2000'))
+
+_pool = None
+_pool_lock = threading.Lock()
+_schema_ready = False
+
 @app.route('/')
 def hello():
     container_details = get_container_details()
@@ -26,15 +51,41 @@ def get_container_details():
     return details
 
 
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                DATABASE_URL,
+                minconn=DB_POOL_MIN,
+                maxconn=DB_POOL_MAX,
+                idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                health_check_after=DB_POOL_HEALTH_CHECK_AFTER,
+                timeout=DB_POOL_TIMEOUT,
+            )
+        return _pool
+
+
 def get_db_connection():
-    create_todos_table_if_not_exists()
+    """A connection from the pool; answers 503 when none can be had."""
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-    except psycopg2.Error as e:
+        # The schema is created once, at startup; this only covers a server
+        # started without initialize_db, e.g. with `flask run`
+        if not _schema_ready:
+            initialize_db()
+        return get_pool().getconn()
+    except (psycopg2.Error, PoolError) as e:
         print(f"Error connecting to database: {e}")
-        # Add logging or other error handling
-        return None
-    return conn
+        abort(503, description='The database is not available.')
+
+def release_db_connection(conn):
+    """Give a connection from get_db_connection back to the pool."""
+    if conn is None:
+        return
+    if _pool is None:
+        conn.close()
+    else:
+        _pool.putconn(conn)
 
 def create_todos_table_if_not_exists():
     conn = psycopg2.connect(DATABASE_URL)
@@ -43,11 +94,14 @@ def create_todos_table_if_not_exists():
                 'description text)')
     conn.commit()
     conn.close()
-    if not todos:
-        return "No todos found."
 
 def initialize_db():
-    create_todos_table_if_not_exists()
+    global _schema_ready
+    with _pool_lock:
+        if not _schema_ready:
+            create_todos_table_if_not_exists()
+            _schema_ready = True
+    get_pool().fill()
 
 @app.route('/todos')
 @app.route('/todos', methods=['GET', 'POST'])
@@ -55,38 +109,121 @@ def todos():
     if request.method == 'POST':
         description = request.form['description']
         conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('INSERT INTO todos (description) VALUES (%s)',
-                    (description,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        try:
+            cur = conn.cursor()
+            cur.execute('INSERT INTO todos (description) VALUES (%s)',
+                        (description,))
+            conn.commit()
+            cur.close()
+        finally:
+            release_db_connection(conn)
         return redirect('/todos')
 
+    # Keyset pagination: a page starts after (or ends before) an id, so the
+    # primary key index finds it however deep it is
+    limit = request.args.get('limit', TODOS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, TODOS_MAX_PAGE_SIZE))
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
     conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM todos')
-    todo_list = cur.fetchall()
+    try:
+        cur = conn.cursor()
+        # One row more than the page tells whether there is another page
+        if before is not None:
+            cur.execute('SELECT id, description FROM todos WHERE id < %s '
+                        'ORDER BY id DESC LIMIT %s', (before, limit + 1))
+        else:
+            cur.execute('SELECT id, description FROM todos WHERE id > %s '
+                        'ORDER BY id LIMIT %s', (after or 0, limit + 1))
+        todo_list = cur.fetchall()
+        more = len(todo_list) > limit
+        todo_list = todo_list[:limit]
+        if before is not None:
+            todo_list.reverse()
+            has_previous, has_next = more, False
+            if todo_list:
+                # Whether rows still follow the page, not just a `before`
+                cur.execute('SELECT EXISTS (SELECT 1 FROM todos WHERE id > %s)',
+                            (todo_list[-1][0],))
+                has_next = cur.fetchone()[0]
+        else:
+            has_previous, has_next = False, more
+            if after:
+                # Whether the page really has rows before it, not just an `after`
+                cur.execute('SELECT EXISTS (SELECT 1 FROM todos WHERE id <= %s)',
+                            (after,))
+                has_previous = cur.fetchone()[0]
+        cur.close()
+    finally:
+        release_db_connection(conn)
+
+    return render_template(
+        'todos.html',
+        todos=todo_list,
+        limit=limit,
+        previous_before=todo_list[0][0] if todo_list and has_previous else None,
+        next_after=todo_list[-1][0] if todo_list and has_next else None,
+    )
+
+def iter_all_todos(conn):
+    """Every todo, by id, read with a server-side cursor."""
+    # A named cursor keeps the result on the server; rows come over
+    # TODOS_EXPORT_FETCH_ROWS at a time as the template consumes them
+    cur = conn.cursor(name='todos_export')
+    cur.itersize = TODOS_EXPORT_FETCH_ROWS
+    cur.execute('SELECT id, description FROM todos ORDER BY id')
+    for row in cur:
+        yield row
     cur.close()
-    conn.close()
-    return render_template('todos.html', todos=todo_list)
+
+def buffered(chunks, size=16 * 1024):
+    """Join template output into writes of about `size` characters."""
+    buffer, length = [], 0
+    try:
+        for chunk in chunks:
+            buffer.append(chunk)
+            length += len(chunk)
+            if length >= size:
+                yield ''.join(buffer)
+                buffer, length = [], 0
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # A client that goes away closes the response; close the template
+        # stream too, so it stops reading rows
+        chunks.close()
+
+@app.route('/todos/export')
+def export_todos():
+    # Taken before the response starts, so a database that is down is a 503
+    # rather than a cut-off page
+    conn = get_db_connection()
+    # The page is sent while the rows are read, so memory stays at one
+    # batch of rows and the first bytes go out before the last row is read
+    response = app.response_class(
+        buffered(stream_template('todos.html', todos=iter_all_todos(conn),
+                                 export=True)),
+        mimetype='text/html')
+    # Called when the stream ends, whether it finished or the client left
+    response.call_on_close(lambda: release_db_connection(conn))
+    return response
 
 @app.route('/remove_todo/<int:todo_id>')
 def remove_todo(todo_id):
     conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM todos WHERE id = %s', (todo_id,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    try:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM todos WHERE id = %s', (todo_id,))
+        conn.commit()
+        cur.close()
+    finally:
+        release_db_connection(conn)
     return redirect('/todos')
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('CREATE TABLE IF NOT EXISTS todos (id serial PRIMARY KEY,'
-                'description text)')
-    conn.commit()
-    conn.close()
+@app.route('/pool_stats')
+def pool_stats():
+    return jsonify(get_pool().stats())
+
 if __name__ == '__main__':
     initialize_db()
     app.run(host='0.0.0.0', port=8000)
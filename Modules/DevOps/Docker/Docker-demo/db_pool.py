@@ -0,0 +1,229 @@
+"""A thread-safe PostgreSQL connection pool for app.py.
+
+Connections are opened once and handed from request to request instead of
+being opened and closed for every page view. The pool keeps at least
+`minconn` connections open and never more than `maxconn`; when all of them
+are in use, getconn waits up to `timeout` seconds for one to come back.
+
+A connection that sat idle longer than `health_check_after` seconds is
+checked with `SELECT 1` before it is handed out, and replaced if the server
+closed it. Idle connections above `minconn` are closed after `idle_timeout`
+seconds. Both happen when connections are taken or returned, so the pool
+needs no background thread. Network calls are made outside the pool's lock.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, dsn, minconn=1, maxconn=10, idle_timeout=300.0,
+                 health_check_after=30.0, timeout=5.0, connect=None,
+                 clock=time.monotonic):
+        if not 0 <= minconn <= maxconn or maxconn < 1:
+            raise ValueError('need 0 <= minconn <= maxconn and maxconn >= 1')
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+        self._connect = connect or (lambda: psycopg2.connect(self.dsn))
+        self._clock = clock
+        self._lock = threading.Condition()
+        # (connection, time it was returned), the most recently used last
+        self._idle = []
+        self._in_use = set()
+        # Connections being opened count against maxconn too
+        self._opening = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'acquired': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'timeouts': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'idle_evictions': 0,
+        }
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _open(self, in_use):
+        """Open the connection of a slot reserved with _opening."""
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._opening -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._opening -= 1
+            self._stats['connections_opened'] += 1
+            if in_use:
+                self._in_use.add(conn)
+            else:
+                self._idle.insert(0, (conn, self._clock()))
+                self._lock.notify()
+        return conn
+
+    def _discard(self, conn):
+        """Close a connection; call with the lock held."""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._stats['connections_closed'] += 1
+
+    def _evict_idle(self):
+        """Close connections idle past idle_timeout, down to minconn."""
+        now = self._clock()
+        while (self._idle and self._size() > self.minconn
+               and now - self._idle[0][1] > self.idle_timeout):
+            conn, _ = self._idle.pop(0)
+            self._discard(conn)
+            self._stats['idle_evictions'] += 1
+
+    def fill(self):
+        """Open connections up to minconn, e.g. at startup."""
+        while True:
+            with self._lock:
+                if self._closed or self._size() >= self.minconn:
+                    return
+                self._opening += 1
+            self._open(in_use=False)
+
+    def _reserve(self, start, timeout):
+        """An idle connection, or None for a new slot; and whether we waited.
+
+        The idle connection is already counted as in use.
+        """
+        waited = False
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolError('connection pool is closed')
+                self._evict_idle()
+                if self._idle:
+                    conn, returned = self._idle.pop()
+                    self._in_use.add(conn)
+                    return conn, self._clock() - returned, waited
+                if self._size() < self.maxconn:
+                    self._opening += 1
+                    return None, 0.0, waited
+                remaining = timeout - (self._clock() - start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'no connection free after {timeout:.1f} s '
+                        f'({self.maxconn} in use)')
+                waited = True
+                self._waiting += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _healthy(self, conn, idle_seconds):
+        if conn.closed:
+            return False
+        if idle_seconds <= self.health_check_after:
+            return True
+        with self._lock:
+            self._stats['health_checks'] += 1
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=None):
+        """A connection from the pool; give it back with putconn."""
+        timeout = self.timeout if timeout is None else timeout
+        start = self._clock()
+        while True:
+            conn, idle_seconds, waited = self._reserve(start, timeout)
+            if conn is None:
+                conn = self._open(in_use=True)
+                break
+            if self._healthy(conn, idle_seconds):
+                break
+            with self._lock:
+                self._in_use.discard(conn)
+                self._discard(conn)
+                self._stats['health_check_failures'] += 1
+                self._lock.notify()
+        with self._lock:
+            self._stats['acquired'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_seconds'] += self._clock() - start
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection; a broken one is closed instead."""
+        with self._lock:
+            if conn not in self._in_use:
+                raise PoolError('connection does not belong to this pool')
+        if not close and not conn.closed:
+            try:
+                # Never hand an open transaction to the next request
+                status = conn.get_transaction_status()
+                if status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        with self._lock:
+            self._in_use.discard(conn)
+            if close or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, self._clock()))
+            self._evict_idle()
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        """Close the idle connections; those in use close when returned."""
+        with self._lock:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._lock.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                minconn=self.minconn,
+                maxconn=self.maxconn,
+                size=self._size(),
+                idle=len(self._idle),
+                in_use=len(self._in_use),
+                waiting=self._waiting,
+            )
@@ -1,6 +1,9 @@
 import unittest
 from unittest.mock import patch
-from app import app, get_db_connection, create_todos_table_if_not_exists
+import app as app_module
+from app import (app, get_db_connection, create_todos_table_if_not_exists,
+                 release_db_connection)
+from db_pool import PoolTimeout
 
 class TestApp(unittest.TestCase):
 
@@ -35,6 +38,130 @@ class TestApp(unittest.TestCase):
             mock_connect.return_value.cursor.return_value.execute.assert_called_once_with(
                 'CREATE TABLE IF NOT EXISTS todos (id serial PRIMARY KEY,description text)'
             )
+    def test_pool_stats(self):
+        with patch('app.get_pool') as mock_get_pool:
+            mock_get_pool.return_value.stats.return_value = {'size': 1, 'idle': 1}
+            response = self.app.get('/pool_stats')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), {'size': 1, 'idle': 1})
+
+    def test_connection_is_released_after_request(self):
+        with patch('app.get_db_connection') as mock_get_db_connection, \
+                patch('app.release_db_connection') as mock_release:
+            mock_get_db_connection.return_value.cursor.return_value.fetchall.return_value = []
+            self.app.get('/todos')
+            mock_release.assert_called_once_with(mock_get_db_connection.return_value)
+
+    def test_database_unavailable_is_a_503(self):
+        with patch('app.get_pool') as mock_get_pool, \
+                patch('app._schema_ready', True):
+            mock_get_pool.return_value.getconn.side_effect = PoolTimeout(
+                'no connection free')
+            self.assertEqual(self.app.get('/todos').status_code, 503)
+            self.assertEqual(self.app.get('/todos/export').status_code, 503)
+            mock_get_pool.return_value.putconn.assert_not_called()
+
+    def test_release_without_a_connection_does_nothing(self):
+        with patch('app._pool') as mock_pool:
+            release_db_connection(None)
+            mock_pool.putconn.assert_not_called()
+
+    def test_todos_page_is_a_keyset_page(self):
+        with patch('app.get_db_connection') as mock_get_db_connection, \
+                patch('app.release_db_connection'):
+            cursor = mock_get_db_connection.return_value.cursor.return_value
+            cursor.fetchall.return_value = [(11, "Todo 11"), (12, "Todo 12"),
+                                            (13, "Todo 13")]
+            cursor.fetchone.return_value = (True,)
+            response = self.app.get('/todos?after=10&limit=2')
+            self.assertEqual(cursor.execute.call_args_list[0][0], (
+                'SELECT id, description FROM todos WHERE id > %s '
+                'ORDER BY id LIMIT %s', (10, 3)))
+            self.assertIn(b"Todo 12", response.data)
+            self.assertNotIn(b"Todo 13", response.data)
+            self.assertIn(b'href="/todos?after=12&amp;limit=2"', response.data)
+            self.assertIn(b'href="/todos?before=11&amp;limit=2"', response.data)
+
+    def test_no_previous_link_on_the_first_page(self):
+        with patch('app.get_db_connection') as mock_get_db_connection, \
+                patch('app.release_db_connection'):
+            cursor = mock_get_db_connection.return_value.cursor.return_value
+            cursor.fetchall.return_value = [(5, "Todo 5"), (6, "Todo 6")]
+            response = self.app.get('/todos?after=0&limit=2')
+            self.assertEqual(cursor.execute.call_count, 1)
+            self.assertNotIn(b"Previous", response.data)
+
+            # Every row before id 4 was deleted
+            cursor.execute.reset_mock()
+            cursor.fetchone.return_value = (False,)
+            response = self.app.get('/todos?after=4&limit=2')
+            cursor.execute.assert_called_with(
+                'SELECT EXISTS (SELECT 1 FROM todos WHERE id <= %s)', (4,))
+            self.assertNotIn(b"Previous", response.data)
+
+    def test_todos_previous_page(self):
+        with patch('app.get_db_connection') as mock_get_db_connection, \
+                patch('app.release_db_connection'):
+            cursor = mock_get_db_connection.return_value.cursor.return_value
+            cursor.fetchall.return_value = [(9, "Todo 9"), (8, "Todo 8")]
+            cursor.fetchone.return_value = (True,)
+            response = self.app.get('/todos?before=10&limit=2')
+            self.assertEqual(cursor.execute.call_args_list[0][0], (
+                'SELECT id, description FROM todos WHERE id < %s '
+                'ORDER BY id DESC LIMIT %s', (10, 3)))
+            cursor.execute.assert_called_with(
+                'SELECT EXISTS (SELECT 1 FROM todos WHERE id > %s)', (9,))
+            self.assertLess(response.data.index(b"Todo 8"),
+                            response.data.index(b"Todo 9"))
+            self.assertNotIn(b"Previous", response.data)
+            self.assertIn(b'href="/todos?after=9&amp;limit=2"', response.data)
+
+    def test_no_next_link_when_nothing_follows_the_page(self):
+        with patch('app.get_db_connection') as mock_get_db_connection, \
+                patch('app.release_db_connection'):
+            cursor = mock_get_db_connection.return_value.cursor.return_value
+            # Every row from id 10 on was deleted since the link was made
+            cursor.fetchall.return_value = [(9, "Todo 9"), (8, "Todo 8")]
+            cursor.fetchone.return_value = (False,)
+            response = self.app.get('/todos?before=10&limit=2')
+            self.assertIn(b"Todo 9", response.data)
+            self.assertNotIn(b"Next", response.data)
+
+    def test_page_size_is_capped(self):
+        with patch('app.get_db_connection') as mock_get_db_connection, \
+                patch('app.release_db_connection'):
+            cursor = mock_get_db_connection.return_value.cursor.return_value
+            cursor.fetchall.return_value = []
+            self.app.get('/todos?limit=100000')
+            self.assertEqual(cursor.execute.call_args[0][1],
+                             (0, app_module.TODOS_MAX_PAGE_SIZE + 1))
+
+    def test_export_streams_from_a_server_side_cursor(self):
+        rows = [(i, f"Todo {i}") for i in range(1, 3001)]
+        with patch('app.get_db_connection') as mock_get_db_connection, \
+                patch('app.release_db_connection') as mock_release:
+            conn = mock_get_db_connection.return_value
+            conn.cursor.return_value.__iter__.return_value = iter(rows)
+            response = self.app.get('/todos/export')
+            self.assertTrue(response.is_streamed)
+            conn.cursor.assert_called_once_with(name='todos_export')
+            self.assertIn(b"Todo 1 ", response.data)
+            self.assertIn(b"Todo 3000 ", response.data)
+            # The WSGI server closes every response it has sent
+            response.close()
+            mock_release.assert_called_once_with(conn)
+
+    def test_export_releases_connection_when_client_goes_away(self):
+        rows = ((i, f"Todo {i}") for i in range(1, 100001))
+        with patch('app.get_db_connection') as mock_get_db_connection, \
+                patch('app.release_db_connection') as mock_release:
+            conn = mock_get_db_connection.return_value
+            conn.cursor.return_value.__iter__.return_value = rows
+            response = self.app.get('/todos/export', buffered=False)
+            next(response.iter_encoded())
+            mock_release.assert_not_called()
+            response.close()
+            mock_release.assert_called_once_with(conn)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,191 @@
+import threading
+import time
+import unittest
+
+import psycopg2
+from psycopg2 import extensions
+
+from db_pool import ConnectionPool, PoolError, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.execute = conn.execute
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.in_transaction = False
+        self.rollbacks = 0
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def execute(self, query, params=None):
+        if self.broken:
+            raise psycopg2.OperationalError('server closed the connection')
+        self.queries.append(query)
+        self.in_transaction = True
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def get_transaction_status(self):
+        if self.in_transaction:
+            return extensions.TRANSACTION_STATUS_INTRANS
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.opened = []
+        self.clock = FakeClock()
+
+    def connect(self):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+    def pool(self, **kwargs):
+        kwargs.setdefault('connect', self.connect)
+        kwargs.setdefault('clock', self.clock)
+        return ConnectionPool('postgresql://test', **kwargs)
+
+    def test_connections_are_reused(self):
+        pool = self.pool(minconn=1, maxconn=2)
+        pool.fill()
+        self.assertEqual(len(self.opened), 1)
+        for _ in range(5):
+            with pool.connection() as conn:
+                self.assertIs(conn, self.opened[0])
+        stats = pool.stats()
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['acquired'], 5)
+        self.assertEqual((stats['idle'], stats['in_use']), (1, 0))
+
+    def test_open_transaction_is_rolled_back_on_return(self):
+        pool = self.pool()
+        conn = pool.getconn()
+        conn.execute('INSERT INTO todos (description) VALUES (%s)')
+        pool.putconn(conn)
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertIs(pool.getconn(), conn)
+
+    def test_times_out_when_all_connections_are_in_use(self):
+        pool = self.pool(maxconn=2)
+        pool.getconn(), pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(timeout=0)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_waiter_gets_a_returned_connection(self):
+        pool = ConnectionPool('postgresql://test', maxconn=1,
+                              connect=self.connect)
+        conn = pool.getconn()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+        waiter.start()
+        while pool.stats()['waiting'] == 0:
+            time.sleep(0.001)
+        pool.putconn(conn)
+        waiter.join(5)
+        self.assertEqual(got, [conn])
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_stale_connection_is_checked_and_replaced(self):
+        pool = self.pool(health_check_after=30)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.clock.now = 10
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(conn.queries, [])
+        pool.putconn(conn)
+
+        conn.broken = True
+        self.clock.now = 100
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+        stats = pool.stats()
+        self.assertEqual(stats['health_checks'], 1)
+        self.assertEqual(stats['health_check_failures'], 1)
+
+    def test_closed_connection_is_not_pooled(self):
+        pool = self.pool()
+        conn = pool.getconn()
+        conn.close()
+        pool.putconn(conn)
+        self.assertEqual(pool.stats()['size'], 0)
+        self.assertIsNot(pool.getconn(), conn)
+
+    def test_idle_connections_above_minimum_are_evicted(self):
+        pool = self.pool(minconn=1, maxconn=3, idle_timeout=60)
+        conns = [pool.getconn() for _ in range(3)]
+        for conn in conns:
+            pool.putconn(conn)
+        self.clock.now = 61
+        pool.putconn(pool.getconn())
+        stats = pool.stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['idle_evictions'], 2)
+
+    def test_foreign_connection_is_rejected(self):
+        with self.assertRaises(PoolError):
+            self.pool().putconn(FakeConnection())
+
+    def test_closeall(self):
+        pool = self.pool(minconn=2)
+        pool.fill()
+        pool.closeall()
+        self.assertTrue(all(conn.closed for conn in self.opened))
+        with self.assertRaises(PoolError):
+            pool.getconn()
+
+    def test_threads_never_exceed_maxconn(self):
+        pool = ConnectionPool('postgresql://test', maxconn=3,
+                              connect=self.connect)
+        in_use = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            for _ in range(50):
+                with pool.connection():
+                    with lock:
+                        in_use.append(1)
+                        peak.append(len(in_use))
+                    time.sleep(0.0005)
+                    with lock:
+                        in_use.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(max(peak), 3)
+        self.assertLessEqual(len(self.opened), 3)
+        self.assertEqual(pool.stats()['acquired'], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import collections
+import math
+import threading
+import time
+
+# Weight of the newest request in the moving average of the service time
+SERVICE_TIME_WEIGHT = 0.1
+
+
+class Overloaded(Exception):
+    """A request was shed; `status` is 429 or 503, `retry_after` in seconds."""
+
+    def __init__(self, reason, status, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Cap concurrent predictions, with a bounded FIFO queue and deadlines.
+
+    Up to `max_concurrency` requests run at once. Up to `max_queue` more wait
+    in arrival order, and any further request is shed with 429 (queue_full).
+    A request is also shed, with 503, when it could not start and finish
+    before its deadline. That happens up front if the queue ahead of it and a
+    moving average of the service time already rule it out
+    (deadline_unreachable). It also happens when the request gives up waiting
+    (queue_timeout). Shedding early leaves the CPU to requests that can still
+    make it, instead of letting every client's latency grow without bound.
+    """
+
+    def __init__(self, max_concurrency, max_queue=16, clock=time.monotonic):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.clock = clock
+        self.service_time = 0.0
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = collections.Counter()
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    def _retry_after(self):
+        # Time for the current queue to drain, rounded up to whole seconds
+        backlog = self.in_flight + len(self._waiters)
+        return max(1, math.ceil(backlog / self.max_concurrency * self.service_time))
+
+    def _shed(self, reason, status):
+        self.shed[reason] += 1
+        return Overloaded(reason, status, self._retry_after())
+
+    def acquire(self, deadline):
+        """Wait for a slot; returns the start time to pass to release().
+
+        `deadline` is on the controller's clock. Raises Overloaded when the
+        request is shed.
+        """
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self._waiters:
+                self.in_flight += 1
+                self.admitted += 1
+                return self.clock()
+            if len(self._waiters) >= self.max_queue:
+                raise self._shed("queue_full", 429)
+            # Everyone queued ahead, spread over the slots, then this request
+            expected_wait = (
+                (len(self._waiters) + 1) / self.max_concurrency * self.service_time
+            )
+            if self.clock() + expected_wait + self.service_time > deadline:
+                raise self._shed("deadline_unreachable", 503)
+            ready = threading.Event()
+            self._waiters.append(ready)
+
+        timeout = deadline - self.service_time - self.clock()
+        try:
+            ready.wait(min(max(0.0, timeout), threading.TIMEOUT_MAX))
+        except BaseException:
+            with self._lock:
+                if ready.is_set():
+                    # The slot was ours already; pass it on
+                    self._hand_over()
+                else:
+                    self._waiters.remove(ready)
+            raise
+        with self._lock:
+            # release() may have handed over a slot just as the wait timed out
+            if not ready.is_set():
+                self._waiters.remove(ready)
+                raise self._shed("queue_timeout", 503)
+            self.admitted += 1
+            return self.clock()
+
+    def release(self, started):
+        with self._lock:
+            elapsed = self.clock() - started
+            self.service_time += SERVICE_TIME_WEIGHT * (elapsed - self.service_time)
+            self._hand_over()
+
+    def _hand_over(self):
+        """Free a slot; call with the lock held."""
+        if self._waiters:
+            # Hand the slot straight to the oldest waiter
+            self._waiters.popleft().set()
+        else:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiters),
+                "service_time_seconds": self.service_time,
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+            }
@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Upper bounds of the achieved batch size histogram; the last bucket is open
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+class MicroBatcher:
+    """Queue single-row requests and score them together.
+
+    A background thread takes the first queued row, keeps collecting rows for
+    up to `window_ms` or until `max_batch_size` rows are queued, and runs
+    `predict_batch(rows)` once for all of them. `predict_batch` must return one
+    result per row, in order; each caller gets its own result back. If it
+    raises, or returns the wrong number of results, every row of the batch
+    gets the exception, so no caller waits forever. Errors that concern one
+    row belong in that row's result (see inference.predict_rows).
+    """
+
+    def __init__(self, predict_batch, window_ms=2.0, max_batch_size=32):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_batch = predict_batch
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+
+        self._start()
+        # Threads do not survive fork(); pre-forked workers need their own
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._rows = 0
+        self._largest_batch = 0
+        self._batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+        self._thread = threading.Thread(
+            target=self._run, name="micro-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, row):
+        future = Future()
+        self._queue.put((row, future))
+        return future
+
+    def predict(self, row, timeout=None):
+        return self.submit(row).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Callers may have given up on their row in the meantime
+            batch = [
+                (row, future)
+                for row, future in batch
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            rows = [row for row, _ in batch]
+            try:
+                results = list(self.predict_batch(rows))
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"predict_batch returned {len(results)} results "
+                        f"for {len(batch)} rows"
+                    )
+            except Exception as e:
+                # Without one result per row, no row's result can be trusted
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            self._record(len(batch))
+
+    def _record(self, size):
+        bucket = 0
+        while bucket < len(BATCH_SIZE_BUCKETS) and size > BATCH_SIZE_BUCKETS[bucket]:
+            bucket += 1
+        with self._lock:
+            self._batches += 1
+            self._rows += size
+            self._largest_batch = max(self._largest_batch, size)
+            self._batch_size_counts[bucket] += 1
+
+    def stats(self):
+        with self._lock:
+            labels = [str(bound) for bound in BATCH_SIZE_BUCKETS] + ["+Inf"]
+            return {
+                "window_ms": self.window * 1000.0,
+                "max_batch_size": self.max_batch_size,
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "rows": self._rows,
+                "mean_batch_size": self._rows / self._batches if self._batches else 0.0,
+                "largest_batch_size": self._largest_batch,
+                "batch_size_histogram": dict(zip(labels, self._batch_size_counts)),
+            }
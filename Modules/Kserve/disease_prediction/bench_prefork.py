@@ -0,0 +1,166 @@
+"""Compare `python inference.py` with the pre-fork `python serve.py`.
+
+    python bench_prefork.py [--workers 2] [--clients 8] [--duration 10]
+
+Each server is started as a subprocess with the current environment
+(MODEL_DIR, MODEL_BACKEND, ...), driven by keep-alive client threads posting
+single-row /predict/ requests, and then measured: requests per second, plus RSS
+and PSS summed over the server's processes. PSS splits shared pages between
+the processes that map them, so it shows what copy-on-write sharing saves.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+BODY = json.dumps(
+    {"crop_name": "rice", "temperature": 25, "humidity": 50, "soil_moisture": 60}
+)
+
+
+def process_tree(pid):
+    pids = [pid]
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except OSError:
+                continue
+            if ppid == pid:
+                pids.append(int(entry))
+    return pids
+
+
+def memory_kib(pid):
+    """RSS and PSS of one process, in KiB, from /proc/<pid>/smaps_rollup."""
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                usage[name] = int(rest.split()[0])
+    return usage["Rss"], usage["Pss"]
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/admin/model")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def drive(port, clients, duration):
+    counts = [0] * clients
+    errors = [0] * clients
+    stop = time.monotonic() + duration
+
+    def client(i):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        headers = {"Content-Type": "application/json"}
+        while time.monotonic() < stop:
+            try:
+                conn.request("POST", "/predict/", BODY, headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    counts[i] += 1
+                else:
+                    errors[i] += 1
+            except OSError:
+                errors[i] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / duration, sum(errors)
+
+
+def run(label, command, port, clients, duration):
+    server = subprocess.Popen(
+        command,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(port)
+        throughput, errors = drive(port, clients, duration)
+        pids = process_tree(server.pid)
+        rss, pss = (sum(values) for values in zip(*map(memory_kib, pids)))
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "server": label,
+        "processes": len(pids),
+        "requests_per_second": throughput,
+        "errors": errors,
+        "rss_mib": rss / 1024,
+        "pss_mib": pss / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=18082)
+    args = parser.parse_args(argv)
+
+    runs = [
+        (
+            "inference.py",
+            [
+                sys.executable,
+                "-c",
+                f"import inference; inference.app.run(port={args.port}, threaded=True)",
+            ],
+        ),
+        (
+            f"serve.py --workers {args.workers}",
+            [
+                sys.executable,
+                "serve.py",
+                "--workers",
+                str(args.workers),
+                "--port",
+                str(args.port),
+            ],
+        ),
+    ]
+    results = [
+        run(label, command, args.port, args.clients, args.duration)
+        for label, command in runs
+    ]
+    print(
+        f"{'server':<22}{'procs':>6}{'req/s':>9}{'errors':>8}"
+        f"{'RSS MiB':>10}{'PSS MiB':>10}"
+    )
+    for result in results:
+        print(
+            f"{result['server']:<22}{result['processes']:>6}"
+            f"{result['requests_per_second']:>9.1f}{result['errors']:>8}"
+            f"{result['rss_mib']:>10.1f}{result['pss_mib']:>10.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
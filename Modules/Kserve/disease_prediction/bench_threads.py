@@ -0,0 +1,158 @@
+"""Latency of the sklearn model with sized vs oversubscribed thread pools.
+
+    python bench_threads.py [--quota 0.5] [--oversubscribed 8] [--requests 200]
+
+Each setting runs in a child process with its BLAS/OpenMP variables and the
+forest's n_jobs set to the given thread count. When the cgroup filesystem is
+writable (as root on a cgroup v1 `cpu` or v2 mount), the child is first moved
+into a cgroup limited to --quota CPUs, like the pod in deployment.yaml.
+"sized" uses the threads runtime.py would pick for that quota. "oversubscribed"
+uses what a library sees through os.cpu_count() on a large node.
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+from runtime import CGROUP_ROOT, THREAD_ENV_VARS
+
+CGROUP_NAME = "disease-bench"
+
+
+def make_cgroup(quota, period=100000):
+    """Create a cgroup limited to `quota` CPUs; returns its procs file or None."""
+    candidates = [
+        # cgroup v2: needs the cpu controller enabled for children of the root
+        (
+            os.path.join(CGROUP_ROOT, CGROUP_NAME),
+            "cpu.max",
+            f"{int(quota * period)} {period}",
+        ),
+        # cgroup v1
+        (
+            os.path.join(CGROUP_ROOT, "cpu", CGROUP_NAME),
+            "cpu.cfs_quota_us",
+            str(int(quota * period)),
+        ),
+    ]
+    for directory, limit_file, value in candidates:
+        # Only inside a real cgroup mount, which lists its processes
+        if not os.path.exists(os.path.join(os.path.dirname(directory), "cgroup.procs")):
+            continue
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, limit_file), "w") as f:
+                f.write(value)
+        except OSError:
+            continue
+        return os.path.join(directory, "cgroup.procs")
+    return None
+
+
+def run_child(threads, procs, args):
+    env = dict(os.environ, **{name: str(threads) for name in THREAD_ENV_VARS})
+
+    def enter_cgroup():
+        if procs:
+            with open(procs, "w") as f:
+                f.write(str(os.getpid()))
+
+    output = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "child",
+            "--threads",
+            str(threads),
+            "--requests",
+            str(args.requests),
+            "--rows",
+            args.rows,
+            "--model-dir",
+            args.model_dir,
+        ],
+        env=env,
+        preexec_fn=enter_cgroup,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def child(args):
+    import numpy as np
+
+    from predictors import SklearnModel
+
+    predictor = SklearnModel.load(args.model_dir)
+    predictor.model.n_jobs = args.threads
+    crops = sorted(predictor.known_crops)
+    rng = np.random.default_rng(0)
+    results = {}
+    for rows in map(int, args.rows.split(",")):
+        crop_names = rng.choice(crops, rows).tolist()
+        numeric = rng.uniform([-10, 0, 0], [50, 100, 100], (rows, 3))
+        predictor.predict(crop_names, numeric)
+        timings = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            predictor.predict(crop_names, numeric)
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1000.0
+        results[rows] = {
+            "p50_ms": float(np.percentile(timings, 50)),
+            "p99_ms": float(np.percentile(timings, 99)),
+            "mean_ms": float(timings.mean()),
+        }
+    print(json.dumps(results))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("mode", nargs="?", choices=["child"])
+    parser.add_argument("--quota", type=float, default=0.5)
+    parser.add_argument("--oversubscribed", type=int, default=max(8, os.cpu_count()))
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rows", default="1,100")
+    parser.add_argument("--model-dir", default=".")
+    args = parser.parse_args(argv)
+
+    if args.mode == "child":
+        child(args)
+        return 0
+
+    procs = make_cgroup(args.quota)
+    if procs:
+        print(f"Running in cgroup {os.path.dirname(procs)} at {args.quota} CPUs")
+    else:
+        print("Cannot create a cgroup here; running without a CPU quota")
+    settings = {
+        "sized": max(1, math.floor(args.quota)),
+        "oversubscribed": args.oversubscribed,
+    }
+    results = {
+        name: run_child(threads, procs, args) for name, threads in settings.items()
+    }
+    if procs:
+        os.rmdir(os.path.dirname(procs))
+
+    print(
+        f"{'setting':<16}{'threads':>8}{'rows':>6}{'p50 ms':>9}{'p99 ms':>9}{'mean ms':>9}"
+    )
+    for name, by_rows in results.items():
+        for rows, result in by_rows.items():
+            print(
+                f"{name:<16}{settings[name]:>8}{rows:>6}{result['p50_ms']:>9.2f}"
+                f"{result['p99_ms']:>9.2f}{result['mean_ms']:>9.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
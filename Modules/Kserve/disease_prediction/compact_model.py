@@ -0,0 +1,308 @@
+"""Export the forest in a compact form: float32 thresholds and pruned trees.
+
+    python compact_model.py [model_bundle] [--prune class] [--data DIR] [--check-rows 20000]
+
+Writes compact/*.npy into a model bundle, next to sklearn/ and compiled/, after
+checking that it predicts the same risk as sklearn on a holdout set. The
+holdout is the first rows of a synthetic_data.py dataset (--data), or random
+readings. The command then reports the artifact size, load time and resident
+memory of each backend. Serve it with MODEL_BACKEND=compact.
+disease_prediction.py runs the same check on random readings and its test
+split, and fails rather than ship an export that changes a prediction.
+
+Compared with the compiled arrays, a node takes 11 bytes instead of 44:
+
+- thresholds are float32, rounded down, so `x <= threshold` gives the same
+  answer for the float32 features sklearn compares;
+- the right child always follows the left one, so one child array is enough;
+- features are uint8, and leaves index a table of distinct probabilities;
+- the training-only node fields (impurity, sample counts) are not kept.
+
+Pruning collapses a subtree into one leaf when all of its leaves have the same
+probabilities ("exact"), or predict the same class ("class", the subtree's own
+class distribution becomes the leaf). "exact" never changes a prediction.
+"class" never changes a tree's vote, but can move the forest's averaged
+probabilities; when that changes a holdout prediction, the export falls back
+to "exact".
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from compiled_model import CompiledModel, node_proba, random_readings
+
+PRUNE_MODES = ("class", "exact", "none")
+
+
+def float32_below(threshold):
+    """The largest float32 at or below each threshold.
+
+    For a float32 x, `x <= float32_below(t)` exactly when `x <= t`.
+    """
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def collapsible_nodes(estimator, prune):
+    """Nodes whose subtree can become a single leaf, and that leaf's key.
+
+    Two collapsible subtrees with equal keys can be merged into one.
+    """
+    tree = estimator.tree_
+    left, right = tree.children_left, tree.children_right
+    proba = node_proba(estimator)
+    collapsible = left == -1
+    if prune == "class":
+        key = proba.argmax(axis=1)
+    elif prune == "exact":
+        key = np.unique(proba, axis=0, return_inverse=True)[1].ravel()
+    else:
+        key = np.arange(tree.node_count)
+
+    # Children sit one level below their parent, so go bottom-up by level
+    levels = [np.array([0])]
+    while True:
+        inner = levels[-1][left[levels[-1]] != -1]
+        if not inner.size:
+            break
+        levels.append(np.column_stack([left[inner], right[inner]]).ravel())
+    for level in reversed(levels):
+        inner = level[left[level] != -1]
+        same = (
+            collapsible[left[inner]]
+            & collapsible[right[inner]]
+            & (key[left[inner]] == key[right[inner]])
+        )
+        collapsible[inner] = same
+        key[inner] = np.where(same, key[left[inner]], key[inner])
+    return collapsible, key, proba
+
+
+def compact_tree(estimator, prune):
+    """One tree in breadth-first order, the right child right after the left.
+
+    Returns (child, feature, threshold, is_leaf, leaf rows, depth), with child
+    indices relative to the tree's root.
+    """
+    tree = estimator.tree_
+    left, right = tree.children_left, tree.children_right
+    collapsible, key, proba = collapsible_nodes(estimator, prune)
+    if prune == "exact":
+        # Equal keys mean bitwise equal leaf rows; an inner node's own row is
+        # only an average of them, with its own rounding
+        leaf_rows = np.unique(proba, axis=0)
+    nodes, child, is_leaf = [], [], []
+    level = np.array([0])
+    start = 0
+    while level.size:
+        leaf = collapsible[level]
+        n_inner = np.count_nonzero(~leaf)
+        next_start = start + level.size
+        ids = np.arange(start, next_start)
+        children = np.empty(level.size, dtype=np.int64)
+        # Leaves point at themselves; the i-th inner node's children are at
+        # next_start + 2 i and the slot after it
+        children[leaf] = ids[leaf]
+        children[~leaf] = next_start + 2 * np.arange(n_inner)
+        nodes.append(level)
+        child.append(children)
+        is_leaf.append(leaf)
+        inner = level[~leaf]
+        level = np.column_stack([left[inner], right[inner]]).ravel()
+        start = next_start
+    depth = len(nodes) - 1
+    nodes, child, is_leaf = (np.concatenate(a) for a in (nodes, child, is_leaf))
+    if prune == "exact":
+        rows = leaf_rows[key[nodes[is_leaf]]]
+    else:
+        rows = proba[nodes[is_leaf]]
+    return (
+        child,
+        np.where(is_leaf, 0, tree.feature[nodes]),
+        np.where(is_leaf, np.inf, tree.threshold[nodes]),
+        is_leaf,
+        rows,
+        depth,
+    )
+
+
+def compact_artifacts(
+    model, scaler, crop_label_encoder, risk_label_encoder, prune="class"
+):
+    """Like compile_artifacts, in the compact layout described above."""
+    if prune not in PRUNE_MODES:
+        raise ValueError(f"unknown prune mode {prune!r}")
+    n_features = model.n_features_in_
+    child, feature, threshold, is_leaf, rows, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = compact_tree(estimator, prune)
+        child.append(tree[0] + offset)
+        feature.append(tree[1])
+        threshold.append(tree[2])
+        is_leaf.append(tree[3])
+        rows.append(tree[4])
+        roots.append(offset)
+        offset += tree[0].size
+        max_depth = max(max_depth, tree[5])
+
+    is_leaf = np.concatenate(is_leaf)
+    values, leaf_index = np.unique(np.concatenate(rows), axis=0, return_inverse=True)
+    value_index = np.zeros(offset, dtype=np.min_scalar_type(len(values) - 1))
+    value_index[is_leaf] = leaf_index.ravel()
+
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+
+    return {
+        "crop_classes": np.asarray(crop_label_encoder.classes_, dtype=str),
+        "risk_classes": np.asarray(
+            risk_label_encoder.classes_[model.classes_], dtype=str
+        ),
+        "mean": np.asarray(mean, dtype=np.float64),
+        "scale": np.asarray(scale, dtype=np.float64),
+        "child": np.concatenate(child).astype(np.int32),
+        "feature": np.concatenate(feature).astype(np.min_scalar_type(n_features - 1)),
+        # Leaves get +inf, so `x > threshold` keeps them where they are
+        "threshold": float32_below(np.concatenate(threshold)),
+        "value_index": value_index,
+        "values": values,
+        "roots": np.asarray(roots, dtype=np.int32),
+        "max_depth": np.asarray(max_depth),
+    }
+
+
+class CompactModel(CompiledModel):
+    """CompiledModel over the arrays of compact_artifacts."""
+
+    def load_trees(self, arrays):
+        self.child = arrays["child"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.value_index = arrays["value_index"]
+        self.values = arrays["values"]
+
+    def leaf_proba(self, features):
+        node = np.broadcast_to(self.roots, (features.shape[0], self.roots.size))
+        for _ in range(self.max_depth):
+            x = np.take_along_axis(features, self.feature[node], axis=1)
+            node = self.child[node] + (x > self.threshold[node])
+        return self.values[self.value_index[node]]
+
+
+def choose_prune(
+    model,
+    scaler,
+    crop_label_encoder,
+    risk_label_encoder,
+    crop_names,
+    numeric,
+    prune="class",
+):
+    """Compact arrays pruned as much as `prune` allows without changing a
+    prediction on the holdout readings.
+
+    Returns (prune mode used, arrays, mismatches of every mode tried).
+    """
+    from predictors import SklearnModel
+
+    reference = SklearnModel(model, scaler, crop_label_encoder, risk_label_encoder)
+    expected = reference.predict(crop_names, numeric)
+    tried = {}
+    for mode in PRUNE_MODES[PRUNE_MODES.index(prune) :]:
+        arrays = compact_artifacts(
+            model, scaler, crop_label_encoder, risk_label_encoder, mode
+        )
+        predicted = CompactModel(arrays).predict(crop_names, numeric)
+        tried[mode] = int(np.sum(predicted != expected))
+        if not tried[mode]:
+            break
+    return mode, arrays, tried
+
+
+def holdout_readings(directory, n_rows):
+    """Crop names and numeric features of the first n_rows of a dataset."""
+    from synthetic_data import NUMERIC_FEATURES, read_frame
+
+    frame = read_frame(directory, n_rows)
+    return frame["crop_name"].astype(str).tolist(), frame[NUMERIC_FEATURES].to_numpy()
+
+
+def directory_bytes(directory):
+    return sum(
+        os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("bundle", nargs="?", default="model_bundle")
+    parser.add_argument("--prune", choices=PRUNE_MODES, default="class")
+    parser.add_argument("--data", help="synthetic_data.py dataset to check against")
+    parser.add_argument("--check-rows", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    from model_bundle import add_arrays, benchmark, load_bundle
+
+    reference = load_bundle(args.bundle, "sklearn")
+    if args.data:
+        crop_names, numeric = holdout_readings(args.data, args.check_rows)
+    else:
+        crop_names, numeric = random_readings(
+            reference.crop_label_encoder.classes_,
+            reference.scaler.mean_,
+            reference.scaler.scale_,
+            args.check_rows,
+        )
+    prune, arrays, tried = choose_prune(
+        reference.model,
+        reference.scaler,
+        reference.crop_label_encoder,
+        reference.risk_label_encoder,
+        crop_names,
+        numeric,
+        args.prune,
+    )
+    for mode, mismatches in tried.items():
+        print(
+            f"Checked {len(crop_names)} holdout readings: {mismatches} {mode} mismatches"
+        )
+    if tried[prune]:
+        print("Not written")
+        return 1
+    nodes = sum(tree.tree_.node_count for tree in reference.model.estimators_)
+    print(
+        f"Pruned ({prune}) {nodes} nodes to {arrays['child'].size}, "
+        f"{len(arrays['values'])} distinct leaf values, "
+        f"max depth {int(arrays['max_depth'])}"
+    )
+
+    manifest = add_arrays(args.bundle, "compact", arrays)
+    print(f"Wrote {args.bundle}/compact, bundle version {manifest['version']}")
+
+    sizes = {
+        "sklearn": os.path.getsize(
+            os.path.join(args.bundle, "sklearn", "model.joblib")
+        ),
+        "compiled": directory_bytes(os.path.join(args.bundle, "compiled")),
+        "compact": directory_bytes(os.path.join(args.bundle, "compact")),
+    }
+    layouts = [(backend, backend, args.bundle) for backend in sizes]
+    print(f"{'backend':<10}{'size KiB':>10}{'startup ms':>12}{'RSS MiB':>10}")
+    for result in benchmark(layouts, args.repeats):
+        print(
+            f"{result['layout']:<10}{sizes[result['layout']] / 1024:>10.0f}"
+            f"{result['startup_seconds'] * 1000:>12.1f}{result['rss_mib']:>10.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
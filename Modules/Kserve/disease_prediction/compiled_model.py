@@ -0,0 +1,193 @@
+"""Compile the sklearn artifacts into a pure-NumPy predictor.
+
+`python compiled_model.py` loads model.joblib, scaler.joblib and the two label
+encoders from --directory, flattens them into plain arrays, saves them to compiled_model.npz
+and checks that the compiled predictor agrees with sklearn on random inputs.
+Serving from the .npz only needs NumPy; sklearn is not imported.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from metrics import record_model_stages
+
+# Rows scored per traversal pass; bounds the (rows x trees) working arrays
+CHUNK_SIZE = 4096
+
+
+def node_proba(estimator):
+    """Class probabilities of every node, as DecisionTreeClassifier.predict_proba
+    normalises them."""
+    proba = estimator.tree_.value[:, 0, : estimator.n_classes_].astype(np.float64)
+    normalizer = proba.sum(axis=1)[:, np.newaxis]
+    normalizer[normalizer == 0.0] = 1.0
+    return proba / normalizer
+
+
+def compile_artifacts(model, scaler, crop_label_encoder, risk_label_encoder):
+    """Flatten a fitted RandomForestClassifier pipeline into a dict of arrays."""
+    n_features = model.n_features_in_
+
+    left, right, feature, threshold, value, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        node_ids = np.arange(tree.node_count)
+        # Leaves point at themselves so a fixed number of steps is harmless
+        left.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        right.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+        value.append(node_proba(estimator))
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+
+    return {
+        "crop_classes": np.asarray(crop_label_encoder.classes_, dtype=str),
+        "risk_classes": np.asarray(
+            risk_label_encoder.classes_[model.classes_], dtype=str
+        ),
+        "mean": np.asarray(mean, dtype=np.float64),
+        "scale": np.asarray(scale, dtype=np.float64),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "value": np.concatenate(value),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "max_depth": np.asarray(max_depth),
+    }
+
+
+class CompiledModel:
+    """Array-backed equivalent of the encoders + scaler + forest pipeline."""
+
+    def __init__(self, arrays):
+        self.crop_index = {
+            crop: index for index, crop in enumerate(arrays["crop_classes"].tolist())
+        }
+        self.known_crops = set(self.crop_index)
+        self.risk_classes = arrays["risk_classes"]
+        self.mean = arrays["mean"]
+        self.scale = arrays["scale"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(arrays["max_depth"])
+        self.load_trees(arrays)
+
+    def load_trees(self, arrays):
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.value = arrays["value"]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def encode_crops(self, crop_names):
+        try:
+            return np.array([self.crop_index[crop] for crop in crop_names])
+        except KeyError as e:
+            raise ValueError(f"unknown crop_name {e.args[0]!r}") from None
+
+    def leaf_proba(self, features):
+        """(rows, trees, classes) probabilities of the leaf each row reaches."""
+        # Trees compare float32 features against float64 thresholds, like sklearn
+        node = np.broadcast_to(self.roots, (features.shape[0], self.roots.size))
+        for _ in range(self.max_depth):
+            x = np.take_along_axis(features, self.feature[node], axis=1)
+            node = np.where(
+                x <= self.threshold[node], self.left[node], self.right[node]
+            )
+        return self.value[node]
+
+    def predict_proba_scaled(self, features):
+        features = np.asarray(features, dtype=np.float32)
+        leaf_proba = self.leaf_proba(features)
+        # Sum tree by tree, in order, so rounding matches the sklearn forest
+        proba = np.zeros((features.shape[0], self.risk_classes.size))
+        for tree in range(self.roots.size):
+            proba += leaf_proba[:, tree]
+        proba /= self.roots.size
+        return proba
+
+    def predict(self, crop_names, numeric):
+        """Return the risk label for each (crop name, numeric features) row."""
+        start = time.perf_counter()
+        crops = self.encode_crops(crop_names)
+        encoded = time.perf_counter()
+        raw = np.column_stack([crops, numeric]).astype(np.float64)
+        features = (raw - self.mean) / self.scale
+        scaled = time.perf_counter()
+        codes = [
+            np.argmax(self.predict_proba_scaled(features[i : i + CHUNK_SIZE]), axis=1)
+            for i in range(0, features.shape[0], CHUNK_SIZE)
+        ]
+        scored = time.perf_counter()
+        codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.intp)
+        risks = self.risk_classes[codes]
+        record_model_stages(start, encoded, scaled, scored, time.perf_counter())
+        return risks
+
+
+def random_readings(crop_classes, mean, scale, n_rows, seed=0):
+    """Random readings spread over +-4 standard deviations of the training data."""
+    rng = np.random.default_rng(seed)
+    crop_names = rng.choice(crop_classes, size=n_rows)
+    numeric = rng.uniform(
+        mean[1:] - 4 * scale[1:], mean[1:] + 4 * scale[1:], size=(n_rows, mean.size - 1)
+    )
+    return crop_names.tolist(), numeric
+
+
+def count_mismatches(compiled, reference, crop_names, numeric):
+    expected = reference.predict(crop_names, numeric)
+    return int(np.sum(compiled.predict(crop_names, numeric) != expected))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--directory", default=".", help="Directory holding the .joblib artifacts"
+    )
+    parser.add_argument("--output", default="compiled_model.npz")
+    parser.add_argument("--check-rows", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    from predictors import SklearnModel
+
+    reference = SklearnModel.load(args.directory)
+    arrays = compile_artifacts(
+        reference.model,
+        reference.scaler,
+        reference.crop_label_encoder,
+        reference.risk_label_encoder,
+    )
+    np.savez(args.output, **arrays)
+    print(
+        f"Compiled {arrays['roots'].size} trees ({arrays['left'].size} nodes, "
+        f"max depth {int(arrays['max_depth'])}) to {args.output}"
+    )
+
+    compiled = CompiledModel.load(args.output)
+    crop_names, numeric = random_readings(
+        arrays["crop_classes"], arrays["mean"], arrays["scale"], args.check_rows
+    )
+    mismatches = count_mismatches(compiled, reference, crop_names, numeric)
+    print(f"Checked {args.check_rows} random readings: {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,15 @@
+import argparse
+import json
+import logging
+import sys
+
+from runtime import configure_threads, log_runtime_config, training_n_jobs
+
+# Size the BLAS/OpenMP/joblib pools to the container's CPU quota before
+# NumPy and scikit-learn load them
+configure_threads()
+
+import numpy as np
 import pandas as pd
 from joblib import dump
 from sklearn.ensemble import RandomForestClassifier
@@ -5,6 +17,67 @@ from sklearn.metrics import accuracy_score, classification_report
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 
+import compact_model
+import model_search
+import out_of_core
+from model_bundle import write_bundle
+from synthetic_data import read_frame
+
+parser = argparse.ArgumentParser(description="Train the disease risk model")
+parser.add_argument(
+    "--data",
+    help="dataset written by synthetic_data.py, instead of the 12 rows below",
+)
+parser.add_argument("--max-rows", type=int, help="read only the first rows of --data")
+parser.add_argument(
+    "--out-of-core",
+    action="store_true",
+    help="stream --data one shard at a time; bounds the rows in memory to one "
+    "shard, but the forest still grows with every tree (see out_of_core.py)",
+)
+parser.add_argument(
+    "--min-samples-leaf",
+    type=int,
+    default=1,
+    help="smallest leaf of a tree; raise it to keep models from large data small",
+)
+parser.add_argument(
+    "--search",
+    action="store_true",
+    help="pick the forest by accuracy and latency (see model_search.py)",
+)
+parser.add_argument(
+    "--search-candidates",
+    type=int,
+    default=12,
+    help="configurations sampled from the grid; 0 for the whole grid",
+)
+parser.add_argument("--search-grid", help="JSON file replacing DEFAULT_GRID")
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=0.01,
+    help="CV accuracy a faster model may lose against the best one",
+)
+parser.add_argument(
+    "--select-by",
+    choices=model_search.LATENCIES,
+    default="compiled_single_us",
+    help="latency that picks among the accurate enough candidates",
+)
+parser.add_argument("--search-report", default="search_report.json")
+parser.add_argument(
+    "--prune",
+    choices=compact_model.PRUNE_MODES,
+    default="class",
+    help="how far to prune the compact export (see compact_model.py)",
+)
+args = parser.parse_args()
+if args.out_of_core and not args.data:
+    parser.error("--out-of-core needs --data")
+if args.out_of_core and args.search:
+    parser.error("--search needs the data in memory")
+
 # Create a synthetic dataset
 data = {
     "crop_name": [
@@ -40,40 +113,124 @@ data = {
     ],
 }
 
-df = pd.DataFrame(data)
+# One tree-building job per CPU of quota, not per node CPU
+n_jobs = training_n_jobs()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+log_runtime_config(n_jobs=n_jobs)
 
-# Encode categorical variable for crop_name
-crop_label_encoder = LabelEncoder()
-df["crop_name"] = crop_label_encoder.fit_transform(df["crop_name"])
-# Encode target variable
-risk_label_encoder = LabelEncoder()
-df["disease_risk"] = risk_label_encoder.fit_transform(df["disease_risk"])
+if args.out_of_core:
+    # Same artifacts, with only one shard of --data in memory at a time
+    (
+        model,
+        scaler,
+        crop_label_encoder,
+        risk_label_encoder,
+        y_test,
+        y_pred,
+    ) = out_of_core.train(
+        args.data,
+        max_rows=args.max_rows,
+        n_jobs=n_jobs,
+        min_samples_leaf=args.min_samples_leaf,
+    )
+else:
+    if args.data:
+        df = read_frame(args.data, args.max_rows)
+    else:
+        df = pd.DataFrame(data)
 
-# Features and target variable
-X = df[["crop_name", "temperature", "humidity", "soil_moisture"]]
-y = df["disease_risk"]
+    # Encode categorical variable for crop_name
+    crop_label_encoder = LabelEncoder()
+    df["crop_name"] = crop_label_encoder.fit_transform(df["crop_name"])
+    # Encode target variable
+    risk_label_encoder = LabelEncoder()
+    df["disease_risk"] = risk_label_encoder.fit_transform(df["disease_risk"])
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
-scaler = StandardScaler()
-X_train = scaler.fit_transform(X_train)
-X_test = scaler.transform(X_test)
+    # Features and target variable
+    X = df[["crop_name", "temperature", "humidity", "soil_moisture"]]
+    y = df["disease_risk"]
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X_train)
+    X_test = scaler.transform(X_test)
 
-# Initialize the model
-model = RandomForestClassifier(n_estimators=100, random_state=42)
+    if args.search:
+        grid = None
+        if args.search_grid:
+            with open(args.search_grid) as f:
+                grid = json.load(f)
+        # Candidates are fit in parallel, one process per CPU of quota
+        model, report = model_search.search(
+            X_train,
+            y_train,
+            scaler,
+            crop_label_encoder,
+            risk_label_encoder,
+            grid=grid,
+            n_candidates=args.search_candidates,
+            tolerance=args.tolerance,
+            select_by=args.select_by,
+            workers=n_jobs,
+        )
+        model.n_jobs = n_jobs
+        model_search.write_report(report, args.search_report)
+        print(model_search.format_report(report))
+    else:
+        # Initialize the model
+        model = RandomForestClassifier(
+            n_estimators=100,
+            random_state=42,
+            n_jobs=n_jobs,
+            min_samples_leaf=args.min_samples_leaf,
+        )
 
-# Train the model
-model.fit(X_train, y_train)
+        # Train the model
+        model.fit(X_train, y_train)
+
+    # Predict on the test set
+    y_pred = model.predict(X_test)
 
 dump(model, "model.joblib")
 dump(scaler, "scaler.joblib")
 dump(crop_label_encoder, "crop_label_encoder.joblib")
 dump(risk_label_encoder, "risk_label_encoder.joblib")
 
+# The compact export must predict like the model on the held-out rows and on
+# random readings across the feature ranges, which reach many more leaves; the
+# out-of-core test rows are not kept in memory, so they only get the latter
+crop_names, numeric = compact_model.random_readings(
+    crop_label_encoder.classes_, scaler.mean_, scaler.scale_, 20000
+)
+if not args.out_of_core:
+    raw = scaler.inverse_transform(X_test)
+    crop_names += list(
+        crop_label_encoder.inverse_transform(raw[:, 0].round().astype(int))
+    )
+    numeric = np.concatenate([numeric, raw[:, 1:]])
+prune, compact, tried = compact_model.choose_prune(
+    model,
+    scaler,
+    crop_label_encoder,
+    risk_label_encoder,
+    crop_names,
+    numeric,
+    args.prune,
+)
+print(
+    f"Compact export pruned {prune!r}; mismatches on {len(crop_names)} readings "
+    f"per mode: {tried}"
+)
+if tried[prune]:
+    sys.exit("The compact export changes predictions in every prune mode; not written")
 
-# Predict on the test set
-y_pred = model.predict(X_test)
+# Versioned bundle with the same artifacts, compiled arrays and a manifest
+manifest = write_bundle(
+    "model_bundle", model, scaler, crop_label_encoder, risk_label_encoder, compact
+)
+print(f"Model bundle version: {manifest['version']}")
 
 # Calculate accuracy
 accuracy = accuracy_score(y_test, y_pred)
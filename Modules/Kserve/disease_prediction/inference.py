@@ -1,6 +1,51 @@
-from flask import Flask, jsonify, request
+import functools
+import hmac
+import math
+import os
+import time
+
+from runtime import configure_threads, log_runtime_config
+
+# Size the BLAS/OpenMP pools to the container's CPU quota before NumPy loads
+configure_threads()
+
+import numpy as np
+from flask import Flask, Response, g, jsonify, request
 from flask_restx import Api, Resource, fields
-from joblib import load
+
+from admission import AdmissionController, Overloaded
+from batching import BATCH_SIZE_BUCKETS, MicroBatcher
+from json_codec import (
+    FEATURES,
+    CodecError,
+    decode_batch,
+    decode_reading,
+    encode_batch,
+    encode_reading,
+    to_float,
+)
+from metrics import (
+    admission_wait_seconds,
+    header_lines,
+    histogram_samples,
+    register_collector,
+    render,
+    request_seconds,
+    requests_total,
+    sample_lines,
+    stage_seconds,
+)
+from model_store import ModelStore
+from open_inference import (
+    HEADER_LENGTH,
+    ProtocolError,
+    decode_request,
+    encode_message,
+    wants_binary,
+)
+from prediction_cache import CachedPredictor, LRUCache
+from predictors import load_predictor
+from risk_grid import GridPredictor, RiskGrid
 
 app = Flask(__name__)
 api = Api(
@@ -23,51 +68,707 @@ prediction_model = api.model(
     },
 )
 
-# Load the model and encoders
-model = load("model.joblib")
-crop_label_encoder = load("crop_label_encoder.joblib")
-risk_label_encoder = load("risk_label_encoder.joblib")
-scaler = load("scaler.joblib")
+# A batch is either a list of records under "instances" or one list per feature
+batch_prediction_model = api.model(
+    "BatchPrediction",
+    {
+        "instances": fields.List(
+            fields.Nested(prediction_model),
+            description="List of records, one per reading",
+        ),
+        "crop_name": fields.List(
+            fields.String, description="Columnar payload: crop names"
+        ),
+        "temperature": fields.List(
+            fields.Float, description="Columnar payload: temperatures"
+        ),
+        "humidity": fields.List(
+            fields.Float, description="Columnar payload: humidities"
+        ),
+        "soil_moisture": fields.List(
+            fields.Float, description="Columnar payload: soil moistures"
+        ),
+    },
+)
+
+# Optional in-process cache of repeated readings, off when the size is 0.
+# It is shared by every model version loaded over the life of the process.
+prediction_cache = None
+if int(os.environ.get("PREDICTION_CACHE_SIZE", "0")) > 0:
+    ttl = os.environ.get("PREDICTION_CACHE_TTL")
+    prediction_cache = LRUCache(
+        max_size=int(os.environ["PREDICTION_CACHE_SIZE"]),
+        ttl=float(ttl) if ttl else None,
+    )
 
 
-def predict_disease_risk(crop_name, temperature, humidity, soil_moisture):
-    try:
-        # Encode the crop name
-        crop_name_encoded = crop_label_encoder.transform([crop_name])[0]
+def build_predictor(directory):
+    """Load the artifacts in `directory` and put the grid and cache in front."""
+    # Either sklearn objects or arrays compiled by compiled_model.py
+    # (MODEL_BACKEND=compiled, or compact from a bundle; no sklearn import);
+    # `directory` is a model bundle (model_bundle.py) or the four .joblib files
+    predictor = load_predictor(
+        os.environ.get("MODEL_BACKEND", "sklearn"),
+        directory,
+        # A bundle whose files do not match its manifest is never served
+        verify=os.environ.get("MODEL_VERIFY_CHECKSUMS", "1") == "1",
+    )
 
-        # Prepare the feature vector
-        features = scaler.transform(
-            [[crop_name_encoded, temperature, humidity, soil_moisture]]
+    # Optionally answer on-grid readings from the table built by risk_grid.py,
+    # as long as it was built from these very artifacts
+    if os.environ.get("RISK_GRID"):
+        grid = RiskGrid.load(os.environ["RISK_GRID"])
+        if grid.model_version == predictor.version:
+            predictor = GridPredictor(grid, predictor)
+        else:
+            app.logger.warning(
+                "Ignoring risk grid built for model %s, serving model %s",
+                grid.model_version,
+                predictor.version,
+            )
+
+    if prediction_cache is not None:
+        round_digits = os.environ.get("PREDICTION_CACHE_ROUND")
+        predictor = CachedPredictor(
+            predictor,
+            prediction_cache,
+            round_digits=int(round_digits) if round_digits else None,
         )
+    return predictor
+
+
+# /admin/reload only loads from this directory or the directories inside it
+MODEL_DIR = os.environ.get("MODEL_DIR", ".")
+
+# The active model; swapped atomically by /admin/reload or the directory watcher
+model_store = ModelStore(
+    build_predictor,
+    MODEL_DIR,
+    # Entries of the old version are dropped only once the new one is live
+    on_swap=(
+        None
+        if prediction_cache is None
+        else lambda predictor: prediction_cache.retain(predictor.version)
+    ),
+)
+if float(os.environ.get("MODEL_WATCH_INTERVAL", "0")) > 0:
+    model_store.watch(float(os.environ["MODEL_WATCH_INTERVAL"]))
 
-        # Predict the disease risk
-        risk_encoded = model.predict(features)[0]
 
-        # Decode the risk
-        risk = risk_label_encoder.inverse_transform([risk_encoded])[0]
+def predict_reading(crop_name, temperature, humidity, soil_moisture, predictor):
+    """Score one reading; returns (risk, None) or (None, error message)."""
+    try:
+        # Encode, scale, predict and decode in one go
+        features = np.array([[temperature, humidity, soil_moisture]], dtype=np.float64)
+        risk = predictor.predict([crop_name], features)[0]
 
-        return risk
+        return str(risk), None
     except Exception as e:
-        return str(e)
+        return None, str(e)
+
+
+def predict_disease_risk(
+    crop_name, temperature, humidity, soil_moisture, predictor=None
+):
+    risk, error = predict_reading(
+        crop_name,
+        temperature,
+        humidity,
+        soil_moisture,
+        predictor or model_store.current(),
+    )
+    return risk if error is None else error
+
+
+def predict_disease_risk_batch(
+    crop_names, temperatures, humidities, soil_moistures, predictor=None
+):
+    """Score many readings at once, returning a (risk, error) pair per row.
+
+    Rows are validated one by one so a bad row only fails itself; the valid
+    rows then go through each model stage in a single vectorized call, all
+    with the same model version.
+    """
+    predictor = predictor or model_store.current()
+    n_rows = len(crop_names)
+    risks = [None] * n_rows
+    errors = [None] * n_rows
+
+    known_crops = predictor.known_crops
+    numeric = np.empty((n_rows, 3), dtype=np.float64)
+    valid = np.zeros(n_rows, dtype=bool)
+    for i in range(n_rows):
+        try:
+            if crop_names[i] is None:
+                raise ValueError("crop_name is required")
+            if crop_names[i] not in known_crops:
+                raise ValueError(f"unknown crop_name {crop_names[i]!r}")
+            numeric[i, 0] = to_float("temperature", temperatures[i])
+            numeric[i, 1] = to_float("humidity", humidities[i])
+            numeric[i, 2] = to_float("soil_moisture", soil_moistures[i])
+            valid[i] = True
+        except (TypeError, ValueError) as e:
+            errors[i] = str(e)
+
+    if valid.any():
+        valid_crops = [crop for crop, ok in zip(crop_names, valid) if ok]
+        valid_risks = predictor.predict(valid_crops, numeric[valid])
+        for i, risk in zip(np.flatnonzero(valid), valid_risks):
+            risks[i] = str(risk)
+
+    return risks, errors
+
+
+def predict_rows(rows):
+    """Score micro-batched (predictor, crop_name, temperature, ...) rows.
+
+    Returns a (risk, error) pair per row, like predict_reading.
+    """
+    # Rows queued across a model swap are scored by the model they started with
+    by_predictor = {}
+    for i, (predictor, *reading) in enumerate(rows):
+        by_predictor.setdefault(predictor, []).append((i, reading))
+
+    results = [None] * len(rows)
+    for predictor, group in by_predictor.items():
+        readings = [reading for _, reading in group]
+        try:
+            risks, errors = predict_disease_risk_batch(
+                *zip(*readings), predictor=predictor
+            )
+        except Exception:
+            # One row made the model call fail; score the rows one by one, so
+            # each gets the answer or error it would get without batching
+            for i, reading in group:
+                results[i] = predict_reading(*reading, predictor)
+            continue
+        for (i, _), risk, error in zip(group, risks, errors):
+            results[i] = (risk, error)
+    return results
+
+
+# Opt-in server-side micro-batching of concurrent single-row requests
+micro_batcher = None
+if os.environ.get("MICRO_BATCHING", "0") == "1":
+    micro_batcher = MicroBatcher(
+        predict_rows,
+        window_ms=float(os.environ.get("MICRO_BATCH_WINDOW_MS", "2")),
+        max_batch_size=int(os.environ.get("MICRO_BATCH_MAX_SIZE", "32")),
+    )
+
+# Opt-in concurrency limit with a bounded queue and per-request deadlines
+admission = None
+if int(os.environ.get("ADMISSION_MAX_CONCURRENCY", "0")) > 0:
+    admission = AdmissionController(
+        int(os.environ["ADMISSION_MAX_CONCURRENCY"]),
+        max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", "16")),
+        clock=time.perf_counter,
+    )
+
+# Time budget of a request, from the client's header or this default, and
+# never more than the maximum
+TIMEOUT_HEADER = "X-Request-Timeout-Ms"
+DEFAULT_TIMEOUT_MS = float(os.environ.get("REQUEST_TIMEOUT_MS", "1000"))
+MAX_TIMEOUT_MS = float(os.environ.get("REQUEST_MAX_TIMEOUT_MS", "30000"))
+
+
+def request_deadline():
+    """The deadline of this request; raises ValueError on a bad header."""
+    value = request.headers.get(TIMEOUT_HEADER)
+    if value is None:
+        timeout_ms = DEFAULT_TIMEOUT_MS
+    else:
+        try:
+            timeout_ms = float(value)
+        except ValueError:
+            timeout_ms = math.nan
+        if not math.isfinite(timeout_ms) or timeout_ms <= 0:
+            raise ValueError(f"invalid {TIMEOUT_HEADER}: {value!r}")
+    return g.start + min(timeout_ms, MAX_TIMEOUT_MS) / 1000.0
+
+
+def admitted(error_key="message"):
+    """Run the decorated handler only once `admission` lets it in."""
+
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            if admission is None:
+                return handler(*args, **kwargs)
+            try:
+                deadline = request_deadline()
+            except ValueError as e:
+                return {error_key: str(e)}, 400
+            try:
+                started = admission.acquire(deadline)
+            except Overloaded as e:
+                g.outcome = "shed"
+                return (
+                    {error_key: f"overloaded: {e.reason}"},
+                    e.status,
+                    {"Retry-After": str(e.retry_after)},
+                )
+            admission_wait_seconds.observe(started - g.start)
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                admission.release(started)
+
+        return wrapper
+
+    return decorate
 
 
 @ns.route("/")
 class Predict(Resource):
     @ns.expect(prediction_model)
+    @admitted()
+    def post(self):
+        start = time.perf_counter()
+        try:
+            reading = decode_reading(request.get_data())
+        except CodecError as e:
+            ns.abort(400, str(e))
+        parsed = time.perf_counter()
+
+        # The model this request runs on, even if a reload happens meanwhile
+        predictor = model_store.current()
+        if micro_batcher is not None:
+            risk, error = micro_batcher.predict((predictor, *reading))
+        else:
+            risk, error = predict_reading(*reading, predictor)
+        predicted = time.perf_counter()
+
+        # An error comes back in place of the risk
+        response = Response(
+            encode_reading(risk, error),
+            mimetype="application/json",
+        )
+        response.headers["X-Model-Version"] = predictor.version
+        g.model_version = predictor.version
+        g.outcome = "ok" if error is None else "error"
+
+        stage_seconds.observe(parsed - start, "parse")
+        stage_seconds.observe(predicted - parsed, "predict")
+        stage_seconds.observe(time.perf_counter() - predicted, "serialize")
+        return response
+
+
+@ns.route("/batch")
+class PredictBatch(Resource):
+    @ns.expect(batch_prediction_model)
+    @admitted()
+    def post(self):
+        try:
+            columns = decode_batch(request.get_data())
+        except CodecError as e:
+            ns.abort(400, str(e))
+
+        predictor = model_store.current()
+        risks, errors = predict_disease_risk_batch(
+            columns["crop_name"],
+            columns["temperature"],
+            columns["humidity"],
+            columns["soil_moisture"],
+            predictor,
+        )
+
+        body, n_errors = encode_batch(risks, errors)
+        response = Response(body, mimetype="application/json")
+        response.headers["X-Model-Version"] = predictor.version
+        g.model_version = predictor.version
+        g.outcome = "ok" if n_errors == 0 else "error"
+        return response
+
+
+@ns.route("/batching")
+class Batching(Resource):
+    def get(self):
+        if micro_batcher is None:
+            return jsonify({"enabled": False})
+        return jsonify({"enabled": True, **micro_batcher.stats()})
+
+
+@ns.route("/admission")
+class Admission(Resource):
+    def get(self):
+        if admission is None:
+            return jsonify({"enabled": False})
+        return jsonify({"enabled": True, **admission.stats()})
+
+
+@ns.route("/cache")
+class Cache(Resource):
+    def get(self):
+        if prediction_cache is None:
+            return jsonify({"enabled": False})
+        return jsonify({"enabled": True, **prediction_cache.stats()})
+
+
+admin_ns = api.namespace("admin", description="Model management")
+
+reload_model = api.model(
+    "Reload",
+    {
+        "model_dir": fields.String(
+            description="Directory inside MODEL_DIR to load; defaults to the "
+            "current one"
+        ),
+    },
+)
+
+
+# serve.py sets this in pre-fork workers, so that a reload reaches all of them
+reload_broadcast = None
+
+
+def check_admin_token():
+    token = os.environ.get("ADMIN_TOKEN")
+    if not token:
+        admin_ns.abort(403, "admin routes are disabled; set ADMIN_TOKEN")
+    given = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(given.encode(), token.encode()):
+        admin_ns.abort(403, "invalid admin token")
+
+
+def resolve_model_dir(model_dir):
+    """The real path of `model_dir`, which has to be inside MODEL_DIR.
+
+    Loading unpickles the files in the directory, so it must not come from
+    anywhere a client can name. A relative path is taken from MODEL_DIR.
+    """
+    if model_dir is None:
+        return None
+    if not isinstance(model_dir, str):
+        admin_ns.abort(400, "model_dir must be a string")
+    root = os.path.realpath(MODEL_DIR)
+    path = os.path.realpath(os.path.join(root, model_dir))
+    if os.path.commonpath([root, path]) != root:
+        admin_ns.abort(400, "model_dir must be inside MODEL_DIR")
+    return path
+
+
+@admin_ns.route("/model")
+class Model(Resource):
+    def get(self):
+        return jsonify(model_store.status())
+
+
+@admin_ns.route("/reload")
+class Reload(Resource):
+    @admin_ns.expect(reload_model)
     def post(self):
-        data = request.json
-        crop_name = data["crop_name"]
-        temperature = data["temperature"]
-        humidity = data["humidity"]
-        soil_moisture = data["soil_moisture"]
+        check_admin_token()
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            admin_ns.abort(400, "expected a JSON object")
+        model_dir = resolve_model_dir(data.get("model_dir"))
+        # Load and canary-check in the background; requests keep using the
+        # current model until the new one is swapped in
+        (reload_broadcast or model_store.reload_in_background)(model_dir)
+        return {"status": "reloading", **model_store.status()}, 202
+
+
+# KServe v2 / Open Inference Protocol, including the binary tensor extension
+v2_ns = api.namespace("v2", description="KServe v2 / Open Inference Protocol")
+
+MODEL_NAME = os.environ.get("MODEL_NAME", "disease-prediction")
+
+# Swagger documents the JSON form; binary requests put raw tensor bytes after it
+inference_tensor = api.model(
+    "InferenceTensor",
+    {
+        "name": fields.String(required=True, description="One of the feature names"),
+        "shape": fields.List(fields.Integer, required=True, description="e.g. [n]"),
+        "datatype": fields.String(
+            required=True, description="BYTES for crop_name, FP32/FP64 otherwise"
+        ),
+        "parameters": fields.Raw(description='e.g. {"binary_data_size": 8192}'),
+        "data": fields.List(fields.Raw, description="Values, unless sent as binary"),
+    },
+)
+
+inference_request = api.model(
+    "InferenceRequest",
+    {
+        "id": fields.String(description="Echoed back in the response"),
+        "parameters": fields.Raw(description='e.g. {"binary_data_output": true}'),
+        "inputs": fields.List(fields.Nested(inference_tensor), required=True),
+        "outputs": fields.List(fields.Raw, description="Requested outputs"),
+    },
+)
+
+
+def v2_error(message, status):
+    return {"error": message}, status
+
+
+def check_model(model_name, model_version=None):
+    predictor = model_store.current()
+    if model_name != MODEL_NAME:
+        raise LookupError(f"unknown model {model_name!r}")
+    if model_version is not None and model_version != predictor.version:
+        raise LookupError(f"model version {model_version!r} is not loaded")
+    return predictor
+
+
+def predict_tensors(tensors, predictor):
+    """Score decoded input tensors; a bad tensor or value fails the request."""
+    missing = [feature for feature in FEATURES if feature not in tensors]
+    if missing:
+        raise ProtocolError(f"missing inputs: {', '.join(missing)}")
+    crop_names = tensors["crop_name"]
+    if isinstance(crop_names, np.ndarray):
+        raise ProtocolError("crop_name must be a BYTES tensor")
+
+    columns = []
+    for feature in FEATURES[1:]:
+        column = tensors[feature]
+        if isinstance(column, list) or column.dtype.kind not in "iuf":
+            raise ProtocolError(f"{feature} must be a numeric tensor")
+        if column.size != len(crop_names):
+            raise ProtocolError(
+                f"{feature} has {column.size} values for {len(crop_names)} crops"
+            )
+        columns.append(column.reshape(-1))
+    # One vectorized conversion per column, no per-value Python objects
+    numeric = np.column_stack(columns).astype(np.float64, copy=False)
+
+    bad = np.flatnonzero(~np.isfinite(numeric).all(axis=1))
+    if bad.size:
+        raise ProtocolError(f"non-finite reading in row {bad[0]}")
+    unknown = set(crop_names) - predictor.known_crops
+    if unknown:
+        raise ProtocolError(f"unknown crop_name {sorted(unknown)[0]!r}")
+    return [str(risk) for risk in predictor.predict(crop_names, numeric)]
+
+
+@v2_ns.route("")
+class ServerMetadata(Resource):
+    def get(self):
+        return {
+            "name": "disease-prediction",
+            "version": api.version,
+            "extensions": ["binary_tensor_data"],
+        }
+
+
+@v2_ns.route("/health/live")
+class Live(Resource):
+    def get(self):
+        return {"live": True}
+
+
+@v2_ns.route("/health/ready")
+class Ready(Resource):
+    def get(self):
+        return {"ready": model_store.current() is not None}
+
+
+@v2_ns.route("/models/<string:model_name>")
+@v2_ns.route("/models/<string:model_name>/versions/<string:model_version>")
+class ModelMetadata(Resource):
+    def get(self, model_name, model_version=None):
+        try:
+            predictor = check_model(model_name, model_version)
+        except LookupError as e:
+            return v2_error(str(e), 404)
+        inputs = [{"name": "crop_name", "datatype": "BYTES", "shape": [-1]}] + [
+            {"name": feature, "datatype": "FP64", "shape": [-1]}
+            for feature in FEATURES[1:]
+        ]
+        return {
+            "name": MODEL_NAME,
+            "versions": [predictor.version],
+            "platform": os.environ.get("MODEL_BACKEND", "sklearn"),
+            "inputs": inputs,
+            "outputs": [{"name": "disease_risk", "datatype": "BYTES", "shape": [-1]}],
+        }
+
+
+@v2_ns.route("/models/<string:model_name>/ready")
+@v2_ns.route("/models/<string:model_name>/versions/<string:model_version>/ready")
+class ModelReady(Resource):
+    def get(self, model_name, model_version=None):
+        try:
+            check_model(model_name, model_version)
+        except LookupError as e:
+            return v2_error(str(e), 404)
+        return {"name": MODEL_NAME, "ready": True}
+
+
+@v2_ns.route("/models/<string:model_name>/infer")
+@v2_ns.route("/models/<string:model_name>/versions/<string:model_version>/infer")
+class Infer(Resource):
+    @v2_ns.expect(inference_request)
+    @admitted(error_key="error")
+    def post(self, model_name, model_version=None):
+        try:
+            predictor = check_model(model_name, model_version)
+        except LookupError as e:
+            return v2_error(str(e), 404)
+
+        try:
+            header_length = request.headers.get(HEADER_LENGTH)
+            header_length = int(header_length) if header_length else None
+        except ValueError:
+            return v2_error(f"invalid {HEADER_LENGTH}: {header_length!r}", 400)
+        try:
+            header, tensors = decode_request(
+                request.get_data(cache=False), header_length
+            )
+            binary = wants_binary(header, "disease_risk")
+            risks = predict_tensors(tensors, predictor)
+        except ProtocolError as e:
+            return v2_error(str(e), 400)
+
+        response_header = {"model_name": MODEL_NAME, "model_version": predictor.version}
+        if "id" in header:
+            response_header["id"] = header["id"]
+        body, length = encode_message(
+            response_header,
+            [("disease_risk", "BYTES", risks)],
+            "outputs",
+            binary_names={"disease_risk"} if binary else (),
+        )
+        response = Response(
+            body, mimetype="application/octet-stream" if binary else "application/json"
+        )
+        if length is not None:
+            response.headers[HEADER_LENGTH] = str(length)
+        response.headers["X-Model-Version"] = predictor.version
+        g.model_version = predictor.version
+        return response
+
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    # Route templates, not raw paths, keep the label set small
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    request_seconds.observe(time.perf_counter() - g.start, endpoint)
+    if "outcome" in g:
+        outcome = g.outcome
+    elif response.status_code < 400:
+        outcome = "ok"
+    elif response.status_code < 500:
+        outcome = "rejected"
+    else:
+        outcome = "failed"
+    requests_total.inc(endpoint, outcome, g.get("model_version", ""))
+    return response
+
+
+@register_collector
+def service_metrics():
+    """The model store, micro-batcher and cache numbers, as Prometheus lines."""
+    status = model_store.status()
+    lines = sample_lines(
+        "disease_model_info",
+        "gauge",
+        "The model version being served",
+        1,
+        [("version", status["version"])],
+    )
+    lines += sample_lines(
+        "disease_model_reloads_total",
+        "counter",
+        "Successful model swaps",
+        status["reloads"],
+    )
+    lines += sample_lines(
+        "disease_model_failed_reloads_total",
+        "counter",
+        "Model loads rejected by loading or the canary check",
+        status["failed_reloads"],
+    )
+
+    if micro_batcher is not None:
+        stats = micro_batcher.stats()
+        lines += sample_lines(
+            "disease_micro_batch_queue_depth",
+            "gauge",
+            "Rows waiting for the micro-batcher",
+            stats["queue_depth"],
+        )
+        lines += header_lines(
+            "disease_micro_batch_size", "histogram", "Rows scored per micro-batch"
+        )
+        lines += histogram_samples(
+            "disease_micro_batch_size",
+            BATCH_SIZE_BUCKETS,
+            list(stats["batch_size_histogram"].values()),
+            stats["rows"],
+        )
+
+    if admission is not None:
+        stats = admission.stats()
+        lines += sample_lines(
+            "disease_admission_in_flight",
+            "gauge",
+            "Predictions running",
+            stats["in_flight"],
+        )
+        lines += sample_lines(
+            "disease_admission_queue_depth",
+            "gauge",
+            "Predictions waiting for a slot",
+            stats["queue_depth"],
+        )
+        lines += sample_lines(
+            "disease_admission_service_time_seconds",
+            "gauge",
+            "Moving average of the time a prediction holds its slot",
+            stats["service_time_seconds"],
+        )
+        lines += sample_lines(
+            "disease_admission_admitted_total",
+            "counter",
+            "Predictions let in",
+            stats["admitted"],
+        )
+        lines += header_lines(
+            "disease_admission_shed_total", "counter", "Predictions shed, by reason"
+        )
+        for reason in ("queue_full", "deadline_unreachable", "queue_timeout"):
+            lines += [
+                f'disease_admission_shed_total{{reason="{reason}"}} '
+                f"{stats['shed'].get(reason, 0)}"
+            ]
+
+    if prediction_cache is not None:
+        stats = prediction_cache.stats()
+        for name in ("hits", "misses", "evictions", "expirations"):
+            lines += sample_lines(
+                f"disease_cache_{name}_total",
+                "counter",
+                f"Prediction cache {name}",
+                stats[name],
+            )
+        lines += sample_lines(
+            "disease_cache_entries",
+            "gauge",
+            "Readings held in the prediction cache",
+            stats["size"],
+        )
+    return lines
 
-        # Use the predict_disease_risk function
-        risk = predict_disease_risk(crop_name, temperature, humidity, soil_moisture)
 
-        return jsonify({"disease_risk": risk})
+@api.route("/metrics")
+class Metrics(Resource):
+    def get(self):
+        return Response(render(), mimetype="text/plain; version=0.0.4")
 
 
 api.add_namespace(ns)
+api.add_namespace(admin_ns)
+api.add_namespace(v2_ns)
 
 if __name__ == "__main__":
+    app.logger.setLevel("INFO")
+    log_runtime_config(app.logger, model_version=model_store.current().version)
     app.run(host="0.0.0.0", port=8082)
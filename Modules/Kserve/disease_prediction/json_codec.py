@@ -0,0 +1,271 @@
+"""JSON request/response codec for /predict/ and /predict/batch.
+
+    python json_codec.py benchmark [--rows 1000] [--repeats 2000]
+
+Each request body is parsed and checked against the prediction schema in one
+step. A single reading comes out as a typed `Reading`, and a batch as one list
+per feature. Responses are written straight to bytes. The single-reading
+responses are cached, since there are only a few risk levels. Parsing uses
+orjson, a declared dependency, and falls back to the standard library when
+orjson is missing.
+
+The flask_restx models in inference.py still document the schema in Swagger.
+`benchmark` compares this codec with Flask's `request.json` and `jsonify`.
+"""
+
+import argparse
+import functools
+import json
+import math
+import sys
+import time
+from typing import NamedTuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FEATURES = ["crop_name", "temperature", "humidity", "soil_moisture"]
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+    loads, dumps = orjson.loads, orjson.dumps
+else:
+    BACKEND = "json"
+    loads, dumps = json.loads, _stdlib_dumps
+
+
+class CodecError(ValueError):
+    """The body is not valid JSON or does not match the schema; a 400."""
+
+
+class Reading(NamedTuple):
+    crop_name: str
+    temperature: float
+    humidity: float
+    soil_moisture: float
+
+
+def to_float(name, value):
+    # JSON booleans are ints in Python, but they are not valid readings
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number, got {value!r}")
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"{name} must be finite, got {value!r}")
+    return value
+
+
+def parse_json(body):
+    try:
+        return loads(body)
+    except ValueError as e:
+        raise CodecError(f"invalid JSON: {e}") from None
+
+
+def decode_reading(body):
+    """Parse and validate a single-reading request body into a Reading."""
+    data = parse_json(body)
+    if not isinstance(data, dict):
+        raise CodecError("expected a JSON object")
+    try:
+        crop_name = data["crop_name"]
+        reading = Reading(
+            crop_name,
+            to_float("temperature", data["temperature"]),
+            to_float("humidity", data["humidity"]),
+            to_float("soil_moisture", data["soil_moisture"]),
+        )
+    except KeyError as e:
+        raise CodecError(f"{e.args[0]} is required") from None
+    except ValueError as e:
+        raise CodecError(str(e)) from None
+    if not isinstance(crop_name, str):
+        raise CodecError(f"crop_name must be a string, got {crop_name!r}")
+    return reading
+
+
+def batch_columns(data):
+    """Turn a records or columnar batch payload into one list per feature.
+
+    Values are not checked here, so that a bad row only fails itself.
+    """
+    if isinstance(data, dict) and "instances" in data:
+        data = data["instances"]
+
+    if isinstance(data, list):
+        columns = {feature: [] for feature in FEATURES}
+        for record in data:
+            record = record if isinstance(record, dict) else {}
+            for feature in FEATURES:
+                columns[feature].append(record.get(feature))
+        return columns
+
+    if isinstance(data, dict):
+        missing = [feature for feature in FEATURES if feature not in data]
+        if missing:
+            raise CodecError(f"missing columns: {', '.join(missing)}")
+        columns = {feature: data[feature] for feature in FEATURES}
+        if not all(isinstance(column, list) for column in columns.values()):
+            raise CodecError("columnar payload values must be lists")
+        if len({len(column) for column in columns.values()}) > 1:
+            raise CodecError("columnar payload lists must have the same length")
+        return columns
+
+    raise CodecError("expected a list of records or a columnar object")
+
+
+def decode_batch(body):
+    return batch_columns(parse_json(body))
+
+
+@functools.lru_cache(maxsize=64)
+def encode_risk(risk):
+    return b'{"disease_risk":' + dumps(risk) + b"}"
+
+
+def encode_reading(risk, error=None):
+    """`{"disease_risk": risk}`, or the error in place of the risk.
+
+    Only risk labels are cached; error messages vary and would evict them.
+    """
+    if error is None:
+        return encode_risk(risk)
+    return b'{"disease_risk":' + dumps(error) + b"}"
+
+
+def encode_batch(risks, errors):
+    """The batch response body, and the number of rows that failed."""
+    predictions = [
+        {"disease_risk": risk} if error is None else {"error": error}
+        for risk, error in zip(risks, errors)
+    ]
+    n_errors = len(predictions) - errors.count(None)
+    return dumps({"predictions": predictions, "errors": n_errors}), n_errors
+
+
+def best_us(run, repeats):
+    """Best of five rounds of `repeats` calls, in µs per call."""
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            run()
+        timings.append((time.perf_counter() - start) / repeats)
+    return min(timings) * 1e6
+
+
+def benchmark(rows=1000, repeats=2000):
+    """Decode and encode /predict/ and /predict/batch bodies inside a Flask
+    request, the old way (`request.json`, `jsonify`) and with this codec,
+    with orjson (when installed) and with the standard library."""
+    import json_codec
+    from flask import Response, jsonify, request
+
+    from inference import app
+
+    single = {"crop_name": "rice", "temperature": 25, "humidity": 50.5}
+    single["soil_moisture"] = 60
+    single_body = json.dumps(single).encode("utf-8")
+    records = [
+        {
+            "crop_name": "rice",
+            "temperature": i % 50,
+            "humidity": i % 100 + 0.5,
+            "soil_moisture": 50,
+        }
+        for i in range(rows)
+    ]
+    batch_body = json.dumps({"instances": records}).encode("utf-8")
+    risks = ["high", "low", "medium"] * (rows // 3) + ["low"] * (rows % 3)
+    errors = [None] * rows
+
+    def fresh_json():
+        # Drop werkzeug's parsed-JSON cache, as each call stands for a request
+        vars(request._get_current_object()).pop("_cached_json", None)
+
+    def flask_single():
+        fresh_json()
+        data = request.json
+        reading = (
+            data["crop_name"],
+            data["temperature"],
+            data["humidity"],
+            data["soil_moisture"],
+        )
+        return jsonify({"disease_risk": "high"}).get_data(), reading
+
+    def codec_single():
+        reading = json_codec.decode_reading(request.get_data())
+        response = Response(json_codec.encode_reading("high"))
+        return response.get_data(), reading
+
+    def flask_batch():
+        fresh_json()
+        columns = json_codec.batch_columns(request.get_json(silent=True))
+        predictions = [
+            {"disease_risk": risk} if error is None else {"error": error}
+            for risk, error in zip(risks, errors)
+        ]
+        return jsonify({"predictions": predictions, "errors": 0}).get_data(), columns
+
+    def codec_batch():
+        columns = json_codec.decode_batch(request.get_data())
+        body, _ = json_codec.encode_batch(risks, errors)
+        return Response(body).get_data(), columns
+
+    backends = {"json": (json.loads, _stdlib_dumps)}
+    if orjson is not None:
+        backends["orjson"] = (orjson.loads, orjson.dumps)
+    cases = [("flask", None, flask_single, flask_batch)] + [
+        (f"codec ({name})", name, codec_single, codec_batch) for name in backends
+    ]
+
+    results = {}
+    saved = json_codec.loads, json_codec.dumps
+    try:
+        for label, backend, run_single, run_batch in cases:
+            if backend:
+                json_codec.loads, json_codec.dumps = backends[backend]
+            json_codec.encode_risk.cache_clear()
+            timings = []
+            for body, run, n in (
+                (single_body, run_single, repeats),
+                (batch_body, run_batch, max(1, repeats // 100)),
+            ):
+                with app.test_request_context(
+                    "/predict/",
+                    method="POST",
+                    data=body,
+                    content_type="application/json",
+                ):
+                    timings.append(best_us(run, n))
+            results[label] = {"single_us": timings[0], "batch_us": timings[1]}
+    finally:
+        json_codec.loads, json_codec.dumps = saved
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench = commands.add_parser("benchmark", help="compare with request.json/jsonify")
+    bench.add_argument("--rows", type=int, default=1000)
+    bench.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.rows, args.repeats)
+    print(f"{'path':<18}{'single µs':>11}{f'batch of {args.rows} µs':>20}")
+    for label, result in results.items():
+        print(f"{label:<18}{result['single_us']:>11.1f}{result['batch_us']:>20.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,538 @@
+"""Closed- and open-loop load tests for the disease prediction service.
+
+    python loadtest.py run [--mode closed --concurrency 8 | --mode open --rate 200]
+                           [--duration 10] [--mix single=0.9,batch=0.1]
+                           [--target subprocess|serve|inprocess|http://host:port]
+                           [--output run.json]
+    python loadtest.py compare baseline.json candidate.json [--tolerance 0.1]
+
+`run` starts the service (or uses a URL), replays a synthetic mix of requests
+and writes throughput, latency percentiles and errors as JSON.
+
+- closed: `--concurrency` clients, each sending its next request as soon as
+  the previous one is answered. This measures capacity.
+- open: requests arrive as a Poisson process at `--rate` per second, whether
+  or not earlier ones have finished. Latency counts from the scheduled
+  arrival, so time spent queued in the client counts as well. This shows how
+  latency grows as the offered load approaches capacity.
+
+`compare` prints the change in each number between two runs. It exits with 1
+when throughput or p99 is worse by more than --tolerance (default 10%), or
+when the error rate rises by more than --error-margin (default 0.1 points).
+"""
+
+import argparse
+import datetime
+import http.client
+import json
+import logging
+import os
+import platform
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+from bench_prefork import wait_ready
+from json_codec import FEATURES
+from open_inference import HEADER_LENGTH, encode_message
+from runtime import available_cpus
+
+PERCENTILES = {"p50": 50, "p95": 95, "p99": 99, "p999": 99.9}
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Range of each numeric reading in the synthetic requests
+READING_LOW = [-10.0, 0.0, 0.0]
+READING_HIGH = [50.0, 100.0, 100.0]
+
+
+class RequestMix:
+    """Build random requests of each kind, in the configured proportions.
+
+    - single: POST /predict/ with one reading
+    - batch: POST /predict/batch with `batch_size` readings, as columns
+    - v2: POST /v2/models/<name>/infer with `batch_size` readings, binary
+
+    With `distinct` > 0, readings are drawn from a fixed pool of that many, so
+    the prediction cache and the risk grid get hits.
+    """
+
+    def __init__(
+        self, weights, crops, batch_size=32, distinct=0, model_name=None, seed=0
+    ):
+        unknown = set(weights) - {"single", "batch", "v2"}
+        if unknown:
+            raise ValueError(f"unknown request kinds: {', '.join(sorted(unknown))}")
+        self.kinds = list(weights)
+        total = sum(weights.values())
+        self.probabilities = [weights[kind] / total for kind in self.kinds]
+        self.crops = crops
+        self.batch_size = batch_size
+        self.model_name = model_name or os.environ.get(
+            "MODEL_NAME", "disease-prediction"
+        )
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.pool = self._readings(distinct) if distinct else None
+
+    def _readings(self, n):
+        crops = self.rng.choice(self.crops, n).tolist()
+        numeric = np.round(self.rng.uniform(READING_LOW, READING_HIGH, (n, 3)), 1)
+        return crops, numeric
+
+    def readings(self, n):
+        with self.lock:
+            if self.pool is None:
+                return self._readings(n)
+            index = self.rng.integers(0, len(self.pool[0]), n)
+            return [self.pool[0][i] for i in index], self.pool[1][index]
+
+    def next_kind(self):
+        with self.lock:
+            return self.kinds[self.rng.choice(len(self.kinds), p=self.probabilities)]
+
+    def build(self, kind):
+        """Return (path, body bytes, headers) for one request of `kind`."""
+        if kind == "single":
+            crops, numeric = self.readings(1)
+            body = dict(zip(FEATURES, [crops[0], *numeric[0].tolist()]))
+            return "/predict/", json.dumps(body).encode(), JSON_HEADERS
+        crops, numeric = self.readings(self.batch_size)
+        if kind == "batch":
+            body = dict(zip(FEATURES, [crops, *numeric.T.tolist()]))
+            return "/predict/batch", json.dumps(body).encode(), JSON_HEADERS
+        tensors = [("crop_name", "BYTES", crops)] + [
+            (feature, "FP64", numeric[:, i]) for i, feature in enumerate(FEATURES[1:])
+        ]
+        body, header_length = encode_message(
+            {"parameters": {"binary_data_output": True}},
+            tensors,
+            "inputs",
+            binary_names=FEATURES,
+        )
+        headers = {
+            "Content-Type": "application/octet-stream",
+            HEADER_LENGTH: str(header_length),
+        }
+        return f"/v2/models/{self.model_name}/infer", body, headers
+
+
+class Recorder:
+    """Collect (kind, latency, status) for every finished request."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+
+    def add(self, kind, latency, status):
+        with self.lock:
+            self.samples.append((kind, latency, status))
+
+
+def send(connection, mix, kind):
+    """Send one request on a keep-alive connection; returns the HTTP status."""
+    path, body, headers = mix.build(kind)
+    connection.request("POST", path, body, headers)
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def attempt(connection, mix, kind):
+    """Return (status, broken): "timeout" or "connection" if nothing came back."""
+    try:
+        return send(connection, mix, kind), False
+    except socket.timeout:
+        return "timeout", True
+    except (OSError, http.client.HTTPException):
+        return "connection", True
+
+
+def run_closed(host, port, mix, concurrency, duration, timeout):
+    recorder = Recorder()
+    stop = time.perf_counter() + duration
+
+    def client():
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        while time.perf_counter() < stop:
+            kind = mix.next_kind()
+            start = time.perf_counter()
+            status, broken = attempt(connection, mix, kind)
+            recorder.add(kind, time.perf_counter() - start, status)
+            if broken:
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.samples
+
+
+def run_open(host, port, mix, rate, duration, timeout, max_in_flight, seed=0):
+    recorder = Recorder()
+    arrivals = queue.Queue()
+
+    def client():
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        while True:
+            item = arrivals.get()
+            if item is None:
+                break
+            kind, scheduled = item
+            status, broken = attempt(connection, mix, kind)
+            # From the scheduled arrival, so waiting for a free client counts
+            recorder.add(kind, time.perf_counter() - scheduled, status)
+            if broken:
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(max_in_flight)]
+    for thread in threads:
+        thread.start()
+
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    scheduled = start
+    while True:
+        scheduled += rng.exponential(1.0 / rate)
+        if scheduled >= start + duration:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        arrivals.put((mix.next_kind(), scheduled))
+
+    for _ in threads:
+        arrivals.put(None)
+    for thread in threads:
+        thread.join()
+    return recorder.samples
+
+
+def summarize(samples, elapsed):
+    """Throughput, latency percentiles (ms) and errors for a list of samples."""
+    latencies = np.array([latency for _, latency, _ in samples]) * 1000.0
+    errors = {}
+    for _, _, status in samples:
+        if status != 200:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    n_errors = sum(errors.values())
+    summary = {
+        "requests": len(samples),
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "error_rate": n_errors / len(samples) if samples else 0.0,
+        "errors": errors,
+    }
+    # Shed requests fail fast, so successes get their own percentiles too
+    ok = np.array([status == 200 for _, _, status in samples], dtype=bool)
+    for key, values in (("latency_ms", latencies), ("ok_latency_ms", latencies[ok])):
+        summary[key] = {}
+        if values.size:
+            summary[key] = {
+                name: float(np.percentile(values, q)) for name, q in PERCENTILES.items()
+            }
+            summary[key]["mean"] = float(values.mean())
+            summary[key]["max"] = float(values.max())
+    return summary
+
+
+def start_server(target, port, workers):
+    """Start the service; returns (host, port, stop function)."""
+    if target.startswith("http://"):
+        url = urllib.parse.urlsplit(target)
+        return url.hostname, url.port or 80, lambda: None
+
+    if target == "inprocess":
+        from werkzeug.serving import make_server
+
+        from inference import app
+
+        # The per-request access log would cost as much as the requests
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        server = make_server("127.0.0.1", port, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return "127.0.0.1", port, server.shutdown
+
+    if target == "subprocess":
+        command = [
+            sys.executable,
+            "-c",
+            "import inference; "
+            f"inference.app.run(host='127.0.0.1', port={port}, threaded=True)",
+        ]
+    elif target == "serve":
+        command = [sys.executable, "serve.py", "--host", "127.0.0.1"]
+        command += ["--port", str(port)]
+        if workers:
+            command += ["--workers", str(workers)]
+    else:
+        raise ValueError(f"unknown target {target!r}")
+
+    process = subprocess.Popen(
+        command,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    def stop():
+        process.terminate()
+        process.wait()
+
+    try:
+        wait_ready(port)
+    except RuntimeError:
+        stop()
+        raise
+    return "127.0.0.1", port, stop
+
+
+def run(args):
+    weights = {}
+    for item in args.mix.split(","):
+        kind, _, weight = item.partition("=")
+        weights[kind.strip()] = float(weight or 1)
+    mix = RequestMix(
+        weights,
+        args.crops.split(","),
+        batch_size=args.batch_size,
+        distinct=args.distinct,
+        seed=args.seed,
+    )
+
+    host, port, stop = start_server(args.target, args.port, args.workers)
+    try:
+        if args.warmup > 0:
+            run_closed(host, port, mix, args.concurrency, args.warmup, args.timeout)
+        start = time.perf_counter()
+        if args.mode == "closed":
+            samples = run_closed(
+                host, port, mix, args.concurrency, args.duration, args.timeout
+            )
+        else:
+            samples = run_open(
+                host,
+                port,
+                mix,
+                args.rate,
+                args.duration,
+                args.timeout,
+                args.max_in_flight,
+                args.seed,
+            )
+        elapsed = time.perf_counter() - start
+    finally:
+        stop()
+
+    result = {
+        "label": args.label or f"{args.mode}-{args.target}",
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {
+            name: getattr(args, name)
+            for name in (
+                "mode",
+                "target",
+                "workers",
+                "concurrency",
+                "rate",
+                "max_in_flight",
+                "duration",
+                "warmup",
+                "mix",
+                "batch_size",
+                "distinct",
+                "crops",
+                "seed",
+            )
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "cpus": available_cpus(),
+            **{
+                name: os.environ[name]
+                for name in (
+                    "MODEL_DIR",
+                    "MODEL_BACKEND",
+                    "MICRO_BATCHING",
+                    "PREDICTION_CACHE_SIZE",
+                    "RISK_GRID",
+                )
+                if name in os.environ
+            },
+        },
+        "elapsed_s": elapsed,
+        **summarize(samples, elapsed),
+        "by_kind": {
+            kind: summarize([s for s in samples if s[0] == kind], elapsed)
+            for kind in mix.kinds
+        },
+    }
+    return result
+
+
+# (key, higher is better) of the numbers compare() judges
+COMPARED = [
+    (("throughput_rps",), True),
+    (("latency_ms", "p50"), False),
+    (("latency_ms", "p95"), False),
+    (("latency_ms", "p99"), False),
+    (("latency_ms", "p999"), False),
+    (("ok_latency_ms", "p99"), False),
+    (("error_rate",), False),
+]
+
+
+def lookup(result, key):
+    for part in key:
+        result = result.get(part, {}) if isinstance(result, dict) else {}
+    return result if isinstance(result, (int, float)) else None
+
+
+# The settings that shape the offered load, which two compared runs must share;
+# the server side (target, workers, environment) is what a comparison varies
+LOAD_CONFIG = ["mode", "duration", "warmup", "mix", "batch_size", "distinct", "crops"]
+LOAD_CONFIG_BY_MODE = {
+    "closed": ["concurrency"],
+    "open": ["rate", "max_in_flight", "seed"],
+}
+
+
+def config_mismatches(baseline, candidate):
+    """The load settings that differ between two runs, as readable lines."""
+    before, after = baseline.get("config", {}), candidate.get("config", {})
+    names = LOAD_CONFIG + LOAD_CONFIG_BY_MODE.get(before.get("mode"), [])
+    return [
+        f"{name}: {before.get(name)!r} vs {after.get(name)!r}"
+        for name in names
+        if before.get(name) != after.get(name)
+    ]
+
+
+def compare(baseline, candidate, tolerance=0.1, error_margin=0.001):
+    """Return one row per number: (name, baseline, candidate, change, regressed).
+
+    Throughput and p99 regress when they are worse by more than `tolerance`,
+    a fraction. The error rate regresses when it rises by more than
+    `error_margin`.
+    """
+    rows = []
+    for key, higher_is_better in COMPARED:
+        before, after = lookup(baseline, key), lookup(candidate, key)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else None
+        if key == ("error_rate",):
+            regressed = after - before > error_margin
+        elif key in (("throughput_rps",), ("latency_ms", "p99")):
+            worse = -change if higher_is_better else change
+            regressed = change is not None and worse > tolerance
+        else:
+            regressed = False
+        rows.append((".".join(key), before, after, change, regressed))
+    return rows
+
+
+def print_summary(result):
+    latency = result["latency_ms"]
+    print(
+        f"{result['label']}: {result['requests']} requests in "
+        f"{result['elapsed_s']:.1f} s, {result['throughput_rps']:.1f} req/s, "
+        f"error rate {result['error_rate']:.2%}"
+    )
+    if latency:
+        print(
+            "latency ms: "
+            + "  ".join(f"{name} {latency[name]:.1f}" for name in PERCENTILES)
+            + f"  max {latency['max']:.1f}"
+        )
+    if result["ok_latency_ms"] and result["error_rate"]:
+        print(f"successful requests only: p99 {result['ok_latency_ms']['p99']:.1f} ms")
+    for kind, summary in result["by_kind"].items():
+        if summary["latency_ms"]:
+            print(
+                f"  {kind:<7}{summary['requests']:>8} requests"
+                f"  p50 {summary['latency_ms']['p50']:.1f}"
+                f"  p99 {summary['latency_ms']['p99']:.1f}"
+                f"  errors {summary['errors'] or 0}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run one load test")
+    run_parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--rate", type=float, default=100.0)
+    run_parser.add_argument("--max-in-flight", type=int, default=64)
+    run_parser.add_argument("--duration", type=float, default=10.0)
+    run_parser.add_argument("--warmup", type=float, default=2.0)
+    run_parser.add_argument("--mix", default="single=1")
+    run_parser.add_argument("--batch-size", type=int, default=32)
+    run_parser.add_argument("--distinct", type=int, default=0)
+    run_parser.add_argument("--crops", default="maize,rice,wheat")
+    run_parser.add_argument("--target", default="subprocess")
+    run_parser.add_argument("--workers", type=int, default=0)
+    run_parser.add_argument("--port", type=int, default=18083)
+    run_parser.add_argument("--timeout", type=float, default=30.0)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--label")
+    run_parser.add_argument("--output", help="write the result JSON here")
+
+    compare_parser = commands.add_parser("compare", help="compare two runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+    compare_parser.add_argument("--error-margin", type=float, default=0.001)
+    compare_parser.add_argument(
+        "--allow-config-mismatch",
+        action="store_true",
+        help="compare runs with different load settings anyway",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        result = run(args)
+        print_summary(result)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(result, f, indent=2)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    mismatches = config_mismatches(baseline, candidate)
+    if mismatches:
+        print("The runs were made with different load settings:")
+        for line in mismatches:
+            print(f"  {line}")
+        if not args.allow_config_mismatch:
+            print("Refusing to compare them; see --allow-config-mismatch.")
+            return 2
+    rows = compare(baseline, candidate, args.tolerance, args.error_margin)
+    print(f"{'metric':<18}{'baseline':>12}{'candidate':>12}{'change':>9}")
+    for name, before, after, change, regressed in rows:
+        change_text = f"{change:+.1%}" if change is not None else "n/a"
+        print(
+            f"{name:<18}{before:>12.3f}{after:>12.3f}{change_text:>9}"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+"""Prometheus metrics for the disease prediction service.
+
+    python metrics.py benchmark [--requests 500]
+
+Histograms and counters are kept in process and rendered in the Prometheus
+text format by `GET /metrics`. Each histogram has a fixed set of buckets, so
+recording a value is one bisect and two additions under a lock.
+Other components, such as the micro-batcher and the cache, add their numbers
+through `register_collector`.
+
+Under serve.py every worker records its own numbers and writes them to a
+shared directory once a second (`share`); whichever worker answers
+`GET /metrics` renders the sum over all workers, so counters keep growing
+from scrape to scrape.
+
+Set METRICS=0 to turn recording off. `benchmark` measures what recording
+costs per request.
+"""
+
+import argparse
+import bisect
+import contextlib
+import fcntl
+import os
+import sys
+import threading
+import time
+
+# Upper bounds in seconds, from 25 µs to 2.5 s
+LATENCY_BUCKETS = (
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+# Stages of one model call, recorded by the predictors
+MODEL_STAGES = ("encode", "scale", "trees", "decode")
+
+enabled = os.environ.get("METRICS", "1") != "0"
+
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def header_lines(name, kind, documentation):
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._reset()
+        _metrics.append(self)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        if not enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def lines(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = header_lines(self.name, "counter", self.documentation)
+        for labels, value in values:
+            label_text = format_labels(list(zip(self.label_names, labels)))
+            lines.append(f"{self.name}{label_text} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._reset()
+        _metrics.append(self)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series = {}
+
+    def observe(self, value, *labels):
+        if not enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def lines(self):
+        with self._lock:
+            series = sorted(
+                (labels, list(counts)) for labels, counts in self._series.items()
+            )
+        lines = header_lines(self.name, "histogram", self.documentation)
+        for labels, counts in series:
+            lines.extend(
+                histogram_samples(
+                    self.name,
+                    self.buckets,
+                    counts[:-1],
+                    counts[-1],
+                    list(zip(self.label_names, labels)),
+                )
+            )
+        return lines
+
+
+def histogram_samples(name, buckets, counts, total, labels=()):
+    """Lines for one histogram series from per-bucket, non-cumulative counts.
+
+    `counts` has one more entry than `buckets`, for values above the last one.
+    """
+    lines = []
+    cumulative = 0
+    for bound, count in zip((*buckets, float("inf")), counts):
+        cumulative += count
+        le = format_labels([*labels, ("le", format_value(bound))])
+        lines.append(f"{name}_bucket{le} {cumulative}")
+    label_text = format_labels(labels)
+    lines.append(f"{name}_sum{label_text} {format_value(total)}")
+    lines.append(f"{name}_count{label_text} {cumulative}")
+    return lines
+
+
+def sample_lines(name, kind, documentation, value, labels=()):
+    """HELP, TYPE and one sample, for numbers kept elsewhere (e.g. cache stats)."""
+    return header_lines(name, kind, documentation) + [
+        f"{name}{format_labels(labels)} {format_value(value)}"
+    ]
+
+
+def register_collector(collect):
+    """Add `collect()`, returning a list of text lines, to every render."""
+    _collectors.append(collect)
+    return collect
+
+
+def render():
+    if _shared_dir is not None:
+        write_snapshot()
+        return merge_snapshots(_shared_dir)
+    return render_local()
+
+
+def render_local():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.lines())
+    for collect in _collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
+
+
+def _after_fork():
+    # Each pre-forked worker counts its own requests from zero
+    for metric in _metrics:
+        metric._reset()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+# Pre-forked workers share their numbers through files in one directory
+_shared_dir = None
+RETIRED = "retired.prom"
+
+
+def _snapshot_path(directory, pid):
+    return os.path.join(directory, f"worker-{pid}.prom")
+
+
+def write_snapshot():
+    path = _snapshot_path(_shared_dir, os.getpid())
+    with open(path + ".tmp", "w") as f:
+        f.write(render_local())
+    os.replace(path + ".tmp", path)
+
+
+def share(directory, interval=1.0):
+    """Publish this worker's metrics to `directory` every `interval` seconds.
+
+    Any worker answering `GET /metrics` then renders the sum over all of them,
+    see merge_snapshots(). Call it in each worker after the fork.
+    """
+    global _shared_dir
+    _shared_dir = directory
+    write_snapshot()
+
+    def publish():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot()
+            except OSError:
+                pass
+
+    threading.Thread(target=publish, name="metrics-share", daemon=True).start()
+
+
+def retire(directory, pid):
+    """Fold the counters of worker `pid`, which has exited, into RETIRED.
+
+    Its gauges are dropped. Keeping the counters means the totals never go
+    backwards when the master replaces a worker.
+    """
+    path = _snapshot_path(directory, pid)
+    retired = os.path.join(directory, RETIRED)
+    with _locked(directory):
+        texts = [_read(retired), _read(path)]
+        with open(retired + ".tmp", "w") as f:
+            f.write(_merge([(None, text) for text in texts if text]))
+        os.replace(retired + ".tmp", retired)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@contextlib.contextmanager
+def _locked(directory):
+    # Keeps a scrape from counting a worker both live and retired
+    with open(os.path.join(directory, "lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+
+def merge_snapshots(directory):
+    """The Prometheus text of every live and retired worker in `directory`.
+
+    Counters and histograms are summed. Gauges describe one process, so each
+    live worker's gauges keep their own series with a `worker` label.
+    """
+    snapshots = []
+    with _locked(directory):
+        for name in sorted(os.listdir(directory)):
+            if name == RETIRED:
+                snapshots.append((None, _read(os.path.join(directory, name))))
+            elif name.startswith("worker-") and name.endswith(".prom"):
+                pid = name[len("worker-") : -len(".prom")]
+                snapshots.append((pid, _read(os.path.join(directory, name))))
+    return _merge(snapshots)
+
+
+def _with_worker(series, pid):
+    name, brace, labels = series.partition("{")
+    if brace:
+        return f'{name}{{worker="{pid}",{labels}'
+    return f'{name}{{worker="{pid}"}}'
+
+
+def _number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def _merge(snapshots):
+    """Merge (pid, text) snapshots; a None pid marks one without gauges."""
+    families = {}  # name -> [help line, type line, {series: value}]
+    family = None
+    for pid, text in snapshots:
+        for line in text.splitlines():
+            if line.startswith("# HELP "):
+                name = line.split(" ", 3)[2]
+                family = families.setdefault(name, [line, None, {}])
+            elif line.startswith("# TYPE "):
+                family[1] = line
+            elif line:
+                series, value = line.rsplit(" ", 1)
+                if family[1].endswith(" gauge"):
+                    if pid is None:
+                        continue
+                    series = _with_worker(series, pid)
+                samples = family[2]
+                samples[series] = samples.get(series, 0) + _number(value)
+    lines = []
+    for help_line, type_line, samples in families.values():
+        if not samples and type_line.endswith(" gauge"):
+            continue
+        lines += [help_line, type_line]
+        lines += [
+            f"{series} {format_value(value)}" for series, value in samples.items()
+        ]
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = Histogram(
+    "disease_stage_seconds",
+    "Time spent in each stage of handling a prediction",
+    ["stage"],
+)
+request_seconds = Histogram(
+    "disease_request_seconds",
+    "Time from the start of a request to its response, per route",
+    ["endpoint"],
+)
+admission_wait_seconds = Histogram(
+    "disease_admission_wait_seconds",
+    "Time admitted predictions waited for a slot",
+)
+requests_total = Counter(
+    "disease_requests_total",
+    "Requests by route, outcome and model version",
+    ["endpoint", "outcome", "model_version"],
+)
+
+
+def record_model_stages(*marks):
+    """Record MODEL_STAGES from the perf_counter() marks taken around them."""
+    for stage, start, end in zip(MODEL_STAGES, marks, marks[1:]):
+        stage_seconds.observe(end - start, stage)
+
+
+def benchmark(n_requests=500):
+    """Time single-row /predict/ requests with recording on and off."""
+    # The service records into the imported module, not into __main__
+    import metrics
+    from inference import app
+
+    client = app.test_client()
+    body = {"crop_name": "rice", "temperature": 25, "humidity": 50, "soil_moisture": 60}
+
+    def per_request_us(recording):
+        metrics.enabled = recording
+        for _ in range(50):
+            client.post("/predict/", json=body)
+        start = time.perf_counter()
+        for _ in range(n_requests):
+            client.post("/predict/", json=body)
+        return (time.perf_counter() - start) / n_requests * 1e6
+
+    # Alternate the two settings so drift on the machine hits both alike
+    timings = {True: [], False: []}
+    for _ in range(3):
+        for recording in (False, True):
+            timings[recording].append(per_request_us(recording))
+    metrics.enabled = True
+
+    # Cost of a single observation, and how many one request makes
+    probe = metrics.Histogram("benchmark_probe_seconds", "Benchmark probe", ["stage"])
+    metrics._metrics.remove(probe)
+    start = time.perf_counter()
+    for _ in range(100000):
+        probe.observe(0.0003, "encode")
+    observe_ns = (time.perf_counter() - start) / 100000 * 1e9
+    before = metrics.observation_count()
+    client.post("/predict/", json=body)
+    after = metrics.observation_count()
+
+    return {
+        "requests": n_requests,
+        "off_us": min(timings[False]),
+        "on_us": min(timings[True]),
+        "observe_ns": observe_ns,
+        "observations_per_request": after - before,
+    }
+
+
+def observation_count():
+    total = 0
+    for metric in _metrics:
+        with metric._lock:
+            if isinstance(metric, Histogram):
+                total += sum(sum(series[:-1]) for series in metric._series.values())
+            else:
+                total += sum(metric._values.values())
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench = commands.add_parser("benchmark", help="measure the recording overhead")
+    bench.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    result = benchmark(args.requests)
+    print(f"requests per setting      {result['requests']}")
+    print(f"metrics off               {result['off_us']:.1f} µs/request")
+    print(f"metrics on                {result['on_us']:.1f} µs/request")
+    print(f"one observation           {result['observe_ns']:.0f} ns")
+    print(f"observations per request  {result['observations_per_request']}")
+    print(
+        "recording cost            "
+        f"{result['observe_ns'] * result['observations_per_request'] / 1000:.1f}"
+        " µs/request"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
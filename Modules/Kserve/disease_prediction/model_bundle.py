@@ -0,0 +1,347 @@
+"""Versioned model bundle: all artifacts plus a manifest in one directory.
+
+    python model_bundle.py convert [--source .] [--output model_bundle]
+    python model_bundle.py verify [model_bundle]
+    python model_bundle.py benchmark [--bundle model_bundle]
+
+A bundle holds the four sklearn artifacts (sklearn/*.joblib), the same model
+compiled to plain arrays (compiled/*.npy, see compiled_model.py), the compact
+export of those arrays (compact/*.npy, see compact_model.py) and
+manifest.json with the bundle version, a SHA-256 checksum per file and the
+feature schema. disease_prediction.py writes one after training; `convert`
+builds one from an existing four-file layout.
+
+Loading a bundle with the compiled or compact backend memory-maps the .npy files, so a
+cold start costs page faults on the arrays actually touched instead of
+unpickling the forest.
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from compact_model import CompactModel, compact_artifacts
+from compiled_model import CompiledModel, compile_artifacts
+from predictors import SKLEARN_ARTIFACTS, SklearnModel
+
+BUNDLE_FORMAT = 1
+MANIFEST = "manifest.json"
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def feature_schema(crop_label_encoder, risk_label_encoder):
+    return {
+        "inputs": [
+            {
+                "name": "crop_name",
+                "type": "string",
+                "categories": [str(crop) for crop in crop_label_encoder.classes_],
+            },
+            {"name": "temperature", "type": "float"},
+            {"name": "humidity", "type": "float"},
+            {"name": "soil_moisture", "type": "float"},
+        ],
+        "output": {
+            "name": "disease_risk",
+            "type": "string",
+            "categories": [str(risk) for risk in risk_label_encoder.classes_],
+        },
+    }
+
+
+def write_atomically(path, write, obj):
+    # A running service may have the old file memory-mapped; replacing it
+    # (new inode) instead of truncating it keeps that mapping valid
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(obj, f)
+    os.replace(tmp_path, path)
+
+
+def save_arrays(directory, subdirectory, arrays):
+    """Write one .npy per array to directory/subdirectory; return their paths."""
+    os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+    files = []
+    for name, array in arrays.items():
+        files.append(os.path.join(subdirectory, f"{name}.npy"))
+        write_atomically(
+            os.path.join(directory, files[-1]), lambda a, f: np.save(f, a), array
+        )
+    return files
+
+
+def load_arrays(directory):
+    return {
+        name[: -len(".npy")]: np.load(os.path.join(directory, name), mmap_mode="r")
+        for name in os.listdir(directory)
+        if name.endswith(".npy")
+    }
+
+
+def file_checksums(directory, files):
+    return {
+        name: {
+            "sha256": sha256_file(os.path.join(directory, name)),
+            "bytes": os.path.getsize(os.path.join(directory, name)),
+        }
+        for name in files
+    }
+
+
+def bundle_version(checksums):
+    return hashlib.sha256(
+        "".join(checksum["sha256"] for checksum in checksums.values()).encode()
+    ).hexdigest()[:12]
+
+
+def write_manifest(directory, manifest):
+    # Write the manifest last: a bundle without one is incomplete
+    write_atomically(
+        os.path.join(directory, MANIFEST),
+        lambda m, f: f.write(json.dumps(m, indent=2).encode()),
+        manifest,
+    )
+
+
+def write_bundle(
+    directory,
+    model,
+    scaler,
+    crop_label_encoder,
+    risk_label_encoder,
+    compact=None,
+):
+    """Write the artifacts and their manifest to `directory`; return the manifest.
+
+    `compact` is the compact export (see compact_model.choose_prune); without
+    it, the trees are pruned "exact", which is safe unchecked.
+    """
+    import sklearn
+    from joblib import dump
+
+    os.makedirs(os.path.join(directory, "sklearn"), exist_ok=True)
+
+    files = []
+    # Uncompressed, so joblib can memory-map the arrays stored beside the
+    # pickles (the scaler's and encoders'; trees copy theirs on unpickling)
+    for name, artifact in zip(
+        SKLEARN_ARTIFACTS, (model, scaler, crop_label_encoder, risk_label_encoder)
+    ):
+        files.append(os.path.join("sklearn", name))
+        write_atomically(os.path.join(directory, files[-1]), dump, artifact)
+    artifacts = (model, scaler, crop_label_encoder, risk_label_encoder)
+    files += save_arrays(directory, "compiled", compile_artifacts(*artifacts))
+    if compact is None:
+        compact = compact_artifacts(*artifacts, prune="exact")
+    files += save_arrays(directory, "compact", compact)
+
+    checksums = file_checksums(directory, files)
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": bundle_version(checksums),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "model": type(model).__name__,
+        "library_versions": {
+            "scikit-learn": sklearn.__version__,
+            "numpy": np.__version__,
+        },
+        "feature_schema": feature_schema(crop_label_encoder, risk_label_encoder),
+        "files": checksums,
+    }
+    write_manifest(directory, manifest)
+    return manifest
+
+
+def add_arrays(directory, subdirectory, arrays):
+    """Write arrays into an existing bundle, replacing that subdirectory, and
+    record them in the manifest; return the new manifest."""
+    manifest = read_manifest(directory)
+    prefix = subdirectory + os.sep
+    for name in list(manifest["files"]):
+        if name.startswith(prefix):
+            del manifest["files"][name]
+            os.remove(os.path.join(directory, name))
+    files = save_arrays(directory, subdirectory, arrays)
+    manifest["files"].update(file_checksums(directory, files))
+    manifest["version"] = bundle_version(manifest["files"])
+    write_manifest(directory, manifest)
+    return manifest
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"unsupported bundle format {manifest.get('format')!r}")
+    return manifest
+
+
+def verify_checksums(directory, manifest):
+    """Return the bundle files whose size or SHA-256 differs from the manifest."""
+    bad = []
+    for name, expected in manifest["files"].items():
+        path = os.path.join(directory, name)
+        if (
+            not os.path.exists(path)
+            or os.path.getsize(path) != expected["bytes"]
+            or sha256_file(path) != expected["sha256"]
+        ):
+            bad.append(name)
+    return bad
+
+
+def load_bundle(directory, backend="compiled", verify=False):
+    manifest = read_manifest(directory)
+    if verify:
+        bad = verify_checksums(directory, manifest)
+        if bad:
+            raise ValueError(f"bundle checksum mismatch: {', '.join(bad)}")
+
+    if backend == "compiled":
+        predictor = CompiledModel(load_arrays(os.path.join(directory, "compiled")))
+    elif backend == "compact":
+        predictor = CompactModel(load_arrays(os.path.join(directory, "compact")))
+    elif backend == "sklearn":
+        predictor = SklearnModel.load(
+            os.path.join(directory, "sklearn"), mmap_mode="r"
+        )
+    else:
+        raise ValueError(f"unknown model backend {backend!r}")
+    predictor.version = manifest["version"]
+    predictor.manifest = manifest
+    return predictor
+
+
+# Run in a fresh interpreter per layout so imports and page cache state count
+STARTUP_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import numpy as np
+from predictors import load_predictor
+predictor = load_predictor(sys.argv[1], sys.argv[2])
+predictor.predict(["rice"], np.array([[25.0, 50.0, 60.0]]))
+elapsed = time.perf_counter() - start
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS"))
+print(json.dumps({
+    "startup_seconds": elapsed,
+    "rss_mib": rss / 1024,
+    "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "sklearn_imported": "sklearn" in sys.modules,
+}))
+"""
+
+
+def benchmark(layouts, repeats=5):
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for label, backend, directory in layouts:
+        runs = []
+        for _ in range(repeats):
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-W",
+                    "ignore",
+                    "-c",
+                    STARTUP_PROBE,
+                    backend,
+                    directory,
+                ],
+                cwd=here,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            runs.append(json.loads(output))
+        runs.sort(key=lambda run: run["startup_seconds"])
+        results.append({"layout": label, **runs[len(runs) // 2]})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="bundle a four-file layout")
+    convert.add_argument("--source", default=".")
+    convert.add_argument("--output", default="model_bundle")
+    verify = commands.add_parser("verify", help="check checksums and backends")
+    verify.add_argument("bundle", nargs="?", default="model_bundle")
+    bench = commands.add_parser("benchmark", help="compare startup time and RSS")
+    bench.add_argument("--bundle", default="model_bundle")
+    bench.add_argument("--source", default=".")
+    bench.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        legacy = SklearnModel.load(args.source)
+        manifest = write_bundle(
+            args.output,
+            legacy.model,
+            legacy.scaler,
+            legacy.crop_label_encoder,
+            legacy.risk_label_encoder,
+        )
+        print(f"Wrote bundle {manifest['version']} to {args.output}")
+        return 0
+
+    if args.command == "verify":
+        from compiled_model import count_mismatches, random_readings
+
+        manifest = read_manifest(args.bundle)
+        bad = verify_checksums(args.bundle, manifest)
+        for name in bad:
+            print(f"checksum mismatch: {name}")
+        reference = load_bundle(args.bundle, "sklearn")
+        crop_names, numeric = random_readings(
+            sorted(reference.known_crops),
+            reference.scaler.mean_,
+            reference.scaler.scale_,
+            20000,
+        )
+        mismatches = {
+            backend: count_mismatches(
+                load_bundle(args.bundle, backend), reference, crop_names, numeric
+            )
+            for backend in ("compiled", "compact")
+        }
+        print(
+            f"Bundle {manifest['version']}: {len(bad)} bad files, "
+            + ", ".join(
+                f"{count} {backend}/sklearn mismatches"
+                for backend, count in mismatches.items()
+            )
+            + " on 20000 readings"
+        )
+        return 1 if bad or any(mismatches.values()) else 0
+
+    layouts = [
+        ("four files, sklearn", "sklearn", args.source),
+        ("bundle, sklearn", "sklearn", args.bundle),
+        ("bundle, compiled (mmap)", "compiled", args.bundle),
+        ("bundle, compact (mmap)", "compact", args.bundle),
+    ]
+    print(f"{'layout':<26}{'startup ms':>12}{'RSS MiB':>10}{'peak MiB':>10}")
+    for result in benchmark(layouts, args.repeats):
+        print(
+            f"{result['layout']:<26}{result['startup_seconds'] * 1000:>12.1f}"
+            f"{result['rss_mib']:>10.1f}{result['peak_rss_mib']:>10.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
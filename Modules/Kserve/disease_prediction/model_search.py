@@ -0,0 +1,222 @@
+"""Search forest hyperparameters for accuracy, latency and size together.
+
+Used by `disease_prediction.py --search`. Every candidate configuration is
+cross-validated and then fit on the whole training set, in a pool of worker
+processes. The fitted models then go back to this process, which times each
+one alone. It measures single-row and batched latency through the serving
+predictors, both sklearn and compiled, and the size of the pickled model.
+
+The chosen model is the fastest one whose mean CV accuracy is within
+`tolerance` of the best. "Fastest" is one of LATENCIES, by default the
+single-row latency of the compiled backend, which walks the trees like the
+compact backend that the Dockerfile serves. A
+bigger forest that is only as accurate as a small one is not worth its
+latency.
+"""
+
+import functools
+import io
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from joblib import dump, load
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import (
+    ParameterGrid,
+    ParameterSampler,
+    StratifiedKFold,
+    cross_val_score,
+)
+
+from compiled_model import CompiledModel, compile_artifacts
+from predictors import SklearnModel
+
+DEFAULT_GRID = {
+    "n_estimators": [10, 25, 50, 100, 200],
+    "max_depth": [None, 8, 16],
+    "min_samples_leaf": [1, 5, 20],
+    "max_features": ["sqrt", None],
+}
+
+# Measured for every candidate; any of them can decide
+LATENCIES = (
+    "compiled_single_us",
+    "compiled_batch_ms",
+    "sklearn_single_us",
+    "sklearn_batch_ms",
+)
+
+
+def candidates(grid=None, n_candidates=None, seed=42):
+    """The whole grid, or n_candidates configurations sampled from it."""
+    grid = grid or DEFAULT_GRID
+    if n_candidates and n_candidates < len(ParameterGrid(grid)):
+        return list(ParameterSampler(grid, n_candidates, random_state=seed))
+    return list(ParameterGrid(grid))
+
+
+def dump_bytes(model):
+    buffer = io.BytesIO()
+    dump(model, buffer)
+    return buffer.getvalue()
+
+
+def evaluate(params, X, y, cv, seed):
+    """CV accuracy of one configuration, and the model fit on all of X."""
+    model = RandomForestClassifier(random_state=seed, n_jobs=1, **params)
+    folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed)
+    scores = cross_val_score(model, X, y, cv=folds)
+    start = time.perf_counter()
+    model.fit(X, y)
+    fit_seconds = time.perf_counter() - start
+
+    return {
+        "params": params,
+        "cv_accuracy": float(scores.mean()),
+        "cv_accuracy_std": float(scores.std()),
+        "fit_seconds": fit_seconds,
+        # Pickled, which is also what it costs on disk
+        "model": dump_bytes(model),
+    }
+
+
+def median_seconds(run, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def measure_latency(predictor, crop_names, numeric, batch_size, repeats):
+    rows = np.arange(batch_size) % len(crop_names)
+    batch_crops = [crop_names[i] for i in rows]
+    batch_numeric = numeric[rows]
+    predictor.predict(crop_names[:1], numeric[:1])
+    return {
+        "single_us": median_seconds(
+            lambda: predictor.predict(crop_names[:1], numeric[:1]), repeats
+        )
+        * 1e6,
+        "batch_ms": median_seconds(
+            lambda: predictor.predict(batch_crops, batch_numeric),
+            max(3, repeats // 20),
+        )
+        * 1e3,
+    }
+
+
+def search(
+    X,
+    y,
+    scaler,
+    crop_label_encoder,
+    risk_label_encoder,
+    grid=None,
+    n_candidates=None,
+    cv=3,
+    tolerance=0.01,
+    select_by="compiled_single_us",
+    workers=1,
+    batch_size=1000,
+    repeats=200,
+    seed=42,
+):
+    """Evaluate the candidates on scaled training data X, y.
+
+    Returns (chosen fitted model, report). The report lists every candidate
+    with its accuracy, latencies and size, fastest first.
+    """
+    if select_by not in LATENCIES:
+        raise ValueError(f"unknown latency {select_by!r}")
+    configurations = candidates(grid, n_candidates, seed)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        run = functools.partial(evaluate, X=X, y=y, cv=cv, seed=seed)
+        results = list(pool.map(run, configurations))
+
+    # Readings as the service sees them: crop names and unscaled numbers
+    raw = scaler.inverse_transform(X)
+    crop_names = list(
+        crop_label_encoder.inverse_transform(np.rint(raw[:, 0]).astype(int))
+    )
+    numeric = raw[:, 1:]
+
+    models = []
+    for result in results:
+        pickled = result.pop("model")
+        model = load(io.BytesIO(pickled))
+        result["model_bytes"] = len(pickled)
+        result["nodes"] = int(sum(tree.tree_.node_count for tree in model.estimators_))
+        predictors = {
+            "sklearn": SklearnModel(
+                model, scaler, crop_label_encoder, risk_label_encoder
+            ),
+            "compiled": CompiledModel(
+                compile_artifacts(model, scaler, crop_label_encoder, risk_label_encoder)
+            ),
+        }
+        for name, predictor in predictors.items():
+            latency = measure_latency(
+                predictor, crop_names, numeric, batch_size, repeats
+            )
+            result[f"{name}_single_us"] = latency["single_us"]
+            result[f"{name}_batch_ms"] = latency["batch_ms"]
+        models.append(model)
+
+    best_accuracy = max(result["cv_accuracy"] for result in results)
+    eligible = [
+        i
+        for i, result in enumerate(results)
+        if result["cv_accuracy"] >= best_accuracy - tolerance
+    ]
+    chosen = min(
+        eligible, key=lambda i: (results[i][select_by], results[i]["model_bytes"])
+    )
+
+    order = sorted(range(len(results)), key=lambda i: results[i][select_by])
+    report = {
+        "select_by": select_by,
+        "tolerance": tolerance,
+        "cv_folds": cv,
+        "batch_size": batch_size,
+        "best_cv_accuracy": best_accuracy,
+        "chosen": results[chosen]["params"],
+        "candidates": [
+            {**results[i], "eligible": i in eligible, "chosen": i == chosen}
+            for i in order
+        ],
+    }
+    return models[chosen], report
+
+
+def write_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+
+def format_report(report):
+    """The candidates as a text table, fastest first."""
+    lines = [
+        f"{'':2}{'params':<72}{'cv acc':>8}{'±':>7}"
+        f"{'compiled µs':>13}{'batch ms':>10}{'sklearn µs':>12}{'batch ms':>10}"
+        f"{'size KiB':>10}"
+    ]
+    for result in report["candidates"]:
+        mark = "*" if result["chosen"] else (" " if result["eligible"] else "x")
+        params = ", ".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+        lines.append(
+            f"{mark:2}{params:<72}{result['cv_accuracy']:>8.4f}"
+            f"{result['cv_accuracy_std']:>7.4f}"
+            f"{result['compiled_single_us']:>13.1f}{result['compiled_batch_ms']:>10.2f}"
+            f"{result['sklearn_single_us']:>12.1f}{result['sklearn_batch_ms']:>10.2f}"
+            f"{result['model_bytes'] / 1024:>10.0f}"
+        )
+    lines.append(
+        f"* chosen (lowest {report['select_by']} within "
+        f"{report['tolerance']} of the best CV accuracy "
+        f"{report['best_cv_accuracy']:.4f}); x outside the tolerance"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,152 @@
+import datetime
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Reading scored for every crop before a new model is swapped in
+CANARY_READING = [25.0, 50.0, 60.0]
+
+
+def canary_check(predictor):
+    """Score one reading per known crop; raise if the predictor looks broken."""
+    crops = sorted(predictor.known_crops)
+    if not crops:
+        raise ValueError("model knows no crops")
+    readings = np.tile(CANARY_READING, (len(crops), 1))
+    risks = [str(risk) for risk in predictor.predict(crops, readings)]
+    if len(risks) != len(crops) or not all(risks):
+        raise ValueError(f"canary prediction returned {risks!r}")
+
+
+def directory_signature(directory):
+    """Cheap fingerprint of the model files, used to notice new artifacts."""
+    manifest = os.path.join(directory, "manifest.json")
+    # A bundle's manifest is written last, so it alone marks a complete update
+    names = (
+        [manifest]
+        if os.path.exists(manifest)
+        else sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.endswith((".joblib", ".npz"))
+        )
+    )
+    return tuple(
+        (name, os.stat(name).st_mtime_ns, os.stat(name).st_size) for name in names
+    )
+
+
+class ModelStore:
+    """Hold the active predictor and swap new ones in atomically.
+
+    `loader(directory)` builds a predictor. Requests call `current()` once and
+    use that predictor to the end, so a swap never changes the model under an
+    in-flight request and a request or batch never mixes two versions.
+    """
+
+    def __init__(self, loader, directory, on_swap=None):
+        self.loader = loader
+        self.directory = directory
+        # Called with each predictor once it is the current one
+        self.on_swap = on_swap
+        self._reload_lock = threading.Lock()
+        self._current = None
+        self.loaded_at = None
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error = None
+        self.reloading = False
+        self._watch_interval = None
+        self.load(directory)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A reload running in the parent may have held the lock, and its
+        # watcher thread is not copied into pre-forked workers
+        self._reload_lock = threading.Lock()
+        self.reloading = False
+        if self._watch_interval:
+            self.watch(self._watch_interval)
+
+    def current(self):
+        return self._current
+
+    def load(self, directory=None):
+        """Load, canary-check and swap in the artifacts in `directory`."""
+        directory = directory or self.directory
+        with self._reload_lock:
+            self.reloading = True
+            try:
+                predictor = self.loader(directory)
+                canary_check(predictor)
+            except Exception as e:
+                self.failed_reloads += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.exception("Failed to load model from %s", directory)
+                raise
+            finally:
+                self.reloading = False
+            previous = self._current
+            # A single reference assignment: readers see the old or the new model
+            self._current = predictor
+            self.directory = directory
+            self.loaded_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            self.last_error = None
+            if self.on_swap is not None:
+                self.on_swap(predictor)
+            if previous is not None:
+                self.reloads += 1
+                logger.info(
+                    "Swapped model %s -> %s", previous.version, predictor.version
+                )
+            return predictor.version
+
+    def reload_in_background(self, directory=None):
+        def run():
+            try:
+                self.load(directory)
+            except Exception:
+                pass  # already logged and recorded in last_error
+
+        thread = threading.Thread(target=run, name="model-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def watch(self, interval):
+        """Poll the model directory and reload whenever its files change."""
+        self._watch_interval = interval
+
+        def run():
+            seen = directory_signature(self.directory)
+            while not stop.wait(interval):
+                try:
+                    signature = directory_signature(self.directory)
+                except OSError:
+                    continue  # directory is being replaced; try again later
+                if signature != seen:
+                    seen = signature
+                    try:
+                        self.load()
+                    except Exception:
+                        pass  # keep serving the old model until the next change
+
+        stop = threading.Event()
+        thread = threading.Thread(target=run, name="model-watcher", daemon=True)
+        thread.start()
+        return stop
+
+    def status(self):
+        predictor = self._current
+        return {
+            "version": predictor.version,
+            "directory": self.directory,
+            "loaded_at": self.loaded_at,
+            "reloading": self.reloading,
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "last_error": self.last_error,
+        }
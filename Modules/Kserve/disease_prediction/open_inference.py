@@ -0,0 +1,365 @@
+"""Codec for the KServe v2 / Open Inference Protocol, with binary tensors.
+
+    python open_inference.py benchmark [--rows 10000] [--repeats 5]
+
+A request is a JSON header, optionally followed by raw tensor bytes. With the
+binary extension, the `Inference-Header-Content-Length` HTTP header gives the
+JSON length, and each binary input has a `binary_data_size` parameter. The
+input bytes follow the JSON in input order. Numeric tensors are little-endian
+and row-major. A BYTES element is a 4-byte little-endian length followed by
+that many bytes.
+
+inference.py serves the protocol under /v2. `benchmark` compares scoring a
+batch through /predict/batch with scoring it through the v2 endpoint, using
+JSON tensors and binary tensors.
+"""
+
+import argparse
+import json
+import struct
+import sys
+import time
+
+import numpy as np
+
+HEADER_LENGTH = "Inference-Header-Content-Length"
+
+# Prefix of each BYTES element
+ELEMENT_LENGTH = struct.Struct("<I")
+
+NUMPY_DTYPES = {
+    "BOOL": np.dtype("?"),
+    "UINT8": np.dtype("<u1"),
+    "UINT16": np.dtype("<u2"),
+    "UINT32": np.dtype("<u4"),
+    "UINT64": np.dtype("<u8"),
+    "INT8": np.dtype("<i1"),
+    "INT16": np.dtype("<i2"),
+    "INT32": np.dtype("<i4"),
+    "INT64": np.dtype("<i8"),
+    "FP16": np.dtype("<f2"),
+    "FP32": np.dtype("<f4"),
+    "FP64": np.dtype("<f8"),
+}
+
+
+class ProtocolError(ValueError):
+    """A malformed inference request; reported to the client as a 400."""
+
+
+def element_count(shape):
+    if not isinstance(shape, list) or not all(
+        isinstance(dim, int) and dim >= 0 for dim in shape
+    ):
+        raise ProtocolError(f"invalid shape {shape!r}")
+    return int(np.prod(shape, dtype=np.int64))
+
+
+def decode_bytes_elements(raw):
+    """Split length-prefixed BYTES elements into a list of str."""
+    raw = bytes(raw)
+    elements = []
+    # Crop names repeat, so each distinct value is decoded once
+    decoded = {}
+    offset = 0
+    while offset < len(raw):
+        if offset + 4 > len(raw):
+            raise ProtocolError("truncated BYTES tensor")
+        (length,) = ELEMENT_LENGTH.unpack_from(raw, offset)
+        offset += 4
+        if offset + length > len(raw):
+            raise ProtocolError("truncated BYTES tensor")
+        chunk = raw[offset : offset + length]
+        offset += length
+        element = decoded.get(chunk)
+        if element is None:
+            try:
+                element = decoded[chunk] = chunk.decode("utf-8")
+            except UnicodeDecodeError:
+                raise ProtocolError("BYTES element is not UTF-8") from None
+        elements.append(element)
+    return elements
+
+
+def encode_bytes_elements(elements):
+    chunks = []
+    for element in elements:
+        data = element.encode("utf-8") if isinstance(element, str) else element
+        chunks.append(ELEMENT_LENGTH.pack(len(data)))
+        chunks.append(data)
+    return b"".join(chunks)
+
+
+def decode_tensor(spec, raw=None):
+    """Return a tensor as an ndarray, or a list of str for BYTES.
+
+    `raw` holds the tensor's binary data; without it the values are read from
+    the JSON `data` field.
+    """
+    datatype = spec.get("datatype")
+    count = element_count(spec.get("shape"))
+    if raw is None and spec.get("data") is None:
+        raise ProtocolError(f"{spec['name']}: no data and no binary_data_size")
+    if datatype == "BYTES":
+        if raw is not None:
+            elements = decode_bytes_elements(raw)
+        else:
+            elements = np.ravel(np.asarray(spec.get("data"), dtype=object)).tolist()
+            if not all(isinstance(element, str) for element in elements):
+                raise ProtocolError(f"{spec['name']}: BYTES data must be strings")
+        if len(elements) != count:
+            raise ProtocolError(
+                f"{spec['name']}: shape {spec['shape']} needs {count} elements, "
+                f"got {len(elements)}"
+            )
+        return elements
+
+    if datatype not in NUMPY_DTYPES:
+        raise ProtocolError(f"{spec['name']}: unsupported datatype {datatype!r}")
+    dtype = NUMPY_DTYPES[datatype]
+    if raw is not None:
+        if len(raw) != count * dtype.itemsize:
+            raise ProtocolError(
+                f"{spec['name']}: expected {count * dtype.itemsize} bytes, "
+                f"got {len(raw)}"
+            )
+        # A view over the request body; no per-element Python objects
+        return np.frombuffer(raw, dtype=dtype).reshape(spec["shape"])
+    # Parse the JSON values as they are first: casting straight to `dtype`
+    # would also accept strings such as "25", and wrap or truncate integers
+    try:
+        values = np.asarray(spec["data"])
+    except ValueError:
+        raise ProtocolError(f"{spec['name']}: data is not {datatype}") from None
+    if values.size:
+        if values.dtype.kind not in ("b" if dtype.kind == "b" else "iuf"):
+            raise ProtocolError(f"{spec['name']}: data is not {datatype}")
+        with np.errstate(invalid="ignore", over="ignore"):
+            array = values.astype(dtype)
+        if dtype.kind in "iu" and not np.array_equal(array, values):
+            raise ProtocolError(f"{spec['name']}: data is not {datatype}")
+    else:
+        array = values.astype(dtype)
+    if array.size != count:
+        raise ProtocolError(
+            f"{spec['name']}: shape {spec['shape']} needs {count} elements, "
+            f"got {array.size}"
+        )
+    return array.reshape(spec["shape"])
+
+
+def parameters_of(obj, where):
+    """The `parameters` object of a request, input or output, or {}."""
+    parameters = obj.get("parameters")
+    if parameters is None:
+        return {}
+    if not isinstance(parameters, dict):
+        raise ProtocolError(f"{where}: parameters must be an object")
+    return parameters
+
+
+def decode_request(body, header_length=None):
+    """Parse a request body into (header, {input name: tensor})."""
+    body = memoryview(body)
+    if header_length is None:
+        header_length = len(body)
+    if not 0 < header_length <= len(body):
+        raise ProtocolError(f"invalid {HEADER_LENGTH}: {header_length}")
+    try:
+        header = json.loads(bytes(body[:header_length]))
+    except ValueError as e:
+        raise ProtocolError(f"invalid JSON header: {e}") from None
+    if not isinstance(header, dict) or not isinstance(header.get("inputs"), list):
+        raise ProtocolError("request needs an 'inputs' list")
+
+    tensors = {}
+    offset = header_length
+    parameters_of(header, "request")
+    for spec in header["inputs"]:
+        if not isinstance(spec, dict) or not isinstance(spec.get("name"), str):
+            raise ProtocolError("every input needs a string name")
+        if spec["name"] in tensors:
+            raise ProtocolError(f"{spec['name']}: input given twice")
+        size = parameters_of(spec, spec["name"]).get("binary_data_size")
+        raw = None
+        if size is not None:
+            if isinstance(size, bool) or not isinstance(size, int) or size < 0:
+                raise ProtocolError(f"{spec['name']}: invalid binary_data_size")
+            if offset + size > len(body):
+                raise ProtocolError(f"{spec['name']}: binary data runs past the body")
+            raw = body[offset : offset + size]
+            offset += size
+        tensors[spec["name"]] = decode_tensor(spec, raw)
+    if offset != len(body):
+        raise ProtocolError(f"{len(body) - offset} unexpected bytes after the inputs")
+    return header, tensors
+
+
+def wants_binary(header, name):
+    """Whether the client asked for output `name` as binary data."""
+    binary = parameters_of(header, "request").get("binary_data_output", False)
+    outputs = header.get("outputs") or []
+    if not isinstance(outputs, list):
+        raise ProtocolError("outputs must be a list")
+    for output in outputs:
+        if isinstance(output, dict) and output.get("name") == name:
+            binary = parameters_of(output, name).get("binary_data", binary)
+    return bool(binary)
+
+
+def encode_tensor(name, datatype, data, binary=False):
+    """Return (JSON spec, raw bytes or None) for a list or array of values."""
+    if datatype == "BYTES":
+        spec = {"name": name, "datatype": datatype, "shape": [len(data)]}
+        if binary:
+            return spec, encode_bytes_elements(data)
+        spec["data"] = list(data)
+        return spec, None
+    array = np.ascontiguousarray(data, dtype=NUMPY_DTYPES[datatype])
+    spec = {"name": name, "datatype": datatype, "shape": list(array.shape)}
+    if binary:
+        return spec, array.tobytes()
+    spec["data"] = array.ravel().tolist()
+    return spec, None
+
+
+def encode_message(header, tensors, key, binary_names=()):
+    """Serialize a request or response; returns (body bytes, header length).
+
+    `tensors` is a list of (name, datatype, data) and is written under `key`
+    ("inputs" or "outputs"). The tensors in `binary_names` go after the JSON
+    as raw bytes, and the others go inline as JSON `data`. The header length
+    is None when nothing is binary; the body is then plain JSON.
+    """
+    specs = []
+    chunks = []
+    for name, datatype, data in tensors:
+        spec, raw = encode_tensor(name, datatype, data, name in binary_names)
+        if raw is not None:
+            spec["parameters"] = {"binary_data_size": len(raw)}
+            chunks.append(raw)
+        specs.append(spec)
+    body = json.dumps({**header, key: specs}).encode("utf-8")
+    if not chunks:
+        return body, None
+    return b"".join([body, *chunks]), len(body)
+
+
+def best_ms(run, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000.0
+
+
+def benchmark(rows=10000, repeats=5):
+    """Time one batch through /predict/batch and through /v2, JSON and binary.
+
+    "decode" is the time to turn the body into crop names and a float matrix,
+    the way each endpoint does it, and "total" is the whole request.
+    """
+    from inference import FEATURES, MODEL_NAME, app, model_store
+    from json_codec import batch_columns, to_float
+
+    rng = np.random.default_rng(0)
+    crop_names = rng.choice(sorted(model_store.current().known_crops), rows).tolist()
+    numeric = rng.uniform([-10.0, 0.0, 0.0], [50.0, 100.0, 100.0], size=(rows, 3))
+    columns = dict(zip(FEATURES, [crop_names, *numeric.T.tolist()]))
+    tensors = [("crop_name", "BYTES", crop_names)] + [
+        (feature, "FP64", numeric[:, i]) for i, feature in enumerate(FEATURES[1:])
+    ]
+    infer_url = f"/v2/models/{MODEL_NAME}/infer"
+
+    def decode_columns(body):
+        batch = batch_columns(json.loads(body))
+        return (
+            batch["crop_name"],
+            np.array(
+                [
+                    [to_float(feature, value) for value in batch[feature]]
+                    for feature in FEATURES[1:]
+                ]
+            ).T,
+        )
+
+    def decode_tensors(body, header_length=None):
+        _, decoded = decode_request(body, header_length)
+        return decoded["crop_name"], np.column_stack(
+            [decoded[feature] for feature in FEATURES[1:]]
+        )
+
+    json_body, _ = encode_message({}, tensors, "inputs")
+    binary_body, binary_length = encode_message(
+        {"parameters": {"binary_data_output": True}},
+        tensors,
+        "inputs",
+        binary_names=FEATURES,
+    )
+    batch_body = json.dumps(columns).encode("utf-8")
+    cases = {
+        "/predict/batch (JSON columns)": (
+            "/predict/batch",
+            batch_body,
+            {"Content-Type": "application/json"},
+            lambda: decode_columns(batch_body),
+        ),
+        "/v2 infer (JSON tensors)": (
+            infer_url,
+            json_body,
+            {"Content-Type": "application/json"},
+            lambda: decode_tensors(json_body),
+        ),
+        "/v2 infer (binary tensors)": (
+            infer_url,
+            binary_body,
+            {
+                "Content-Type": "application/octet-stream",
+                HEADER_LENGTH: str(binary_length),
+            },
+            lambda: decode_tensors(binary_body, binary_length),
+        ),
+    }
+
+    client = app.test_client()
+    results = {}
+    for label, (url, body, headers, decode) in cases.items():
+        response = client.post(url, data=body, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f"{label}: {response.status_code} {response.data}")
+        results[label] = {
+            "request_bytes": len(body),
+            "response_bytes": len(response.data),
+            "decode_ms": best_ms(decode, repeats),
+            "total_ms": best_ms(
+                lambda: client.post(url, data=body, headers=headers), repeats
+            ),
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench = commands.add_parser("benchmark", help="compare JSON and binary batches")
+    bench.add_argument("--rows", type=int, default=10000)
+    bench.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.rows, args.repeats)
+    print(
+        f"{'endpoint':<32}{'request KiB':>12}{'response KiB':>14}"
+        f"{'decode ms':>11}{'total ms':>10}"
+    )
+    for label, result in results.items():
+        print(
+            f"{label:<32}{result['request_bytes'] / 1024:>12.1f}"
+            f"{result['response_bytes'] / 1024:>14.1f}"
+            f"{result['decode_ms']:>11.2f}{result['total_ms']:>10.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Train the disease risk model one shard at a time.
+
+Used by `disease_prediction.py --data DIR --out-of-core` for datasets written
+by synthetic_data.py that do not fit in memory. Only one shard of rows is
+loaded at a time, so the training data in memory is bounded by the shard
+size rather than by the dataset. The forest is not: every fitted tree stays
+in memory until the end, so the model's own memory grows with the number and
+size of the trees (--min-samples-leaf keeps them small):
+
+1. The label encoders are fit to the union of the crops and risk levels seen
+   in every shard.
+2. The StandardScaler is fit with running statistics (`partial_fit`).
+3. The random forest grows with `warm_start`: each shard adds its share of
+   the n_estimators trees, fit on that shard alone. With more shards than
+   trees, some shards add none, and their rows only feed steps 1-2. The result is an ordinary
+   RandomForestClassifier, so the artifacts are the same as in-memory
+   training writes, and the compiled backend and the bundle work unchanged.
+
+In every shard, the same seeded fraction of rows is held out from steps 2-3
+for evaluation, as train_test_split does in memory.
+"""
+
+import logging
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+from synthetic_data import NUMERIC_FEATURES, iter_frames
+
+logger = logging.getLogger(__name__)
+
+
+def holdout_mask(n_rows, shard_index, test_size, seed):
+    """Rows of one shard held out for evaluation; the same on every pass."""
+    rng = np.random.default_rng([seed, shard_index])
+    return rng.random(n_rows) < test_size
+
+
+def fit_label_encoders(directory, max_rows=None):
+    crops, risk_levels = set(), set()
+    for frame in iter_frames(directory, max_rows):
+        crops.update(frame["crop_name"].unique())
+        risk_levels.update(frame["disease_risk"].unique())
+    crop_label_encoder = LabelEncoder().fit(sorted(crops))
+    risk_label_encoder = LabelEncoder().fit(sorted(risk_levels))
+    return crop_label_encoder, risk_label_encoder
+
+
+def iter_encoded(
+    directory, crop_label_encoder, risk_label_encoder, test_size, seed, max_rows
+):
+    """(X, y, test mask) per shard, with X laid out like in-memory training."""
+    for index, frame in enumerate(iter_frames(directory, max_rows)):
+        X = np.empty((len(frame), 1 + len(NUMERIC_FEATURES)), dtype=np.float64)
+        X[:, 0] = crop_label_encoder.transform(frame["crop_name"])
+        X[:, 1:] = frame[NUMERIC_FEATURES].to_numpy()
+        y = risk_label_encoder.transform(frame["disease_risk"])
+        yield X, y, holdout_mask(len(frame), index, test_size, seed)
+
+
+def trees_per_shard(n_estimators, n_shards):
+    """Spread n_estimators evenly over the shards; they add up to exactly
+    n_estimators, so with more shards than trees some shards get none."""
+    return [
+        n_estimators * (i + 1) // n_shards - n_estimators * i // n_shards
+        for i in range(n_shards)
+    ]
+
+
+def train(
+    directory,
+    n_estimators=100,
+    max_rows=None,
+    test_size=0.2,
+    seed=42,
+    **forest_params,
+):
+    """Fit the encoders, scaler and forest on the shards in `directory`.
+
+    Returns (model, scaler, crop_label_encoder, risk_label_encoder, y_test,
+    y_pred), where y_test and y_pred cover the held-out rows.
+    """
+    crop_label_encoder, risk_label_encoder = fit_label_encoders(directory, max_rows)
+    n_classes = len(risk_label_encoder.classes_)
+
+    def shards():
+        return iter_encoded(
+            directory,
+            crop_label_encoder,
+            risk_label_encoder,
+            test_size,
+            seed,
+            max_rows,
+        )
+
+    scaler = StandardScaler()
+    n_shards = 0
+    for X, _, test in shards():
+        scaler.partial_fit(X[~test])
+        n_shards += 1
+
+    model = RandomForestClassifier(
+        n_estimators=0, random_state=seed, warm_start=True, **forest_params
+    )
+    for index, ((X, y, test), n_trees) in enumerate(
+        zip(shards(), trees_per_shard(n_estimators, n_shards))
+    ):
+        if not n_trees:
+            continue
+        y_train = y[~test]
+        # Every tree has to see every class, or their probabilities would not
+        # line up in one forest
+        if np.unique(y_train).size != n_classes:
+            raise ValueError(
+                f"shard {index} lacks some risk levels; "
+                "use larger shards or fewer, bigger chunks"
+            )
+        model.n_estimators += n_trees
+        model.fit(scaler.transform(X[~test]), y_train)
+        logger.info(
+            "Shard %d/%d: %d rows, %d trees so far",
+            index + 1,
+            n_shards,
+            len(y_train),
+            len(model.estimators_),
+        )
+
+    y_test, y_pred = [], []
+    for X, y, test in shards():
+        y_test.append(y[test])
+        y_pred.append(model.predict(scaler.transform(X[test])))
+    return (
+        model,
+        scaler,
+        crop_label_encoder,
+        risk_label_encoder,
+        np.concatenate(y_test),
+        np.concatenate(y_pred),
+    )
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional time-to-live per entry."""
+
+    def __init__(self, max_size=10000, ttl=None, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def retain(self, version):
+        """Drop the entries of other model versions, once `version` is live.
+
+        Keys start with the model version. Requests still running on the old
+        model may add a few old entries afterwards; nothing reads them, so
+        they are the first to be evicted.
+        """
+        with self._lock:
+            if version != self.version:
+                for key in [key for key in self._entries if key[0] != version]:
+                    del self._entries[key]
+                self.version = version
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_version": self.version,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class CachedPredictor:
+    """Serve repeated readings from an LRUCache in front of another predictor.
+
+    Keys are (model version, crop_name, temperature, humidity, soil_moisture),
+    so an answer is never reused once different artifacts are loaded, and
+    requests on the old and the new model share the cache during a swap
+    without emptying it. Old entries go once the new version is swapped in
+    (LRUCache.retain). With `round_digits` the numeric features are rounded
+    before lookup and before scoring, so the cached answer is exactly the
+    model's answer for the key.
+    """
+
+    def __init__(self, predictor, cache, round_digits=None):
+        self.predictor = predictor
+        self.cache = cache
+        self.round_digits = round_digits
+        self.known_crops = predictor.known_crops
+        self.version = predictor.version
+
+    def predict(self, crop_names, numeric):
+        version = self.predictor.version
+        numeric = np.asarray(numeric, dtype=np.float64)
+        if self.round_digits is not None:
+            numeric = np.round(numeric, self.round_digits)
+        keys = [
+            (version, crop, *row) for crop, row in zip(crop_names, numeric.tolist())
+        ]
+
+        risks = [self.cache.get(key) for key in keys]
+        miss = [i for i, risk in enumerate(risks) if risk is None]
+        if miss:
+            fresh = self.predictor.predict([crop_names[i] for i in miss], numeric[miss])
+            for i, risk in zip(miss, fresh):
+                risk = str(risk)
+                self.cache.put(keys[i], risk)
+                risks[i] = risk
+        return np.asarray(risks, dtype=object)
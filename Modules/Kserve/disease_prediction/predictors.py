@@ -0,0 +1,85 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+from joblib import load
+
+from compiled_model import CompiledModel
+from metrics import record_model_stages
+from runtime import serving_n_jobs
+
+SKLEARN_ARTIFACTS = [
+    "model.joblib",
+    "scaler.joblib",
+    "crop_label_encoder.joblib",
+    "risk_label_encoder.joblib",
+]
+
+
+def file_digest(paths):
+    """Short content hash of a set of files, used as the model version."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class SklearnModel:
+    """The four sklearn artifacts behind the same interface as CompiledModel."""
+
+    def __init__(self, model, scaler, crop_label_encoder, risk_label_encoder):
+        self.model = model
+        self.scaler = scaler
+        self.crop_label_encoder = crop_label_encoder
+        self.risk_label_encoder = risk_label_encoder
+        self.known_crops = set(crop_label_encoder.classes_)
+
+    @classmethod
+    def load(cls, directory=".", mmap_mode=None):
+        model, *encoders = (
+            load(os.path.join(directory, name), mmap_mode=mmap_mode)
+            for name in SKLEARN_ARTIFACTS
+        )
+        # n_jobs is pickled with the model, i.e. sized for the training
+        # machine. Only a model loaded here is ours to change; one passed to
+        # the constructor belongs to the caller, e.g. a search candidate.
+        if hasattr(model, "n_jobs"):
+            model.n_jobs = serving_n_jobs()
+        return cls(model, *encoders)
+
+    def predict(self, crop_names, numeric):
+        """Return the risk label for each (crop name, numeric features) row."""
+        start = time.perf_counter()
+        crop_encoded = self.crop_label_encoder.transform(crop_names)
+        encoded = time.perf_counter()
+        features = self.scaler.transform(np.column_stack([crop_encoded, numeric]))
+        scaled = time.perf_counter()
+        codes = self.model.predict(features)
+        scored = time.perf_counter()
+        risks = self.risk_label_encoder.inverse_transform(codes)
+        record_model_stages(start, encoded, scaled, scored, time.perf_counter())
+        return risks
+
+
+def load_predictor(backend="sklearn", directory=".", verify=False):
+    # A directory with a manifest is a model bundle written by model_bundle.py;
+    # `verify` checks its files against the manifest checksums first
+    if os.path.exists(os.path.join(directory, "manifest.json")):
+        from model_bundle import load_bundle
+
+        return load_bundle(directory, backend, verify=verify)
+
+    # The compiled backend only needs NumPy, so sklearn is never imported
+    if backend == "compiled":
+        paths = [os.path.join(directory, "compiled_model.npz")]
+        predictor = CompiledModel.load(paths[0])
+    elif backend == "sklearn":
+        paths = [os.path.join(directory, name) for name in SKLEARN_ARTIFACTS]
+        predictor = SklearnModel.load(directory)
+    else:
+        raise ValueError(f"unknown model backend {backend!r}")
+    predictor.version = file_digest(paths)
+    return predictor
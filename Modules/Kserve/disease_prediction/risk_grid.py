@@ -0,0 +1,222 @@
+"""Precompute disease-risk predictions over a quantized grid of readings.
+
+    python risk_grid.py build  [--backend sklearn] [--temperature -20:60:0.5] ...
+    python risk_grid.py verify [--backend compiled] [--report grid_report.json]
+
+`build` scores every (crop, temperature, humidity, soil_moisture) cell and
+writes risk_grid.npy (one uint8 risk code per cell) plus risk_grid.json (grid
+bounds, steps and labels). `verify` re-scores every cell with the model and
+lists the cells where the grid disagrees with it.
+
+inference.py serves from the grid when RISK_GRID points at it; the .npy is
+memory-mapped and each on-grid reading is answered with one index lookup.
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+NUMERIC_FEATURES = ["temperature", "humidity", "soil_moisture"]
+DEFAULT_AXES = {
+    "temperature": (-20.0, 60.0, 0.5),
+    "humidity": (0.0, 100.0, 1.0),
+    "soil_moisture": (0.0, 100.0, 1.0),
+}
+# Grid values are rounded to this many decimals so that a step of 0.1 gives
+# 0.3 (what a client sends) rather than 0.30000000000000004
+DECIMALS = 9
+
+
+def axis_values(low, step, size):
+    return np.round(low + np.arange(size) * step, DECIMALS)
+
+
+class RiskGrid:
+    """A memory-mapped (crop, temperature, humidity, soil_moisture) risk table."""
+
+    def __init__(self, codes, meta):
+        self.codes = codes
+        self.crop_index = {crop: i for i, crop in enumerate(meta["crop_classes"])}
+        self.risk_classes = np.asarray(meta["risk_classes"])
+        self.low = np.array([meta["axes"][name][0] for name in NUMERIC_FEATURES])
+        self.step = np.array([meta["axes"][name][2] for name in NUMERIC_FEATURES])
+        self.shape = np.array(codes.shape[1:])
+        self.model_version = meta.get("model_version")
+
+    @classmethod
+    def load(cls, prefix="risk_grid"):
+        with open(f"{prefix}.json") as f:
+            meta = json.load(f)
+        return cls(np.load(f"{prefix}.npy", mmap_mode="r"), meta)
+
+    def lookup(self, crop_names, numeric):
+        """Return (risks, on_grid); risks is only meaningful where on_grid."""
+        numeric = np.asarray(numeric, dtype=np.float64).reshape(-1, 3)
+        crops = np.array([self.crop_index.get(crop, -1) for crop in crop_names])
+        index = np.rint((numeric - self.low) / self.step)
+        in_bounds = np.all((index >= 0) & (index < self.shape), axis=1)
+        index = np.where(in_bounds[:, None], index, 0).astype(np.int64)
+        # Only readings that sit exactly on a grid point are answered from it
+        snapped = np.round(self.low + index * self.step, DECIMALS)
+        on_grid = (crops >= 0) & in_bounds & np.all(snapped == numeric, axis=1)
+
+        risks = np.empty(len(crops), dtype=self.risk_classes.dtype)
+        hit = np.flatnonzero(on_grid)
+        codes = self.codes[crops[hit], index[hit, 0], index[hit, 1], index[hit, 2]]
+        risks[hit] = self.risk_classes[codes]
+        return risks, on_grid
+
+
+class GridPredictor:
+    """Answer on-grid readings from a RiskGrid and the rest from `fallback`."""
+
+    def __init__(self, grid, fallback):
+        self.grid = grid
+        self.fallback = fallback
+        self.known_crops = fallback.known_crops
+        self.version = fallback.version
+
+    def predict(self, crop_names, numeric):
+        risks, on_grid = self.grid.lookup(crop_names, numeric)
+        if on_grid.all():
+            return risks
+        risks = risks.astype(object)
+        miss = np.flatnonzero(~on_grid)
+        risks[miss] = self.fallback.predict(
+            [crop_names[i] for i in miss], np.asarray(numeric)[miss]
+        )
+        return risks
+
+
+def score_cells(predictor, crop, axes):
+    """Yield (temperature index, risk labels for that humidity x soil slab)."""
+    temperature, humidity, soil_moisture = axes
+    rest = np.stack(np.meshgrid(humidity, soil_moisture, indexing="ij"), axis=-1)
+    rest = rest.reshape(-1, 2)
+    crop_names = [crop] * len(rest)
+    for t, value in enumerate(temperature):
+        numeric = np.column_stack([np.full(len(rest), value), rest])
+        risks = predictor.predict(crop_names, numeric)
+        yield t, np.asarray(risks).reshape(len(humidity), len(soil_moisture))
+
+
+def grid_axes(meta):
+    return [
+        axis_values(low, step, int(round((high - low) / step)) + 1)
+        for low, high, step in (meta["axes"][name] for name in NUMERIC_FEATURES)
+    ]
+
+
+def build(predictor, axes, prefix="risk_grid"):
+    crop_classes = sorted(predictor.known_crops)
+    meta = {
+        "crop_classes": crop_classes,
+        "axes": axes,
+        "model_version": getattr(predictor, "version", None),
+    }
+    values = grid_axes(meta)
+
+    shape = (len(crop_classes),) + tuple(len(axis) for axis in values)
+    codes = np.lib.format.open_memmap(
+        f"{prefix}.npy", mode="w+", dtype=np.uint8, shape=shape
+    )
+    # Risk labels get uint8 codes in the order the model first returns them
+    risk_index = {}
+    for c, crop in enumerate(crop_classes):
+        for t, risks in score_cells(predictor, crop, values):
+            labels, inverse = np.unique(risks, return_inverse=True)
+            label_codes = np.array(
+                [
+                    risk_index.setdefault(str(label), len(risk_index))
+                    for label in labels
+                ],
+                dtype=np.uint8,
+            )
+            codes[c, t] = label_codes[inverse].reshape(risks.shape)
+    codes.flush()
+
+    meta["risk_classes"] = sorted(risk_index, key=risk_index.get)
+    with open(f"{prefix}.json", "w") as f:
+        json.dump(meta, f, indent=2)
+    return shape
+
+
+def verify(grid, predictor, meta, max_listed=100):
+    """Compare every grid cell with the model and describe the disagreements."""
+    values = grid_axes(meta)
+    mismatches = []
+    n_mismatches = 0
+    for crop, c in grid.crop_index.items():
+        for t, risks in score_cells(predictor, crop, values):
+            stored = grid.risk_classes[grid.codes[c, t]]
+            for h, s in zip(*np.nonzero(stored != risks)):
+                n_mismatches += 1
+                if len(mismatches) < max_listed:
+                    mismatches.append(
+                        {
+                            "crop_name": crop,
+                            "temperature": float(values[0][t]),
+                            "humidity": float(values[1][h]),
+                            "soil_moisture": float(values[2][s]),
+                            "grid": str(stored[h, s]),
+                            "model": str(risks[h, s]),
+                        }
+                    )
+    return {
+        "cells": int(grid.codes.size),
+        "mismatches": n_mismatches,
+        "listed": mismatches,
+    }
+
+
+def parse_axis(text):
+    low, high, step = (float(part) for part in text.split(":"))
+    if step <= 0 or high < low:
+        raise argparse.ArgumentTypeError("expected LOW:HIGH:STEP with STEP > 0")
+    return (low, high, step)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("--prefix", default="risk_grid")
+    parser.add_argument("--backend", default="sklearn")
+    parser.add_argument(
+        "--model-dir", default=".", help="Model bundle or .joblib directory"
+    )
+    for name in NUMERIC_FEATURES:
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=parse_axis,
+            default=DEFAULT_AXES[name],
+            metavar="LOW:HIGH:STEP",
+        )
+    parser.add_argument("--report", help="Write the verification report here")
+    args = parser.parse_args(argv)
+
+    from predictors import load_predictor
+
+    predictor = load_predictor(args.backend, args.model_dir)
+    if args.command == "build":
+        axes = {name: getattr(args, name) for name in NUMERIC_FEATURES}
+        shape = build(predictor, axes, args.prefix)
+        print(f"Built {args.prefix}.npy with shape {shape}")
+        return 0
+
+    grid = RiskGrid.load(args.prefix)
+    with open(f"{args.prefix}.json") as f:
+        meta = json.load(f)
+    report = verify(grid, predictor, meta)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"Checked {report['cells']} cells: {report['mismatches']} mismatches")
+    for cell in report["listed"]:
+        print(json.dumps(cell))
+    return 1 if report["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
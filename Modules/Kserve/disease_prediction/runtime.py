@@ -0,0 +1,174 @@
+"""What the container may really use: CPU quota, memory limit, thread pools.
+
+os.cpu_count() reports the node's CPUs, not the pod's limit. On a large node
+with `cpu: 0.5` in deployment.yaml, BLAS, OpenMP and joblib would each start
+dozens of threads that then fight over half a CPU. This module reads the
+cgroup v1/v2 limits and sizes the pools from them. It must not import NumPy,
+because configure_threads() only works before NumPy loads its BLAS library.
+"""
+
+import logging
+import math
+import os
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# Environment variables read by BLAS/OpenMP libraries when they load, and by
+# joblib's process pool
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "LOKY_MAX_CPU_COUNT",
+]
+
+# Memory limits at or above this are the "unlimited" sentinel of cgroup v1
+UNLIMITED_MEMORY = 1 << 60
+
+logger = logging.getLogger(__name__)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_dirs(controller, root=CGROUP_ROOT):
+    """Candidate directories for `controller` ("" for cgroup v2), most specific
+    first: this process's own cgroup, then the root of the mount."""
+    dirs = []
+    for line in (_read("/proc/self/cgroup") or "").splitlines():
+        _, controllers, path = line.split(":", 2)
+        if controller in controllers.split(",") or controllers == controller:
+            base = os.path.join(root, controller) if controller else root
+            dirs.append(os.path.join(base, path.lstrip("/")))
+    dirs.append(os.path.join(root, controller) if controller else root)
+    return dirs
+
+
+def cgroup_cpu_limit(root=CGROUP_ROOT):
+    """CPUs granted by the cgroup CPU quota, or None when there is no quota."""
+    # cgroup v2: "<quota> <period>", with "max" meaning unlimited
+    for directory in cgroup_dirs("", root):
+        cpu_max = _read(os.path.join(directory, "cpu.max"))
+        if cpu_max:
+            quota, period = cpu_max.split()[:2]
+            return None if quota == "max" else int(quota) / int(period)
+
+    # cgroup v1: the quota is -1 when unlimited
+    for controller in ("cpu", "cpu,cpuacct"):
+        for directory in cgroup_dirs(controller, root):
+            quota = _read(os.path.join(directory, "cpu.cfs_quota_us"))
+            period = _read(os.path.join(directory, "cpu.cfs_period_us"))
+            if quota and period:
+                return int(quota) / int(period) if int(quota) > 0 else None
+    return None
+
+
+def cgroup_memory_limit(root=CGROUP_ROOT):
+    """Bytes allowed by the cgroup memory limit, or None when unlimited."""
+    for directory in cgroup_dirs("", root):
+        limit = _read(os.path.join(directory, "memory.max"))
+        if limit:
+            return None if limit == "max" else int(limit)
+    for directory in cgroup_dirs("memory", root):
+        limit = _read(os.path.join(directory, "memory.limit_in_bytes"))
+        if limit:
+            return int(limit) if int(limit) < UNLIMITED_MEMORY else None
+    return None
+
+
+def available_cpus():
+    """CPUs this process can really use: the affinity mask capped by the quota."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    return min(cpus, limit) if limit else cpus
+
+
+def cpu_threads():
+    """Threads a compute pool should use: whole CPUs of quota, at least one."""
+    return max(1, math.floor(available_cpus()))
+
+
+def training_n_jobs():
+    """n_jobs for scikit-learn estimators, instead of -1 (every node CPU)."""
+    return cpu_threads()
+
+
+def serving_n_jobs():
+    """n_jobs for a loaded model: the per-process threads set by
+    configure_threads(), since requests already run in parallel."""
+    return int(os.environ.get("OMP_NUM_THREADS") or cpu_threads())
+
+
+def process_rss():
+    """Resident memory of this process, in bytes."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def default_workers(worker_memory=None):
+    """One serving process per CPU of quota, and at least one.
+
+    With `worker_memory` (bytes one worker may need), the count is also
+    capped so that the workers fit in the cgroup memory limit.
+    """
+    workers = max(1, math.ceil(available_cpus()))
+    limit = cgroup_memory_limit()
+    if worker_memory and limit:
+        workers = max(1, min(workers, limit // worker_memory))
+    return workers
+
+
+def configure_threads(threads=None):
+    """Cap BLAS/OpenMP/joblib thread pools; call before importing NumPy.
+
+    Variables that are already set are left alone, so the deployment can
+    still override them. Returns the thread count in effect.
+    """
+    threads = threads or cpu_threads()
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+    return int(os.environ["OMP_NUM_THREADS"])
+
+
+def runtime_config():
+    limit = cgroup_cpu_limit()
+    memory = cgroup_memory_limit()
+    config = {
+        "node_cpus": os.cpu_count(),
+        "cpu_quota": limit,
+        "available_cpus": available_cpus(),
+        "memory_limit_mib": memory / 2**20 if memory else None,
+        "cpu_threads": cpu_threads(),
+        "thread_env": {name: os.environ.get(name) for name in THREAD_ENV_VARS},
+    }
+    try:
+        from threadpoolctl import threadpool_info
+    except ImportError:
+        pass
+    else:
+        # The pools actually loaded so far, e.g. OpenBLAS from NumPy
+        config["threadpools"] = [
+            f"{pool['internal_api']}={pool['num_threads']}"
+            for pool in threadpool_info()
+        ]
+    return config
+
+
+def log_runtime_config(log=logger, **extra):
+    config = {**runtime_config(), **extra}
+    log.info(
+        "Runtime: %s",
+        ", ".join(f"{name}={value}" for name, value in config.items()),
+    )
+    return config
@@ -0,0 +1,203 @@
+"""Pre-fork production server for the disease prediction API.
+
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 8082]
+
+The master process imports inference.py once, so the artifacts are loaded
+once, freezes the garbage collector and forks N workers that accept on the
+same listening socket. The workers share the model's memory pages
+copy-on-write; gc.freeze() keeps the collector from writing to the objects
+loaded before the fork and un-sharing their pages. With the compiled backend
+the arrays are memory-mapped files, so they are shared through the page cache
+as well.
+
+N defaults to the container's cgroup CPU quota, rounded up, and is capped so
+that N copies of the loaded master fit in the memory limit (see runtime.py).
+It can be set with --workers or SERVE_WORKERS. The master restarts workers
+that die and forwards SIGTERM/SIGINT to them on shutdown.
+
+POST /admin/reload reaches one worker. That worker writes the requested
+directory to a file and sends SIGHUP to the master, which forwards it to every
+worker and reloads its own copy as well, for the workers it forks later. Each
+of them then loads and canary-checks the model on its own.
+
+Each worker writes its metrics to a shared directory, and GET /metrics on any
+worker returns the sum over all of them (see metrics.share). The master folds
+the counters of a worker that exits into the totals, so they never go back.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import metrics
+from runtime import (
+    configure_threads,
+    cpu_threads,
+    default_workers,
+    log_runtime_config,
+    process_rss,
+)
+
+logger = logging.getLogger("serve")
+
+
+def request_reload(path, model_dir):
+    """Ask the master to have every worker reload; runs in a worker."""
+    with open(path + ".tmp", "w") as f:
+        json.dump({"model_dir": model_dir}, f)
+    os.replace(path + ".tmp", path)
+    os.kill(os.getppid(), signal.SIGHUP)
+
+
+def requested_model_dir(path):
+    """The directory of the latest reload request; None for the current one."""
+    try:
+        with open(path) as f:
+            return json.load(f)["model_dir"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def serve_worker(app, sock, host, port, model_store, reload_path, metrics_dir):
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so not on this thread
+        threading.Thread(target=server.shutdown).start()
+
+    def reload(signum, frame):
+        model_store.reload_in_background(requested_model_dir(reload_path))
+
+    signal.signal(signal.SIGHUP, reload)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    metrics.share(metrics_dir)
+    server.serve_forever()
+    # The master folds this into the totals once the worker has exited
+    metrics.write_snapshot()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--workers", type=int, default=int(os.environ.get("SERVE_WORKERS", "0"))
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8082)))
+    parser.add_argument("--backlog", type=int, default=128)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    # One compute thread per worker unless there are whole CPUs to spare;
+    # this has to happen before inference.py imports NumPy
+    workers = args.workers or default_workers()
+    configure_threads(max(1, cpu_threads() // workers))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(args.backlog)
+
+    # Load everything once in the master, then stop the GC from touching it
+    import inference
+    from inference import app, model_store
+
+    shared_dir = tempfile.mkdtemp(prefix="serve-")
+    reload_path = os.path.join(shared_dir, "reload.json")
+    metrics_dir = os.path.join(shared_dir, "metrics")
+    os.mkdir(metrics_dir)
+    inference.reload_broadcast = lambda model_dir: request_reload(
+        reload_path, model_dir
+    )
+
+    gc.collect()
+    gc.freeze()
+    if not args.workers:
+        # Fit the memory limit even if the workers end up sharing nothing
+        workers = default_workers(worker_memory=process_rss())
+    log_runtime_config(
+        logger,
+        model_version=model_store.current().version,
+        workers=workers,
+        listen=f"{args.host}:{args.port}",
+    )
+
+    children = {}
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve_worker(
+                    app,
+                    sock,
+                    args.host,
+                    args.port,
+                    model_store,
+                    reload_path,
+                    metrics_dir,
+                )
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+        logger.info("Started worker %d", pid)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reload(signum, frame):
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+        # Workers restarted later are forked from the master's model
+        model_store.reload_in_background(requested_model_dir(reload_path))
+
+    # Before the first fork: SIGHUP would otherwise end the master
+    signal.signal(signal.SIGHUP, reload)
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is not None:
+            metrics.retire(metrics_dir, pid)
+        if stopping or started is None:
+            continue
+        logger.warning("Worker %d exited with status %d; restarting", pid, status)
+        # Don't spin if workers die straight away, e.g. on a bad model
+        if time.monotonic() - started < 1.0:
+            time.sleep(1.0)
+        spawn()
+    shutil.rmtree(shared_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""Synthetic disease-risk readings, written in shards of bounded size.
+
+    python synthetic_data.py generate DIR [--rows 10000000] [--chunk-rows 1000000]
+        [--format npy|parquet] [--seed 0] [--spec spec.json] [--labeler module:function]
+    python synthetic_data.py describe DIR
+
+Rows are generated one chunk at a time with NumPy, so memory stays at one
+chunk whatever --rows is. Each chunk has its own random stream spawned from
+--seed, so a dataset is reproducible for a given seed, chunk size and spec.
+
+The spec (JSON, see DEFAULT_SPEC) gives the crop vocabulary and how often each
+crop occurs. It also gives a clipped normal distribution per crop and feature,
+and the risk labeling: a weighted sum of standardized features, cut into risk
+levels at `thresholds`, with a fraction `label_noise` of labels redrawn at
+random. The defaults reproduce the 12 hand-written rows the training scripts
+used to start from. A Python function can replace the labeling with
+--labeler; it gets the crop codes and an (n, 3) feature array and returns
+codes into `risk_levels`.
+
+Each shard is `part-NNNNN.{crop,features,risk}.npy` holding codes and a
+float64 array, or `part-NNNNN.parquet`. Parquet needs pyarrow, which is not a
+dependency of the project; without it `--format parquet` fails before writing
+anything. `manifest.json` lists the shards, the
+vocabularies and the spec. `read_frame` and `iter_frames` load the shards back
+as pandas DataFrames with string crop names and risk levels, like the
+hand-written data.
+"""
+
+import argparse
+import copy
+import importlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+NUMERIC_FEATURES = ["temperature", "humidity", "soil_moisture"]
+COLUMNS = ["crop_name", *NUMERIC_FEATURES, "disease_risk"]
+MANIFEST = "manifest.json"
+
+DEFAULT_SPEC = {
+    "crops": {
+        "wheat": {
+            "weight": 1.0,
+            "temperature": {"mean": 20.0, "std": 2.0},
+            "humidity": {"mean": 31.0, "std": 5.0},
+            "soil_moisture": {"mean": 41.0, "std": 5.0},
+        },
+        "rice": {
+            "weight": 1.0,
+            "temperature": {"mean": 25.0, "std": 2.0},
+            "humidity": {"mean": 50.0, "std": 5.0},
+            "soil_moisture": {"mean": 60.0, "std": 5.0},
+        },
+        "maize": {
+            "weight": 1.0,
+            "temperature": {"mean": 22.0, "std": 2.0},
+            "humidity": {"mean": 45.0, "std": 5.0},
+            "soil_moisture": {"mean": 55.0, "std": 5.0},
+        },
+    },
+    # Used for crops, or features of a crop, that the spec leaves out
+    "default_feature": {
+        "temperature": {"mean": 22.0, "std": 4.0, "min": -10.0, "max": 50.0},
+        "humidity": {"mean": 45.0, "std": 10.0, "min": 0.0, "max": 100.0},
+        "soil_moisture": {"mean": 55.0, "std": 10.0, "min": 0.0, "max": 100.0},
+    },
+    "risk_levels": ["low", "medium", "high"],
+    "labeling": {
+        "center": {"temperature": 22.0, "humidity": 45.0, "soil_moisture": 55.0},
+        "scale": {"temperature": 3.0, "humidity": 10.0, "soil_moisture": 10.0},
+        "weights": {"temperature": 0.2, "humidity": 0.5, "soil_moisture": 0.3},
+        # One less than the risk levels, in increasing order
+        "thresholds": [-0.5, 0.5],
+        "label_noise": 0.02,
+    },
+}
+
+
+def load_spec(path=None, crops=None):
+    """DEFAULT_SPEC, updated from a JSON file and narrowed to `crops`."""
+    spec = copy.deepcopy(DEFAULT_SPEC)
+    if path:
+        with open(path) as f:
+            override = json.load(f)
+        for key, value in override.items():
+            if isinstance(value, dict) and key != "crops":
+                spec[key] = {**spec.get(key, {}), **value}
+            else:
+                spec[key] = value
+    if crops:
+        spec["crops"] = {crop: spec["crops"].get(crop, {}) for crop in crops}
+    return spec
+
+
+class Generator:
+    """Vectorized sampler for one spec: crops, features, then risk labels."""
+
+    def __init__(self, spec=None, labeler=None):
+        self.spec = spec or load_spec()
+        self.crops = list(self.spec["crops"])
+        self.risk_levels = list(self.spec["risk_levels"])
+        if not self.crops:
+            raise ValueError("the spec has no crops")
+
+        weights = np.array(
+            [profile.get("weight", 1.0) for profile in self.spec["crops"].values()]
+        )
+        self.crop_p = weights / weights.sum()
+
+        # (crop, feature) tables, indexed by crop code when sampling
+        default = self.spec["default_feature"]
+        table = {key: np.empty((len(self.crops), 3)) for key in ("mean", "std")}
+        table["min"] = np.full((len(self.crops), 3), -np.inf)
+        table["max"] = np.full((len(self.crops), 3), np.inf)
+        for i, profile in enumerate(self.spec["crops"].values()):
+            for j, feature in enumerate(NUMERIC_FEATURES):
+                params = {**default.get(feature, {}), **profile.get(feature, {})}
+                for key in table:
+                    if key in params:
+                        table[key][i, j] = params[key]
+        self.mean, self.std = table["mean"], table["std"]
+        self.low, self.high = table["min"], table["max"]
+
+        self.labeler = labeler or self.linear_labels
+        labeling = self.spec["labeling"]
+        self.center = np.array([labeling["center"][f] for f in NUMERIC_FEATURES])
+        self.scale = np.array([labeling["scale"][f] for f in NUMERIC_FEATURES])
+        self.weights = np.array([labeling["weights"][f] for f in NUMERIC_FEATURES])
+        self.thresholds = np.asarray(labeling["thresholds"], dtype=np.float64)
+        self.label_noise = labeling.get("label_noise", 0.0)
+        if labeler is None and len(self.thresholds) != len(self.risk_levels) - 1:
+            raise ValueError("labeling needs one threshold less than risk_levels")
+
+    def linear_labels(self, crop_codes, features):
+        score = ((features - self.center) / self.scale) @ self.weights
+        return np.searchsorted(self.thresholds, score)
+
+    def sample(self, n_rows, rng):
+        """(crop codes, (n, 3) float64 features, risk codes) for n_rows rows."""
+        crop_codes = rng.choice(len(self.crops), size=n_rows, p=self.crop_p)
+        features = rng.standard_normal((n_rows, 3))
+        features *= self.std[crop_codes]
+        features += self.mean[crop_codes]
+        np.clip(features, self.low[crop_codes], self.high[crop_codes], out=features)
+
+        risk_codes = np.asarray(self.labeler(crop_codes, features))
+        if self.label_noise:
+            noisy = rng.random(n_rows) < self.label_noise
+            risk_codes[noisy] = rng.integers(len(self.risk_levels), size=noisy.sum())
+        return (
+            crop_codes.astype(np.uint16),
+            features,
+            risk_codes.astype(np.uint8),
+        )
+
+
+def require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            "Parquet shards need pyarrow, which is not installed; "
+            "pip install pyarrow, or use the npy format"
+        ) from None
+
+
+def _write_parquet(path, generator, crop_codes, features, risk_codes):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Dictionary columns keep the strings once per shard, not once per row
+    table = pa.table(
+        {
+            "crop_name": pa.DictionaryArray.from_arrays(
+                pa.array(crop_codes.astype(np.int32)), pa.array(generator.crops)
+            ),
+            **{name: features[:, j] for j, name in enumerate(NUMERIC_FEATURES)},
+            "disease_risk": pa.DictionaryArray.from_arrays(
+                pa.array(risk_codes.astype(np.int32)),
+                pa.array(generator.risk_levels),
+            ),
+        }
+    )
+    pq.write_table(table, path)
+
+
+def _write_npy(prefix, generator, crop_codes, features, risk_codes):
+    np.save(f"{prefix}.crop.npy", crop_codes)
+    np.save(f"{prefix}.features.npy", features)
+    np.save(f"{prefix}.risk.npy", risk_codes)
+
+
+def generate(
+    directory,
+    n_rows,
+    chunk_rows=1_000_000,
+    fmt="npy",
+    seed=0,
+    spec=None,
+    labeler=None,
+):
+    """Write n_rows rows to `directory` in shards of chunk_rows; returns the
+    manifest."""
+    if fmt not in ("parquet", "npy"):
+        raise ValueError(f"unknown format {fmt!r}")
+    if fmt == "parquet":
+        require_pyarrow()
+    generator = Generator(spec, labeler)
+    os.makedirs(directory, exist_ok=True)
+    n_chunks = max(1, -(-n_rows // chunk_rows))
+    streams = np.random.SeedSequence(seed).spawn(n_chunks)
+
+    shards = []
+    for index, stream in enumerate(streams):
+        rows = min(chunk_rows, n_rows - index * chunk_rows)
+        arrays = generator.sample(rows, np.random.default_rng(stream))
+        name = f"part-{index:05d}"
+        if fmt == "parquet":
+            _write_parquet(
+                os.path.join(directory, f"{name}.parquet"), generator, *arrays
+            )
+        else:
+            _write_npy(os.path.join(directory, name), generator, *arrays)
+        shards.append({"name": name, "rows": rows})
+
+    manifest = {
+        "format": fmt,
+        "rows": n_rows,
+        "seed": seed,
+        "crops": generator.crops,
+        "risk_levels": generator.risk_levels,
+        "numeric_features": NUMERIC_FEATURES,
+        "shards": shards,
+        "spec": generator.spec,
+        "labeler": None if labeler is None else _qualified_name(labeler),
+    }
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _qualified_name(function):
+    return f"{function.__module__}:{function.__qualname__}"
+
+
+def load_labeler(name):
+    module, _, function = name.partition(":")
+    return getattr(importlib.import_module(module), function)
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return json.load(f)
+
+
+def iter_arrays(directory):
+    """(crop codes, features, risk codes) per shard, codes into the manifest's
+    `crops` and `risk_levels`."""
+    manifest = read_manifest(directory)
+    for shard in manifest["shards"]:
+        prefix = os.path.join(directory, shard["name"])
+        if manifest["format"] == "npy":
+            yield (
+                np.load(f"{prefix}.crop.npy"),
+                np.load(f"{prefix}.features.npy"),
+                np.load(f"{prefix}.risk.npy"),
+            )
+            continue
+        require_pyarrow()
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(f"{prefix}.parquet")
+        yield (
+            table.column("crop_name").combine_chunks().indices.to_numpy(),
+            np.column_stack(
+                [table.column(name).to_numpy() for name in NUMERIC_FEATURES]
+            ),
+            table.column("disease_risk").combine_chunks().indices.to_numpy(),
+        )
+
+
+def iter_frames(directory, max_rows=None):
+    """One DataFrame per shard, with the columns of the hand-written data."""
+    import pandas as pd
+
+    manifest = read_manifest(directory)
+    crops = np.array(manifest["crops"], dtype=object)
+    risk_levels = np.array(manifest["risk_levels"], dtype=object)
+    remaining = max_rows
+    for crop_codes, features, risk_codes in iter_arrays(directory):
+        if remaining is not None:
+            if remaining <= 0:
+                return
+            crop_codes, features, risk_codes = (
+                crop_codes[:remaining],
+                features[:remaining],
+                risk_codes[:remaining],
+            )
+            remaining -= len(crop_codes)
+        frame = pd.DataFrame(features, columns=NUMERIC_FEATURES)
+        frame.insert(0, "crop_name", crops[crop_codes])
+        frame["disease_risk"] = risk_levels[risk_codes]
+        yield frame
+
+
+def read_frame(directory, max_rows=None):
+    """The whole dataset, or its first max_rows rows, as one DataFrame."""
+    import pandas as pd
+
+    return pd.concat(iter_frames(directory, max_rows), ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    gen = commands.add_parser("generate", help="write a dataset")
+    gen.add_argument("directory")
+    gen.add_argument("--rows", type=int, default=10_000_000)
+    gen.add_argument("--chunk-rows", type=int, default=1_000_000)
+    gen.add_argument("--format", choices=["npy", "parquet"], default="npy")
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--spec", help="JSON file overriding DEFAULT_SPEC")
+    gen.add_argument("--crops", help="comma-separated crop vocabulary")
+    gen.add_argument("--labeler", help="module:function replacing the labeling")
+    describe = commands.add_parser("describe", help="summarize a dataset")
+    describe.add_argument("directory")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        if args.format == "parquet":
+            try:
+                require_pyarrow()
+            except ImportError as e:
+                parser.error(str(e))
+        spec = load_spec(args.spec, args.crops.split(",") if args.crops else None)
+        labeler = load_labeler(args.labeler) if args.labeler else None
+        start = time.perf_counter()
+        manifest = generate(
+            args.directory,
+            args.rows,
+            args.chunk_rows,
+            args.format,
+            args.seed,
+            spec,
+            labeler,
+        )
+        elapsed = time.perf_counter() - start
+        print(
+            f"Wrote {manifest['rows']} rows in {len(manifest['shards'])} "
+            f"{manifest['format']} shards to {args.directory} in {elapsed:.1f} s "
+            f"({manifest['rows'] / elapsed / 1e6:.2f} M rows/s)"
+        )
+        return 0
+
+    manifest = read_manifest(args.directory)
+    crop_counts = np.zeros(len(manifest["crops"]), dtype=np.int64)
+    risk_counts = np.zeros(len(manifest["risk_levels"]), dtype=np.int64)
+    for crop_codes, _, risk_codes in iter_arrays(args.directory):
+        crop_counts += np.bincount(crop_codes, minlength=len(crop_counts))
+        risk_counts += np.bincount(risk_codes, minlength=len(risk_counts))
+    print(f"{manifest['rows']} rows, {manifest['format']}, seed {manifest['seed']}")
+    for label, names, counts in (
+        ("crop", manifest["crops"], crop_counts),
+        ("risk", manifest["risk_levels"], risk_counts),
+    ):
+        for name, count in zip(names, counts):
+            print(f"{label:<6}{name:<16}{count:>12}{count / manifest['rows']:>8.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import math
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+from admission import AdmissionController, Overloaded  # noqa: E402
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+class TestAdmissionController(unittest.TestCase):
+    def in_a_thread(self, controller, deadline):
+        """acquire() on another thread; returns (thread, outcome list)."""
+        outcome = []
+
+        def run():
+            try:
+                outcome.append(controller.acquire(deadline))
+            except Exception as e:
+                outcome.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread, outcome
+
+    def test_admits_up_to_max_concurrency(self):
+        controller = AdmissionController(2, max_queue=0)
+        now = time.monotonic()
+        controller.acquire(now + 1)
+        controller.acquire(now + 1)
+        with self.assertRaises(Overloaded) as shed:
+            controller.acquire(now + 1)
+        self.assertEqual((shed.exception.reason, shed.exception.status), ("queue_full", 429))
+        self.assertGreaterEqual(shed.exception.retry_after, 1)
+        stats = controller.stats()
+        self.assertEqual((stats["in_flight"], stats["admitted"]), (2, 2))
+        self.assertEqual(stats["shed"], {"queue_full": 1})
+
+    def test_unreachable_deadline_is_shed_up_front(self):
+        controller = AdmissionController(1)
+        controller.service_time = 1.0
+        controller.acquire(time.monotonic() + 10)
+        with self.assertRaises(Overloaded) as shed:
+            controller.acquire(time.monotonic() + 0.5)
+        self.assertEqual(
+            (shed.exception.reason, shed.exception.status), ("deadline_unreachable", 503)
+        )
+        self.assertEqual(controller.stats()["queue_depth"], 0)
+
+    def test_deadline_expires_in_the_queue(self):
+        controller = AdmissionController(1)
+        controller.acquire(time.monotonic() + 10)
+        with self.assertRaises(Overloaded) as shed:
+            controller.acquire(time.monotonic() + 0.05)
+        self.assertEqual(shed.exception.reason, "queue_timeout")
+        stats = controller.stats()
+        self.assertEqual((stats["queue_depth"], stats["in_flight"]), (0, 1))
+
+    def test_release_hands_the_slot_to_the_oldest_waiter(self):
+        controller = AdmissionController(1)
+        started = controller.acquire(time.monotonic() + 10)
+        first, first_outcome = self.in_a_thread(controller, time.monotonic() + 10)
+        wait_for(lambda: controller.stats()["queue_depth"] == 1)
+        second, second_outcome = self.in_a_thread(controller, time.monotonic() + 10)
+        wait_for(lambda: controller.stats()["queue_depth"] == 2)
+
+        controller.release(started)
+        first.join(5)
+        self.assertIsInstance(first_outcome[0], float)
+        self.assertEqual(second_outcome, [])
+        self.assertEqual(controller.stats()["in_flight"], 1)
+
+        controller.release(first_outcome[0])
+        second.join(5)
+        controller.release(second_outcome[0])
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+    def test_infinite_deadline_waits_without_overflow(self):
+        controller = AdmissionController(1)
+        started = controller.acquire(math.inf)
+        thread, outcome = self.in_a_thread(controller, math.inf)
+        wait_for(lambda: controller.stats()["queue_depth"] == 1)
+        controller.release(started)
+        thread.join(5)
+        self.assertIsInstance(outcome[0], float)
+
+    def test_failed_wait_does_not_leak_the_slot(self):
+        controller = AdmissionController(1)
+        started = controller.acquire(time.monotonic() + 10)
+        with patch.object(threading.Event, "wait", side_effect=OverflowError):
+            with self.assertRaises(OverflowError):
+                controller.acquire(time.monotonic() + 10)
+        self.assertEqual(controller.stats()["queue_depth"], 0)
+
+        controller.release(started)
+        self.assertEqual(controller.stats()["in_flight"], 0)
+        # The next request gets the freed slot straight away
+        controller.release(controller.acquire(time.monotonic() + 0.01))
+
+    def test_needs_a_slot(self):
+        with self.assertRaises(ValueError):
+            AdmissionController(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+from batching import MicroBatcher  # noqa: E402
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def test_each_caller_gets_its_own_result(self):
+        batches = []
+
+        def predict_batch(rows):
+            batches.append(list(rows))
+            return [row * 10 for row in rows]
+
+        batcher = MicroBatcher(predict_batch, window_ms=20, max_batch_size=8)
+        with ThreadPoolExecutor(16) as pool:
+            results = list(pool.map(lambda row: batcher.predict(row, 5), range(40)))
+        self.assertEqual(results, [row * 10 for row in range(40)])
+        self.assertEqual(
+            sorted(row for batch in batches for row in batch), list(range(40))
+        )
+        self.assertLessEqual(max(len(batch) for batch in batches), 8)
+        # Concurrent rows were scored together
+        self.assertLess(len(batches), 40)
+
+        stats = batcher.stats()
+        self.assertEqual(stats["rows"], 40)
+        self.assertEqual(stats["batches"], len(batches))
+        self.assertEqual(sum(stats["batch_size_histogram"].values()), len(batches))
+
+    def test_error_reaches_every_row_of_the_batch(self):
+        release = threading.Event()
+
+        def predict_batch(rows):
+            release.wait(5)
+            raise ValueError("model failed")
+
+        batcher = MicroBatcher(predict_batch, window_ms=50, max_batch_size=4)
+        futures = [batcher.submit(row) for row in range(4)]
+        release.set()
+        for future in futures:
+            with self.assertRaisesRegex(ValueError, "model failed"):
+                future.result(5)
+
+        # The batcher keeps going after a failed batch
+        batcher.predict_batch = lambda rows: rows
+        self.assertEqual(batcher.predict("next", 5), "next")
+
+    def test_too_few_results_fail_every_row(self):
+        batcher = MicroBatcher(lambda rows: rows[:-1], window_ms=50, max_batch_size=3)
+        futures = [batcher.submit(row) for row in range(3)]
+        for future in futures:
+            with self.assertRaisesRegex(RuntimeError, "2 results for 3 rows"):
+                future.result(5)
+
+    def test_cancelled_rows_are_skipped(self):
+        release = threading.Event()
+        scored = []
+
+        def predict_batch(rows):
+            release.wait(5)
+            scored.extend(rows)
+            return rows
+
+        batcher = MicroBatcher(predict_batch, window_ms=1, max_batch_size=1)
+        first = batcher.submit("first")
+        cancelled = batcher.submit("cancelled")
+        self.assertTrue(cancelled.cancel())
+        release.set()
+        self.assertEqual(first.result(5), "first")
+        self.assertEqual(batcher.predict("next", 5), "next")
+        self.assertEqual(scored, ["first", "next"])
+
+    def test_max_batch_size(self):
+        with self.assertRaises(ValueError):
+            MicroBatcher(lambda rows: rows, max_batch_size=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
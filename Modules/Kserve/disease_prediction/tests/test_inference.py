@@ -0,0 +1,101 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+# The service loads its model at import time
+os.environ.setdefault("MODEL_DIR", PACKAGE_DIR)
+
+import inference  # noqa: E402
+
+
+class TestAdminReload(unittest.TestCase):
+    def setUp(self):
+        self.client = inference.app.test_client()
+        self.reload = mock.Mock()
+        patcher = mock.patch.object(inference, "reload_broadcast", self.reload)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, body=None, token="secret", env_token="secret"):
+        headers = {} if token is None else {"X-Admin-Token": token}
+        env = {} if env_token is None else {"ADMIN_TOKEN": env_token}
+        with mock.patch.dict(os.environ, env):
+            if env_token is None:
+                os.environ.pop("ADMIN_TOKEN", None)
+            return self.client.post("/admin/reload", json=body, headers=headers)
+
+    def test_refused_without_a_configured_token(self):
+        response = self.post(token="", env_token=None)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn("disabled", response.get_json()["message"])
+        self.reload.assert_not_called()
+
+    def test_refused_with_a_wrong_token(self):
+        for token in (None, "", "secreT"):
+            with self.subTest(token=token):
+                self.assertEqual(self.post(token=token).status_code, 403)
+        self.reload.assert_not_called()
+
+    def test_reloads_the_configured_directory(self):
+        self.assertEqual(self.post().status_code, 202)
+        self.reload.assert_called_once_with(None)
+
+    def test_model_dir_must_be_inside_model_dir(self):
+        root = os.path.realpath(inference.MODEL_DIR)
+        self.assertEqual(self.post({"model_dir": "model_bundle"}).status_code, 202)
+        self.reload.assert_called_once_with(os.path.join(root, "model_bundle"))
+        with tempfile.TemporaryDirectory() as outside:
+            link = os.path.join(root, "tests", "outside-link")
+            os.symlink(outside, link)
+            self.addCleanup(os.remove, link)
+            for model_dir in (outside, "..", "../..", "tests/outside-link", 3):
+                with self.subTest(model_dir=model_dir):
+                    response = self.post({"model_dir": model_dir})
+                    self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post(["model_dir"]).status_code, 400)
+        self.assertEqual(self.reload.call_count, 1)
+
+
+class FailingPredictor:
+    """Scores everything "low" but fails the whole call on a 999 reading."""
+
+    version = "test"
+    known_crops = {"rice"}
+
+    def predict(self, crop_names, numeric):
+        for crop in crop_names:
+            if crop not in self.known_crops:
+                raise ValueError(f"unknown crop_name {crop!r}")
+        if (numeric == 999).any():
+            raise RuntimeError("model failed")
+        return ["low"] * len(crop_names)
+
+
+class TestMicroBatchedRows(unittest.TestCase):
+    def test_a_failing_row_only_fails_itself(self):
+        predictor = FailingPredictor()
+        rows = [
+            (predictor, "rice", 20.0, 50.0, 60.0),
+            (predictor, "rice", 999.0, 50.0, 60.0),
+            (predictor, "wheat", 20.0, 50.0, 60.0),
+            (predictor, "rice", 21.0, 50.0, 60.0),
+        ]
+        expected = [inference.predict_reading(*row[1:], predictor) for row in rows]
+        self.assertEqual(inference.predict_rows(rows), expected)
+        self.assertEqual(
+            expected,
+            [
+                ("low", None),
+                (None, "model failed"),
+                (None, "unknown crop_name 'wheat'"),
+                ("low", None),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+import json_codec  # noqa: E402
+from json_codec import CodecError, Reading  # noqa: E402
+
+READING = {"crop_name": "rice", "temperature": 25, "humidity": 50.5, "soil_moisture": 60}
+
+
+class TestJsonCodec(unittest.TestCase):
+    def test_decode_reading(self):
+        reading = json_codec.decode_reading(json.dumps(READING).encode())
+        self.assertEqual(reading, Reading("rice", 25.0, 50.5, 60.0))
+        self.assertIsInstance(reading.temperature, float)
+
+    def test_invalid_readings(self):
+        cases = {
+            b"[1, 2]": "JSON object",
+            b"{": "invalid JSON",
+            json.dumps({**READING, "humidity": "50"}).encode(): "humidity",
+            json.dumps({**READING, "temperature": True}).encode(): "temperature",
+            json.dumps({**READING, "crop_name": 3}).encode(): "crop_name",
+            json.dumps({"crop_name": "rice"}).encode(): "required",
+            b'{"crop_name": "rice", "temperature": NaN, "humidity": 1, '
+            # orjson refuses NaN while parsing; the stdlib fallback parses it
+            b'"soil_moisture": 1}': "invalid JSON|temperature",
+        }
+        for body, message in cases.items():
+            with self.subTest(body=body):
+                with self.assertRaisesRegex(CodecError, message):
+                    json_codec.decode_reading(body)
+
+    def test_batch_layouts(self):
+        records = json.dumps({"instances": [READING, READING]}).encode()
+        columns = json.dumps({key: [value] * 2 for key, value in READING.items()})
+        for body in (records, columns.encode()):
+            decoded = json_codec.decode_batch(body)
+            self.assertEqual(decoded["crop_name"], ["rice", "rice"])
+            self.assertEqual(decoded["humidity"], [50.5, 50.5])
+        with self.assertRaisesRegex(CodecError, "same length"):
+            json_codec.decode_batch(
+                json.dumps({**{k: [v] for k, v in READING.items()}, "humidity": []})
+            )
+
+    def test_only_risk_responses_are_cached(self):
+        json_codec.encode_risk.cache_clear()
+        self.assertEqual(
+            json.loads(json_codec.encode_reading("high")), {"disease_risk": "high"}
+        )
+        for i in range(100):
+            body = json_codec.encode_reading(None, f"unknown crop_name 'x{i}'")
+            self.assertEqual(
+                json.loads(body), {"disease_risk": f"unknown crop_name 'x{i}'"}
+            )
+        json_codec.encode_reading("high")
+        info = json_codec.encode_risk.cache_info()
+        self.assertEqual((info.currsize, info.hits), (1, 1))
+
+    def test_encode_batch(self):
+        body, n_errors = json_codec.encode_batch(["low", None], [None, "bad row"])
+        self.assertEqual(n_errors, 1)
+        self.assertEqual(
+            json.loads(body),
+            {
+                "predictions": [{"disease_risk": "low"}, {"error": "bad row"}],
+                "errors": 1,
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+from model_store import ModelStore, canary_check, directory_signature  # noqa: E402
+
+
+class FakePredictor:
+    def __init__(self, version, crops=("maize", "rice"), risk="low"):
+        self.version = version
+        self.known_crops = set(crops)
+        self.risk = risk
+
+    def predict(self, crop_names, numeric):
+        return np.array([self.risk] * len(crop_names), dtype=object)
+
+
+class TestModelStore(unittest.TestCase):
+    def setUp(self):
+        self.predictors = {"v1": FakePredictor("v1"), "v2": FakePredictor("v2")}
+        self.swapped = []
+
+    def loader(self, directory):
+        predictor = self.predictors[directory]
+        if isinstance(predictor, Exception):
+            raise predictor
+        return predictor
+
+    def store(self):
+        return ModelStore(self.loader, "v1", on_swap=self.swapped.append)
+
+    def test_reload_swaps_the_model(self):
+        store = self.store()
+        held = store.current()
+        self.assertEqual(store.load("v2"), "v2")
+        self.assertEqual(store.current().version, "v2")
+        # A request that took the old model keeps it
+        self.assertEqual(held.version, "v1")
+        status = store.status()
+        self.assertEqual((status["directory"], status["reloads"]), ("v2", 1))
+        self.assertEqual([p.version for p in self.swapped], ["v1", "v2"])
+
+    def test_failed_canary_keeps_the_old_model(self):
+        store = self.store()
+        self.predictors["v2"] = FakePredictor("v2", risk="")
+        with self.assertRaisesRegex(ValueError, "canary"):
+            store.load("v2")
+        self.assertEqual(store.current().version, "v1")
+        status = store.status()
+        self.assertEqual(status["failed_reloads"], 1)
+        self.assertIn("canary", status["last_error"])
+        self.assertEqual(status["directory"], "v1")
+        self.assertEqual(len(self.swapped), 1)
+
+    def test_failed_load_keeps_the_old_model(self):
+        store = self.store()
+        self.predictors["v2"] = OSError("no such bundle")
+        store.reload_in_background("v2").join(5)
+        self.assertEqual(store.current().version, "v1")
+        self.assertIn("no such bundle", store.status()["last_error"])
+        self.assertFalse(store.status()["reloading"])
+
+    def test_canary_needs_crops(self):
+        with self.assertRaisesRegex(ValueError, "no crops"):
+            canary_check(FakePredictor("v3", crops=()))
+
+    def test_reload_in_background(self):
+        store = self.store()
+        store.reload_in_background("v2").join(5)
+        self.assertEqual(store.current().version, "v2")
+
+
+class TestDirectorySignature(unittest.TestCase):
+    def test_bundle_is_tracked_by_its_manifest(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "model.joblib"), "w") as f:
+                f.write("model")
+            loose = directory_signature(directory)
+            self.assertEqual(len(loose), 1)
+
+            with open(os.path.join(directory, "manifest.json"), "w") as f:
+                f.write("{}")
+            signature = directory_signature(directory)
+            self.assertEqual(signature[0][0], os.path.join(directory, "manifest.json"))
+            with open(os.path.join(directory, "model.joblib"), "w") as f:
+                f.write("a new model")
+            self.assertEqual(directory_signature(directory), signature)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+import compact_model  # noqa: E402
+import model_bundle  # noqa: E402
+from compiled_model import CompiledModel, compile_artifacts, random_readings  # noqa: E402
+from predictors import SklearnModel, load_predictor  # noqa: E402
+from risk_grid import GridPredictor, RiskGrid, build  # noqa: E402
+
+BUNDLE = os.path.join(PACKAGE_DIR, "model_bundle")
+
+
+class TestBackendParity(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reference = SklearnModel.load(os.path.join(BUNDLE, "sklearn"))
+        cls.artifacts = (
+            cls.reference.model,
+            cls.reference.scaler,
+            cls.reference.crop_label_encoder,
+            cls.reference.risk_label_encoder,
+        )
+        cls.crop_names, cls.numeric = random_readings(
+            sorted(cls.reference.known_crops),
+            cls.reference.scaler.mean_,
+            cls.reference.scaler.scale_,
+            3000,
+        )
+        cls.expected = cls.reference.predict(cls.crop_names, cls.numeric)
+
+    def assert_same_predictions(self, predictor):
+        np.testing.assert_array_equal(
+            predictor.predict(self.crop_names, self.numeric), self.expected
+        )
+
+    def test_compiled_matches_sklearn(self):
+        self.assert_same_predictions(CompiledModel(compile_artifacts(*self.artifacts)))
+
+    def test_compact_matches_sklearn(self):
+        for prune in ("exact", "none"):
+            with self.subTest(prune=prune):
+                arrays = compact_model.compact_artifacts(*self.artifacts, prune=prune)
+                self.assert_same_predictions(compact_model.CompactModel(arrays))
+
+    def test_committed_bundle_backends_match_sklearn(self):
+        for backend in ("compiled", "compact"):
+            with self.subTest(backend=backend):
+                self.assert_same_predictions(load_predictor(backend, BUNDLE))
+
+    def test_float32_below(self):
+        thresholds = np.array([0.1, 0.5, 1 / 3, -2.7, 1e-9])
+        below = compact_model.float32_below(thresholds)
+        self.assertEqual(below.dtype, np.float32)
+        self.assertTrue(np.all(below.astype(np.float64) <= thresholds))
+        above = np.nextafter(below, np.float32(np.inf)).astype(np.float64)
+        self.assertTrue(np.all(above > thresholds))
+
+    def test_unknown_crop(self):
+        compiled = CompiledModel(compile_artifacts(*self.artifacts))
+        with self.assertRaisesRegex(ValueError, "unknown crop_name"):
+            compiled.predict(["cactus"], np.array([[25.0, 50.0, 60.0]]))
+
+    def test_serving_threads_only_change_loaded_models(self):
+        import predictors
+
+        self.assertEqual(self.reference.model.n_jobs, predictors.serving_n_jobs())
+        model = self.reference.model
+        model.n_jobs = 7
+        try:
+            SklearnModel(*self.artifacts)
+            self.assertEqual(model.n_jobs, 7)
+        finally:
+            model.n_jobs = predictors.serving_n_jobs()
+
+    def test_empty_batch(self):
+        compiled = CompiledModel(compile_artifacts(*self.artifacts))
+        self.assertEqual(compiled.predict([], np.zeros((0, 3))).shape, (0,))
+
+
+class TestModelBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.bundle = os.path.join(self.tmp.name, "bundle")
+        shutil.copytree(BUNDLE, self.bundle)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_version_comes_from_the_manifest(self):
+        manifest = model_bundle.read_manifest(self.bundle)
+        self.assertEqual(model_bundle.verify_checksums(self.bundle, manifest), [])
+        self.assertEqual(
+            model_bundle.bundle_version(manifest["files"]), manifest["version"]
+        )
+        for backend in ("sklearn", "compiled", "compact"):
+            predictor = load_predictor(backend, self.bundle, verify=True)
+            self.assertEqual(predictor.version, manifest["version"])
+
+    def test_corrupt_file_is_rejected_when_verifying(self):
+        with open(os.path.join(self.bundle, "compact", "values.npy"), "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 1]))
+        with self.assertRaisesRegex(ValueError, "compact/values.npy"):
+            load_predictor("compact", self.bundle, verify=True)
+        # Without verification the damage goes unnoticed
+        load_predictor("compact", self.bundle)
+
+    def test_arrays_are_memory_mapped(self):
+        compiled = load_predictor("compiled", self.bundle)
+        self.assertIsInstance(compiled.threshold, np.memmap)
+        sklearn = load_predictor("sklearn", self.bundle)
+        self.assertIsInstance(sklearn.scaler.mean_, np.memmap)
+
+    def test_unsupported_format(self):
+        path = os.path.join(self.bundle, model_bundle.MANIFEST)
+        with open(path) as f:
+            manifest = json.load(f)
+        manifest["format"] = 99
+        with open(path, "w") as f:
+            json.dump(manifest, f)
+        with self.assertRaisesRegex(ValueError, "format"):
+            load_predictor("compact", self.bundle)
+
+
+class TestRiskGrid(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.model = load_predictor("compiled", BUNDLE)
+        cls.prefix = os.path.join(cls.tmp.name, "grid")
+        build(
+            cls.model,
+            {
+                "temperature": (20.0, 30.0, 0.5),
+                "humidity": (40.0, 60.0, 1.0),
+                "soil_moisture": (50.0, 70.0, 1.0),
+            },
+            cls.prefix,
+        )
+        cls.grid = RiskGrid.load(cls.prefix)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_on_grid_readings_match_the_model(self):
+        crops = sorted(self.model.known_crops)
+        numeric = np.array([[20.0, 40.0, 50.0], [25.5, 51.0, 63.0], [30.0, 60.0, 70.0]])
+        names = crops[:1] * 3
+        risks, on_grid = self.grid.lookup(names, numeric)
+        self.assertTrue(on_grid.all())
+        np.testing.assert_array_equal(risks, self.model.predict(names, numeric))
+
+    def test_off_grid_readings_fall_back_to_the_model(self):
+        crop = sorted(self.model.known_crops)[0]
+        numeric = np.array(
+            [[25.25, 50.0, 60.0], [19.5, 50.0, 60.0], [25.0, 50.0, 60.0]]
+        )
+        _, on_grid = self.grid.lookup([crop] * 3, numeric)
+        np.testing.assert_array_equal(on_grid, [False, False, True])
+        predictor = GridPredictor(self.grid, self.model)
+        np.testing.assert_array_equal(
+            predictor.predict([crop] * 3, numeric),
+            self.model.predict([crop] * 3, numeric),
+        )
+
+    def test_grid_records_the_model_version(self):
+        self.assertEqual(self.grid.model_version, self.model.version)
+
+
+if __name__ == "__main__":
+    unittest.main()
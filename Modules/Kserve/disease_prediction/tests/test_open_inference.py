@@ -0,0 +1,168 @@
+import json
+import os
+import sys
+import unittest
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+from open_inference import (  # noqa: E402
+    ProtocolError,
+    decode_bytes_elements,
+    decode_request,
+    encode_bytes_elements,
+    encode_message,
+    wants_binary,
+)
+
+CROPS = ["rice", "maize", "rice", "épeautre"]
+TEMPERATURES = np.array([25.0, 30.5, -2.0, 12.25])
+
+
+def request(inputs, **header):
+    return json.dumps({**header, "inputs": inputs}).encode()
+
+
+class TestBinaryTensors(unittest.TestCase):
+    def test_round_trip(self):
+        tensors = [
+            ("crop_name", "BYTES", CROPS),
+            ("temperature", "FP64", TEMPERATURES),
+            ("humidity", "FP32", TEMPERATURES[::-1]),
+        ]
+        for binary in ((), {"crop_name", "temperature", "humidity"}, {"humidity"}):
+            with self.subTest(binary=sorted(binary)):
+                body, length = encode_message(
+                    {"id": "1"}, tensors, "inputs", binary_names=binary
+                )
+                self.assertEqual(length is None, not binary)
+                header, decoded = decode_request(body, length)
+                self.assertEqual(header["id"], "1")
+                self.assertEqual(decoded["crop_name"], CROPS)
+                np.testing.assert_array_equal(decoded["temperature"], TEMPERATURES)
+                self.assertEqual(decoded["humidity"].dtype, np.float32)
+                np.testing.assert_array_equal(
+                    decoded["humidity"], TEMPERATURES[::-1].astype(np.float32)
+                )
+
+    def test_bytes_elements(self):
+        raw = encode_bytes_elements(CROPS)
+        self.assertEqual(decode_bytes_elements(raw), CROPS)
+        with self.assertRaisesRegex(ProtocolError, "truncated"):
+            decode_bytes_elements(raw[:-1])
+        with self.assertRaisesRegex(ProtocolError, "UTF-8"):
+            decode_bytes_elements(b"\x01\x00\x00\x00\xff")
+
+    def test_wants_binary(self):
+        self.assertFalse(wants_binary({}, "disease_risk"))
+        header = {"parameters": {"binary_data_output": True}}
+        self.assertTrue(wants_binary(header, "disease_risk"))
+        header["outputs"] = [
+            {"name": "disease_risk", "parameters": {"binary_data": False}}
+        ]
+        self.assertFalse(wants_binary(header, "disease_risk"))
+
+
+class TestMalformedRequests(unittest.TestCase):
+    def assert_rejected(self, body, message, header_length=None):
+        with self.assertRaisesRegex(ProtocolError, message):
+            decode_request(body, header_length)
+
+    def test_header(self):
+        self.assert_rejected(b"{not json", "invalid JSON")
+        self.assert_rejected(b'{"inputs": {}}', "'inputs' list")
+        self.assert_rejected(b'{"inputs": []}', "Inference-Header", header_length=99)
+        self.assert_rejected(
+            request([], parameters=["binary_data_output"]), "parameters"
+        )
+
+    def test_input_names(self):
+        tensor = {"datatype": "FP64", "shape": [1], "data": [1.0]}
+        for name in (["crop_name"], {"a": 1}, 3, None):
+            with self.subTest(name=name):
+                self.assert_rejected(request([{**tensor, "name": name}]), "string name")
+        self.assert_rejected(
+            request([{**tensor, "name": "t"}, {**tensor, "name": "t"}]), "twice"
+        )
+
+    def test_parameters_and_sizes(self):
+        tensor = {"name": "t", "datatype": "FP64", "shape": [1]}
+        self.assert_rejected(
+            request([{**tensor, "parameters": [8]}]), "parameters must be an object"
+        )
+        for size in (-8, "8", 8.0, True):
+            with self.subTest(size=size):
+                header = request([{**tensor, "parameters": {"binary_data_size": size}}])
+                self.assert_rejected(header + bytes(8), "binary_data_size", len(header))
+        header = request([{**tensor, "parameters": {"binary_data_size": 8}}])
+        self.assert_rejected(header + bytes(4), "runs past", len(header))
+        self.assert_rejected(header + bytes(12), "unexpected bytes", len(header))
+
+    def test_tensors(self):
+        self.assert_rejected(
+            request([{"name": "t", "datatype": "FP64", "shape": [2], "data": [1.0]}]),
+            "needs 2 elements",
+        )
+        self.assert_rejected(
+            request([{"name": "t", "datatype": "FP64", "shape": [-1], "data": []}]),
+            "invalid shape",
+        )
+        self.assert_rejected(
+            request([{"name": "t", "datatype": "COMPLEX", "shape": [0], "data": []}]),
+            "unsupported datatype",
+        )
+        self.assert_rejected(
+            request([{"name": "t", "datatype": "BYTES", "shape": [1], "data": [1]}]),
+            "must be strings",
+        )
+
+    def test_json_values(self):
+        for datatype, data in (
+            ("FP64", ["25"]),
+            ("FP32", [None]),
+            ("FP32", [[1.0], [2.0, 3.0]]),
+            ("INT32", [1.5]),
+            ("INT8", [300]),
+            ("INT64", [2**70]),
+            ("BOOL", [1]),
+        ):
+            with self.subTest(datatype=datatype, data=data):
+                self.assert_rejected(
+                    request(
+                        [
+                            {
+                                "name": "t",
+                                "datatype": datatype,
+                                "shape": [1],
+                                "data": data,
+                            }
+                        ]
+                    ),
+                    f"t: data is not {datatype}",
+                )
+        _, decoded = decode_request(
+            request([{"name": "t", "datatype": "INT8", "shape": [2], "data": [1, 2.0]}])
+        )
+        np.testing.assert_array_equal(decoded["t"], np.array([1, 2], dtype=np.int8))
+
+    def test_missing_data(self):
+        for datatype in ("FP32", "BYTES"):
+            with self.subTest(datatype=datatype):
+                self.assert_rejected(
+                    request([{"name": "t", "datatype": datatype, "shape": [1]}]),
+                    "t: no data",
+                )
+
+    def test_wants_binary_checks_types(self):
+        with self.assertRaisesRegex(ProtocolError, "outputs"):
+            wants_binary({"outputs": "disease_risk"}, "disease_risk")
+        with self.assertRaisesRegex(ProtocolError, "parameters"):
+            wants_binary(
+                {"outputs": [{"name": "disease_risk", "parameters": 1}]}, "disease_risk"
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
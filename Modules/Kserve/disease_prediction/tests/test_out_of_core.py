@@ -0,0 +1,45 @@
+import os
+import sys
+import tempfile
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+import out_of_core  # noqa: E402
+import synthetic_data  # noqa: E402
+
+
+class TestOutOfCore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        synthetic_data.generate(cls.tmp.name, 1600, chunk_rows=200, seed=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_trees_add_up_to_n_estimators(self):
+        for n_estimators, n_shards in ((100, 8), (3, 8), (10, 10), (5, 1)):
+            with self.subTest(n_estimators=n_estimators, n_shards=n_shards):
+                shares = out_of_core.trees_per_shard(n_estimators, n_shards)
+                self.assertEqual(len(shares), n_shards)
+                self.assertEqual(sum(shares), n_estimators)
+                self.assertLessEqual(max(shares) - min(shares), 1)
+
+    def test_small_forest_over_many_shards(self):
+        for n_estimators in (3, 12):
+            with self.subTest(n_estimators=n_estimators):
+                model, scaler, _, _, y_test, y_pred = out_of_core.train(
+                    self.tmp.name, n_estimators=n_estimators
+                )
+                self.assertEqual(len(model.estimators_), n_estimators)
+                self.assertEqual(model.n_estimators, n_estimators)
+                self.assertEqual(y_test.shape, y_pred.shape)
+                # The scaler still saw the rows of the shards without trees
+                self.assertGreater(scaler.n_samples_seen_, 1200)
+
+
+if __name__ == "__main__":
+    unittest.main()
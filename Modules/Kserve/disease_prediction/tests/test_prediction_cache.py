@@ -0,0 +1,100 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+from prediction_cache import CachedPredictor, LRUCache  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingPredictor:
+    def __init__(self, version, risk):
+        self.version = version
+        self.risk = risk
+        self.known_crops = {"rice", "wheat"}
+        self.rows = 0
+
+    def predict(self, crop_names, numeric):
+        self.rows += len(crop_names)
+        return np.array([self.risk] * len(crop_names), dtype=object)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = LRUCache(max_size=4, ttl=10, clock=clock)
+        cache.put("a", 1)
+        clock.now = 9.9
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 10
+        self.assertIsNone(cache.get("a"))
+        stats = cache.stats()
+        self.assertEqual((stats["expirations"], stats["size"]), (1, 0))
+
+    def test_retain_drops_other_versions(self):
+        cache = LRUCache()
+        cache.put(("v1", "rice", 1.0), "low")
+        cache.put(("v2", "rice", 1.0), "high")
+        cache.retain("v2")
+        self.assertIsNone(cache.get(("v1", "rice", 1.0)))
+        self.assertEqual(cache.get(("v2", "rice", 1.0)), "high")
+        self.assertEqual(cache.stats()["model_version"], "v2")
+
+
+class TestCachedPredictor(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache()
+        self.old = CountingPredictor("v1", "low")
+        self.new = CountingPredictor("v2", "high")
+        self.numeric = np.array([[25.0, 50.0, 60.0], [25.0, 50.0, 60.0]])
+
+    def test_repeated_readings_are_served_from_the_cache(self):
+        cached = CachedPredictor(self.old, self.cache)
+        risks = cached.predict(["rice", "wheat"], self.numeric)
+        self.assertEqual(list(risks), ["low", "low"])
+        cached.predict(["rice", "wheat"], self.numeric)
+        self.assertEqual(self.old.rows, 2)
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    def test_answers_are_keyed_by_model_version(self):
+        old, new = CachedPredictor(self.old, self.cache), CachedPredictor(
+            self.new, self.cache
+        )
+        # In-flight requests on both versions during a swap
+        for _ in range(3):
+            self.assertEqual(list(old.predict(["rice"], self.numeric[:1])), ["low"])
+            self.assertEqual(list(new.predict(["rice"], self.numeric[:1])), ["high"])
+        # Each version scored the reading once; switching did not empty the cache
+        self.assertEqual((self.old.rows, self.new.rows), (1, 1))
+        self.assertEqual(self.cache.stats()["size"], 2)
+
+    def test_rounding(self):
+        cached = CachedPredictor(self.old, self.cache, round_digits=1)
+        cached.predict(["rice"], np.array([[25.01, 50.0, 60.0]]))
+        cached.predict(["rice"], np.array([[24.99, 50.0, 60.0]]))
+        self.assertEqual(self.old.rows, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+import metrics  # noqa: E402
+import runtime  # noqa: E402
+
+
+def write(directory, name, text):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), "w") as f:
+        f.write(text)
+
+
+class TestCgroupLimits(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cgroup_v2(self):
+        write(self.root, "cpu.max", "50000 100000\n")
+        write(self.root, "memory.max", "536870912\n")
+        self.assertEqual(runtime.cgroup_cpu_limit(self.root), 0.5)
+        self.assertEqual(runtime.cgroup_memory_limit(self.root), 512 * 2**20)
+
+    def test_cgroup_v2_unlimited(self):
+        write(self.root, "cpu.max", "max 100000\n")
+        write(self.root, "memory.max", "max\n")
+        self.assertIsNone(runtime.cgroup_cpu_limit(self.root))
+        self.assertIsNone(runtime.cgroup_memory_limit(self.root))
+
+    def test_cgroup_v1(self):
+        cpu = os.path.join(self.root, "cpu")
+        write(cpu, "cpu.cfs_quota_us", "150000\n")
+        write(cpu, "cpu.cfs_period_us", "100000\n")
+        write(os.path.join(self.root, "memory"), "memory.limit_in_bytes", str(1 << 62))
+        self.assertEqual(runtime.cgroup_cpu_limit(self.root), 1.5)
+        self.assertIsNone(runtime.cgroup_memory_limit(self.root))
+
+    def test_workers_fit_the_limits(self):
+        with patch.object(runtime, "available_cpus", return_value=3.5), patch.object(
+            runtime, "cgroup_memory_limit", return_value=1000
+        ):
+            self.assertEqual(runtime.default_workers(), 4)
+            self.assertEqual(runtime.default_workers(worker_memory=300), 3)
+            self.assertEqual(runtime.default_workers(worker_memory=5000), 1)
+
+    def test_configure_threads_keeps_explicit_settings(self):
+        with patch.dict(os.environ, {"OMP_NUM_THREADS": "3"}):
+            for name in runtime.THREAD_ENV_VARS[1:]:
+                os.environ.pop(name, None)
+            self.assertEqual(runtime.configure_threads(1), 3)
+            self.assertEqual(os.environ["OPENBLAS_NUM_THREADS"], "1")
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_lines(self):
+        histogram = metrics.Histogram(
+            "test_seconds", "A test histogram", ["stage"], buckets=(0.1, 1.0)
+        )
+        try:
+            histogram.observe(0.05, "parse")
+            histogram.observe(0.5, "parse")
+            histogram.observe(5.0, "parse")
+            self.assertEqual(
+                histogram.lines(),
+                [
+                    "# HELP test_seconds A test histogram",
+                    "# TYPE test_seconds histogram",
+                    'test_seconds_bucket{stage="parse",le="0.1"} 1',
+                    'test_seconds_bucket{stage="parse",le="1.0"} 2',
+                    'test_seconds_bucket{stage="parse",le="+Inf"} 3',
+                    'test_seconds_sum{stage="parse"} 5.55',
+                    'test_seconds_count{stage="parse"} 3',
+                ],
+            )
+        finally:
+            metrics._metrics.remove(histogram)
+
+    def test_counter_escapes_labels(self):
+        counter = metrics.Counter("test_total", "A test counter", ["endpoint"])
+        try:
+            counter.inc('/a"b')
+            counter.inc('/a"b', amount=2)
+            self.assertIn('test_total{endpoint="/a\\"b"} 3', counter.lines())
+            self.assertIn("test_total", metrics.render())
+        finally:
+            metrics._metrics.remove(counter)
+
+
+class TestSharedMetrics(unittest.TestCase):
+    WORKER_A = "\n".join(
+        [
+            *metrics.header_lines("test_total", "counter", "A test counter"),
+            'test_total{endpoint="/predict/"} 3',
+            *metrics.header_lines("test_in_flight", "gauge", "A test gauge"),
+            "test_in_flight 2",
+            *metrics.header_lines("test_seconds", "histogram", "A test histogram"),
+            *metrics.histogram_samples("test_seconds", (0.1,), [1, 1], 0.5),
+        ]
+    )
+    WORKER_B = WORKER_A.replace("} 3", "} 4").replace(
+        "test_in_flight 2", "test_in_flight 1"
+    )
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+        for pid, text in (("11", self.WORKER_A), ("12", self.WORKER_B)):
+            write(self.directory, f"worker-{pid}.prom", text + "\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_counters_are_summed_and_gauges_labelled(self):
+        lines = metrics.merge_snapshots(self.directory).splitlines()
+        self.assertEqual(lines.count("# TYPE test_total counter"), 1)
+        self.assertIn('test_total{endpoint="/predict/"} 7', lines)
+        self.assertIn('test_in_flight{worker="11"} 2', lines)
+        self.assertIn('test_in_flight{worker="12"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn("test_seconds_sum 1.0", lines)
+
+    def test_retired_workers_keep_their_counters(self):
+        metrics.retire(self.directory, 11)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "worker-11.prom")))
+        lines = metrics.merge_snapshots(self.directory).splitlines()
+        self.assertIn('test_total{endpoint="/predict/"} 7', lines)
+        self.assertNotIn('test_in_flight{worker="11"} 2', lines)
+        self.assertIn('test_in_flight{worker="12"} 1', lines)
+
+        metrics.retire(self.directory, 12)
+        text = metrics.merge_snapshots(self.directory)
+        self.assertIn('test_total{endpoint="/predict/"} 7', text)
+        self.assertNotIn("test_in_flight", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
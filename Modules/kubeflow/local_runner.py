@@ -0,0 +1,409 @@
+"""Run a compiled disease-risk pipeline locally, without Kubeflow or MinIO.
+
+    python local_runner.py disease_risk_pipeline.yaml --arg crop_name=rice --arg temperature=25 --arg humidity=50 --arg soil_moisture=60 [--store local-store] [--workers N] [--report report.json] [--baseline report.json] [--tolerance 0.25] [--min-seconds 0.1]
+
+The DAG comes from the compiled pipeline YAML: its tasks, their inputs and the
+tasks they depend on. Each task runs the component function of the same name
+from disease-risk-pipeline.ipynb, in this environment, so nothing is
+pip-installed and no image is pulled. A task starts as soon as the tasks it
+depends on have finished; independent tasks run in parallel in a process pool.
+A dsl.ParallelFor runs its tasks once per item, as `<loop>/<index>/<task>`,
+in the same pool, and dsl.Collected gets the list of their outputs.
+
+Inside the workers `minio.Minio` is a step_cache.LocalObjectStore on --store,
+so the components pass their artifacts, and find their step cache entries,
+in a local directory. Objects live at `<store>/<bucket>/<name>`; copy a
+dataset or a readings file there to use it. Keep --store between runs to
+measure warm (cached) runs, or use a new one for cold runs.
+
+Every step reports its wall time, CPU time (including the processes it
+starts) and peak memory. --report writes them as JSON. --baseline compares
+the wall times with an earlier report and exits with 1 when a step is more
+than --tolerance (and --min-seconds) slower, so a run on a laptop can catch a
+regression. The first step in a worker also pays for its imports, as it
+would in its own container.
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import yaml
+
+KUBEFLOW_DIR = os.path.dirname(os.path.abspath(__file__))
+NOTEBOOK = os.path.join(KUBEFLOW_DIR, "disease-risk-pipeline.ipynb")
+sys.path.insert(0, os.path.join(KUBEFLOW_DIR, "pipeline_lib"))
+
+PARAMETER_TYPES = {
+    "STRING": str,
+    "NUMBER_INTEGER": int,
+    "NUMBER_DOUBLE": float,
+    "BOOLEAN": lambda value: (
+        value if isinstance(value, bool) else value.lower() == "true"
+    ),
+    "LIST": lambda value: value if isinstance(value, list) else json.loads(value),
+    "STRUCT": lambda value: value if isinstance(value, dict) else json.loads(value),
+}
+
+# Set in each worker process by init_worker
+_components = None
+
+
+def load_components(notebook=NOTEBOOK, directory=None):
+    """The component cells of the notebook as a module.
+
+    kfp and step_cache.code_digest read a component's source with inspect,
+    so the cells are written to a file, named after their content, in
+    `directory`. embedded_artifact_path is relative to the notebook.
+    """
+    with open(notebook) as f:
+        cells = ["".join(cell["source"]) for cell in json.load(f)["cells"]]
+    source = "\n\n".join(
+        cell for cell in cells if cell.startswith(("import kfp", "@dsl.component"))
+    )
+    digest = hashlib.sha256(source.encode()).hexdigest()[:12]
+    path = os.path.join(
+        directory or tempfile.gettempdir(), f"disease_risk_components_{digest}.py"
+    )
+    if not os.path.exists(path):
+        with open(path + ".part", "w") as f:
+            f.write(source)
+        os.replace(path + ".part", path)
+    spec = importlib.util.spec_from_file_location("disease_risk_components", path)
+    module = importlib.util.module_from_spec(spec)
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(notebook)))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+def load_pipeline(path):
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def pipeline_arguments(spec, arguments):
+    """The pipeline's inputs: `arguments` (strings or values) over the defaults."""
+    definitions = spec["root"].get("inputDefinitions", {}).get("parameters", {})
+    unknown = set(arguments) - set(definitions)
+    if unknown:
+        raise ValueError(f"unknown pipeline arguments: {', '.join(sorted(unknown))}")
+    values = {}
+    for name, definition in definitions.items():
+        if name in arguments:
+            value = arguments[name]
+        elif "defaultValue" in definition:
+            value = definition["defaultValue"]
+        elif definition.get("isOptional"):
+            continue
+        else:
+            raise ValueError(f"missing pipeline argument {name}")
+        values[name] = PARAMETER_TYPES[definition["parameterType"]](value)
+    return values
+
+
+def task_function(spec, task):
+    """The name of the component function a task runs."""
+    component = spec["components"][task["componentRef"]["name"]]
+    executor = spec["deploymentSpec"]["executors"][component["executorLabel"]]
+    args = executor["container"]["args"]
+    return args[args.index("--function_to_execute") + 1]
+
+
+def task_arguments(spec, task, inputs, outputs, scope=""):
+    """A task's arguments from its DAG's inputs and upstream task outputs.
+
+    Tasks inside a loop have the scope `<loop>/<iteration>/`, so the same
+    task in two iterations has two sets of outputs.
+    """
+    component = spec["components"][task["componentRef"]["name"]]
+    definitions = component.get("inputDefinitions", {}).get("parameters", {})
+    arguments = {}
+    for name, source in task.get("inputs", {}).get("parameters", {}).items():
+        if "componentInputParameter" in source:
+            if source["componentInputParameter"] not in inputs:
+                continue
+            value = inputs[source["componentInputParameter"]]
+        elif "taskOutputParameter" in source:
+            upstream = source["taskOutputParameter"]
+            producer = scope + upstream["producerTask"]
+            value = outputs[producer][upstream["outputParameterKey"]]
+        elif "runtimeValue" in source and "parameterExpressionSelector" not in source:
+            value = source["runtimeValue"]["constant"]
+        else:
+            raise NotImplementedError(f"input {name} of a task: {source}")
+        arguments[name] = PARAMETER_TYPES[definitions[name]["parameterType"]](value)
+    return arguments
+
+
+def reset_peak_memory():
+    """Reset this process's peak RSS, where Linux allows it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_memory():
+    """Peak RSS in bytes since reset_peak_memory, or of the whole process."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def cpu_seconds():
+    """CPU time of this process and of the processes it has waited for."""
+    return sum(
+        usage.ru_utime + usage.ru_stime
+        for usage in (
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN),
+        )
+    )
+
+
+def init_worker(notebook, store_root):
+    """Pool initializer: load the components and point Minio at the store."""
+    import minio
+    import step_cache
+
+    global _components
+    if _components is None:
+        _components = load_components(notebook)
+    store = step_cache.LocalObjectStore(store_root)
+    minio.Minio = lambda *args, **kwargs: store
+
+
+def run_task(function, arguments):
+    """Run one component function in a worker; return (outputs, metrics)."""
+    reset_peak_memory()
+    start, cpu = time.perf_counter(), cpu_seconds()
+    result = getattr(_components, function).python_func(**arguments)
+    metrics = {
+        "function": function,
+        "wall_seconds": time.perf_counter() - start,
+        "cpu_seconds": cpu_seconds() - cpu,
+        "peak_memory_bytes": peak_memory(),
+        "worker": os.getpid(),
+    }
+    if hasattr(result, "_fields"):
+        return dict(zip(result._fields, result)), metrics
+    return {"Output": result}, metrics
+
+
+def expand_dag(spec, node, task, arguments, nodes):
+    """Add the tasks of a sub-DAG task (a ParallelFor) to `nodes`, once per
+    item; return the scopes of its iterations."""
+    if "triggerPolicy" in task:
+        raise NotImplementedError(f"conditions, in task {node}")
+    component = spec["components"][task["componentRef"]["name"]]
+    iterator = task.get("parameterIterator")
+    if iterator is None:
+        items = [None]
+    elif "inputParameter" in iterator["items"]:
+        items = arguments[iterator["items"]["inputParameter"]]
+    else:
+        items = json.loads(iterator["items"]["raw"])
+    scopes = []
+    for index, item in enumerate(items):
+        scope = f"{node}/{index}/"
+        inputs = dict(arguments)
+        if iterator is not None:
+            inputs[iterator["itemInput"]] = item
+        for name, subtask in component["dag"]["tasks"].items():
+            nodes[scope + name] = (subtask, scope, inputs)
+        scopes.append(scope)
+    return scopes
+
+
+def dag_outputs(dag, outputs, scopes, collect):
+    """A DAG's outputs; from a loop, each is the list over its iterations."""
+    result = {}
+    for name, source in dag.get("outputs", {}).get("parameters", {}).items():
+        upstream = source["valueFromParameter"]
+        values = [
+            outputs[scope + upstream["producerSubtask"]][upstream["outputParameterKey"]]
+            for scope in scopes
+        ]
+        result[name] = values if collect else values[0]
+    return result
+
+
+def run_pipeline(spec, arguments, store_root, workers=None, notebook=NOTEBOOK):
+    """Run every task of a compiled pipeline; return the report."""
+    inputs = pipeline_arguments(spec, arguments)
+    # Every task to run, by its scoped name: (task, scope, its DAG's inputs).
+    # A loop adds the tasks of its iterations when it starts
+    nodes = {
+        name: (task, "", inputs) for name, task in spec["root"]["dag"]["tasks"].items()
+    }
+    loops = {}
+    outputs, steps, submitted = {}, {}, {}
+    os.makedirs(store_root, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(notebook, os.path.abspath(store_root)),
+    ) as pool:
+        running = {}
+        while len(outputs) < len(nodes):
+            progress = False
+            for node, (task, scope, dag_inputs) in list(nodes.items()):
+                started = node in outputs or node in loops or node in submitted
+                ready = all(
+                    scope + upstream in outputs
+                    for upstream in task.get("dependentTasks", [])
+                )
+                if started or not ready:
+                    continue
+                node_arguments = task_arguments(spec, task, dag_inputs, outputs, scope)
+                component = spec["components"][task["componentRef"]["name"]]
+                if "dag" in component:
+                    loops[node] = expand_dag(spec, node, task, node_arguments, nodes)
+                    progress = True
+                    continue
+                future = pool.submit(
+                    run_task, task_function(spec, task), node_arguments
+                )
+                running[future] = node
+                submitted[node] = time.perf_counter() - start
+                progress = True
+
+            # A loop is done when all the tasks of its iterations are
+            for node, scopes in loops.items():
+                children = [child for child in nodes if child.startswith(tuple(scopes))]
+                if node not in outputs and all(child in outputs for child in children):
+                    task = nodes[node][0]
+                    component = spec["components"][task["componentRef"]["name"]]
+                    outputs[node] = dag_outputs(
+                        component["dag"],
+                        outputs,
+                        scopes,
+                        "parameterIterator" in task,
+                    )
+                    progress = True
+            if not running:
+                if not progress:
+                    raise RuntimeError("tasks left that can never run")
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                try:
+                    outputs[node], metrics = future.result()
+                except Exception as error:
+                    for other in running:
+                        other.cancel()
+                    raise RuntimeError(f"task {node} failed: {error}") from error
+                steps[node] = {"submitted_seconds": submitted[node], **metrics}
+
+    return {
+        "pipeline": spec["pipelineInfo"]["name"],
+        "arguments": inputs,
+        "workers": workers,
+        "wall_seconds": time.perf_counter() - start,
+        "steps": steps,
+        "task_outputs": outputs,
+        "outputs": dag_outputs(spec["root"]["dag"], outputs, [""], False),
+    }
+
+
+def compare_reports(baseline, report, tolerance, min_seconds=0.1):
+    """The steps of `report` more than `tolerance` slower than in `baseline`.
+
+    A step must also be min_seconds slower, so the noise of short steps is
+    not reported.
+    """
+    regressions = []
+    for name, step in report["steps"].items():
+        before = baseline["steps"].get(name)
+        if not before:
+            continue
+        slower = step["wall_seconds"] - before["wall_seconds"]
+        if (
+            step["wall_seconds"] > before["wall_seconds"] * (1 + tolerance)
+            and slower > min_seconds
+        ):
+            regressions.append(
+                f"{name}: {step['wall_seconds']:.2f} s, was "
+                f"{before['wall_seconds']:.2f} s"
+            )
+    return regressions
+
+
+def format_report(report):
+    width = max([len(name) for name in report["steps"]] + [4]) + 2
+    lines = [
+        f"{report['pipeline']}: {report['wall_seconds']:.2f} s with "
+        f"{report['workers']} workers",
+        f"{'step':<{width}}{'wall s':>9}{'cpu s':>9}{'peak MiB':>10}",
+    ]
+    for name, step in report["steps"].items():
+        lines.append(
+            f"{name:<{width}}{step['wall_seconds']:>9.2f}{step['cpu_seconds']:>9.2f}"
+            f"{step['peak_memory_bytes'] / 2**20:>10.1f}"
+        )
+    lines.extend(f"{name}: {value}" for name, value in report["outputs"].items())
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pipeline", help="compiled pipeline YAML")
+    parser.add_argument(
+        "--arg",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="a pipeline argument; repeat for each",
+    )
+    parser.add_argument("--store", default="local-store", help="local object store")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--notebook", default=NOTEBOOK)
+    parser.add_argument("--report", help="write the report as JSON here")
+    parser.add_argument("--baseline", help="an earlier --report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-seconds", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    arguments = dict(argument.split("=", 1) for argument in args.arg)
+    report = run_pipeline(
+        load_pipeline(args.pipeline), arguments, args.store, args.workers, args.notebook
+    )
+    print(format_report(report))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_reports(
+                json.load(f), report, args.tolerance, args.min_seconds
+            )
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""One compressed archive per pipeline step, moved in parallel and in memory.
+
+A step packs all of its outputs into one .npz (a deflated zip). NumPy arrays
+are stored as they are. Other objects (scalers, encoders, models) are stored
+as joblib pickles in uint8 arrays, under their name plus ".pkl". The archive is
+built and read in memory; nothing is staged through /tmp:
+
+- `upload` sends the bytes with `put_object`. Above PART_SIZE, the client
+  splits them into a multipart upload with WORKERS parts in flight.
+- `download` fetches PART_SIZE ranges with WORKERS parallel `get_object`
+  calls into one buffer. Given the SHA-256 from the step's cache manifest, it
+  rejects a corrupt or partial download.
+
+Files too large for memory, like batch_scoring.py's readings, go through
+`download_file` and `upload_file`, which do the same to and from local disk.
+
+The client is anything with Minio's put_object, get_object and stat_object.
+step_cache.LocalObjectStore is the local-directory stand-in used in tests.
+"""
+
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# MinIO's smallest multipart part is 5 MiB
+PART_SIZE = 8 << 20
+WORKERS = 4
+PICKLE_SUFFIX = ".pkl"
+
+
+def pack(members):
+    """{name: array or object} as the bytes of a compressed .npz archive."""
+    import joblib
+
+    arrays = {}
+    for name, value in members.items():
+        if isinstance(value, np.ndarray):
+            arrays[name] = value
+        else:
+            pickled = io.BytesIO()
+            joblib.dump(value, pickled)
+            arrays[name + PICKLE_SUFFIX] = np.frombuffer(
+                pickled.getbuffer(), dtype=np.uint8
+            )
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def unpack(data, names=None):
+    """The members of an archive from `pack`, or only those in `names`."""
+    import joblib
+
+    members = {}
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        for key in archive.files:
+            name = key[: -len(PICKLE_SUFFIX)] if key.endswith(PICKLE_SUFFIX) else key
+            if names is not None and name not in names:
+                continue
+            if key.endswith(PICKLE_SUFFIX):
+                members[name] = joblib.load(io.BytesIO(archive[key].tobytes()))
+            else:
+                members[name] = archive[key]
+    return members
+
+
+def member_digests(data):
+    """SHA-256 of each member's stored bytes, by name."""
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        return {
+            key[: -len(PICKLE_SUFFIX)] if key.endswith(PICKLE_SUFFIX) else key: (
+                hashlib.sha256(np.ascontiguousarray(archive[key]).data).hexdigest()
+            )
+            for key in archive.files
+        }
+
+
+def upload(client, bucket, name, data, part_size=PART_SIZE, workers=WORKERS):
+    client.put_object(
+        bucket,
+        name,
+        io.BytesIO(data),
+        len(data),
+        part_size=part_size,
+        num_parallel_uploads=workers,
+    )
+
+
+def _get_range(client, bucket, name, offset, length):
+    response = client.get_object(bucket, name, offset=offset, length=length)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def download(
+    client,
+    bucket,
+    name,
+    size=None,
+    sha256=None,
+    part_size=PART_SIZE,
+    workers=WORKERS,
+):
+    """The bytes of an object, fetched in parallel ranges.
+
+    `size` saves a stat_object call when the caller already knows it.
+    """
+    if size is None:
+        size = client.stat_object(bucket, name).size
+    if size <= part_size:
+        data = _get_range(client, bucket, name, 0, 0)
+    else:
+        buffer = bytearray(size)
+        offsets = range(0, size, part_size)
+
+        def fetch(offset):
+            length = min(part_size, size - offset)
+            buffer[offset : offset + length] = _get_range(
+                client, bucket, name, offset, length
+            )
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() re-raises the first failed range
+            list(pool.map(fetch, offsets))
+        data = bytes(buffer)
+    if sha256 is not None and hashlib.sha256(data).hexdigest() != sha256:
+        raise ValueError(f"checksum mismatch downloading {bucket}/{name}")
+    return data
+
+
+def download_file(client, bucket, name, path, part_size=PART_SIZE, workers=WORKERS):
+    """Write an object to path, fetching parallel ranges into place."""
+    size = client.stat_object(bucket, name).size
+    with open(path, "wb") as f:
+        f.truncate(size)
+        fd = f.fileno()
+
+        def fetch(offset):
+            length = min(part_size, size - offset)
+            os.pwrite(fd, _get_range(client, bucket, name, offset, length), offset)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fetch, range(0, size, part_size)))
+    return size
+
+
+def upload_file(client, bucket, name, path, part_size=PART_SIZE, workers=WORKERS):
+    with open(path, "rb") as f:
+        client.put_object(
+            bucket,
+            name,
+            f,
+            os.fstat(f.fileno()).st_size,
+            part_size=part_size,
+            num_parallel_uploads=workers,
+        )
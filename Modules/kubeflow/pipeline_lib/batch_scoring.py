@@ -0,0 +1,291 @@
+"""Score a large CSV or Parquet file of readings with a process pool.
+
+    python batch_scoring.py READINGS OUTPUT --model outputs.npz [--workers N] [--chunk-rows 100000] [--report report.json]
+
+READINGS has the columns crop_name, temperature, humidity and soil_moisture.
+It is read in chunks of --chunk-rows. The chunks are fanned out to a pool of
+worker processes, by default one per whole CPU of the container's cgroup
+quota. Each worker loads the model once, from the training step's archive
+(see artifacts.py), and scores whole chunks with it. Results are written to
+OUTPUT (.csv or .parquet) as they arrive, always in input order. A few chunks
+are read ahead of the slowest one, so memory stays bounded by the chunk size
+rather than the file size.
+
+OUTPUT has the reading columns plus disease_risk, and an error for rows that
+cannot be scored (an unknown crop, a missing or non-numeric value). Such rows
+only fail themselves, and non-numeric values are written as empty. The
+report has the throughput and the timing of every chunk.
+
+Parquet needs pyarrow, which the batch_predict component installs; a local
+run without it stops before reading anything.
+
+The pipeline's batch_predict component runs the same code.
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+FEATURES = ["crop_name", "temperature", "humidity", "soil_moisture"]
+NUMERIC_FEATURES = FEATURES[1:]
+OUTPUT_COLUMNS = FEATURES + ["disease_risk", "error"]
+
+# Set in each worker process by load_worker_model
+_model = None
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit(root=CGROUP_ROOT):
+    """CPUs granted by the cgroup CPU quota, or None when there is no quota.
+
+    Reads cpu.max (cgroup v2) or cpu.cfs_quota_us (v1) where a container sees
+    its own cgroup, at the mount root.
+    """
+    cpu_max = _read(os.path.join(root, "cpu.max"))
+    if cpu_max:
+        quota, period = cpu_max.split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    for controller in ("cpu", "cpu,cpuacct"):
+        quota = _read(os.path.join(root, controller, "cpu.cfs_quota_us"))
+        period = _read(os.path.join(root, controller, "cpu.cfs_period_us"))
+        if quota and period:
+            return int(quota) / int(period) if int(quota) > 0 else None
+    return None
+
+
+def available_cpus():
+    """Whole CPUs the pod may use: the affinity mask capped by the quota.
+
+    os.sched_getaffinity reports the node's CPUs. A pod limited to a few
+    CPUs on a large node would otherwise fork a worker, and a copy of the
+    model, per node CPU.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    return max(1, math.floor(min(cpus, limit) if limit else cpus))
+
+
+def require_pyarrow(*paths):
+    """Fail before any work when a path is Parquet and pyarrow is missing."""
+    if not any(path.endswith(".parquet") for path in paths):
+        return
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            "Parquet files need pyarrow, which is not installed; "
+            "pip install pyarrow, or use .csv"
+        ) from None
+
+
+def iter_chunks(path, chunk_rows):
+    """DataFrames of at most chunk_rows readings, in file order."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(
+            batch_size=chunk_rows, columns=FEATURES
+        ):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(
+            path, usecols=FEATURES, chunksize=chunk_rows, dtype={"crop_name": str}
+        )
+
+
+def load_worker_model(archive):
+    """Pool initializer: unpack the training archive once per worker."""
+    import artifacts
+
+    global _model
+    _model = artifacts.unpack(archive)
+    _model["crop_index"] = {
+        crop: code
+        for code, crop in enumerate(_model["crop_label_encoder"].classes_.tolist())
+    }
+
+
+def score_chunk(index, chunk):
+    """Score one chunk in a worker; return (index, scored chunk, timing)."""
+    start = time.perf_counter()
+    crop_codes = chunk["crop_name"].map(_model["crop_index"])
+    numeric = chunk[NUMERIC_FEATURES].apply(pd.to_numeric, errors="coerce")
+    finite = np.isfinite(numeric.to_numpy(dtype=np.float64)).all(axis=1)
+    valid = crop_codes.notna().to_numpy() & finite
+
+    risk = np.full(len(chunk), None, dtype=object)
+    if valid.any():
+        features = np.column_stack(
+            [crop_codes.to_numpy()[valid], numeric.to_numpy(dtype=np.float64)[valid]]
+        ).astype(np.float64)
+        scaler = _model["scaler"]
+        if hasattr(scaler, "feature_names_in_"):
+            features = pd.DataFrame(features, columns=scaler.feature_names_in_)
+        codes = _model["model"].predict(scaler.transform(features))
+        risk[valid] = _model["risk_label_encoder"].inverse_transform(codes)
+
+    error = np.full(len(chunk), None, dtype=object)
+    error[crop_codes.isna().to_numpy()] = "unknown crop_name"
+    error[~finite & crop_codes.notna().to_numpy()] = "non-numeric reading"
+    scored = numeric.assign(
+        crop_name=chunk["crop_name"], disease_risk=risk, error=error
+    )[OUTPUT_COLUMNS]
+    return (
+        index,
+        scored,
+        {
+            "chunk": index,
+            "rows": len(chunk),
+            "errors": int(np.count_nonzero(~valid)),
+            "seconds": time.perf_counter() - start,
+            "worker": os.getpid(),
+        },
+    )
+
+
+class OutputWriter:
+    """Append scored chunks to a CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self.writer = None
+        self.first = True
+
+    def write(self, frame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # A fixed schema, or a chunk without errors would have a null-typed
+            # error column
+            schema = pa.schema(
+                [(name, pa.float64()) for name in NUMERIC_FEATURES]
+                + [(name, pa.string()) for name in ("disease_risk", "error")]
+            ).insert(0, pa.field("crop_name", pa.string()))
+            table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, schema)
+            self.writer.write_table(table)
+        else:
+            frame.to_csv(
+                self.path,
+                mode="w" if self.first else "a",
+                header=self.first,
+                index=False,
+            )
+        self.first = False
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        elif self.first:
+            # No rows: still leave a valid, empty output
+            self.write(pd.DataFrame(columns=OUTPUT_COLUMNS))
+
+
+def score_file(readings_path, output_path, archive, workers=None, chunk_rows=100_000):
+    """Score readings_path into output_path; return the report.
+
+    `archive` is the bytes of the training step's archive.
+    """
+    require_pyarrow(readings_path, output_path)
+    workers = workers or available_cpus()
+    start = time.perf_counter()
+    chunks = []
+    writer = OutputWriter(output_path)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=load_worker_model, initargs=(archive,)
+    ) as pool:
+        # Scored chunks are written in input order; a few more than there are
+        # workers are in flight, so a slow chunk does not stall the others
+        pending = deque()
+        for index, chunk in enumerate(iter_chunks(readings_path, chunk_rows)):
+            pending.append(pool.submit(score_chunk, index, chunk))
+            if len(pending) >= 2 * workers:
+                _, scored, timing = pending.popleft().result()
+                writer.write(scored)
+                chunks.append(timing)
+        while pending:
+            _, scored, timing = pending.popleft().result()
+            writer.write(scored)
+            chunks.append(timing)
+    writer.close()
+
+    seconds = time.perf_counter() - start
+    rows = sum(chunk["rows"] for chunk in chunks)
+    return {
+        "readings": readings_path,
+        "output": output_path,
+        "workers": workers,
+        "chunk_rows": chunk_rows,
+        "rows": rows,
+        "errors": sum(chunk["errors"] for chunk in chunks),
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+        "chunks": chunks,
+    }
+
+
+def format_report(report):
+    seconds = [chunk["seconds"] for chunk in report["chunks"]] or [0.0]
+    return (
+        f"Scored {report['rows']} rows ({report['errors']} errors) in "
+        f"{report['seconds']:.2f} s with {report['workers']} workers: "
+        f"{report['rows_per_second']:.0f} rows/s; {len(report['chunks'])} chunks "
+        f"of up to {report['chunk_rows']} rows, "
+        f"{np.median(seconds) * 1000:.0f} ms median / "
+        f"{max(seconds) * 1000:.0f} ms max to score"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("readings", help=".csv or .parquet file of readings")
+    parser.add_argument("output", help=".csv or .parquet file to write")
+    parser.add_argument(
+        "--model", required=True, help="archive written by the training step"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--report", help="write the report, with every chunk, here")
+    args = parser.parse_args(argv)
+    try:
+        require_pyarrow(args.readings, args.output)
+    except ImportError as e:
+        parser.error(str(e))
+
+    with open(args.model, "rb") as f:
+        archive = f.read()
+    report = score_file(
+        args.readings, args.output, archive, args.workers, args.chunk_rows
+    )
+    print(format_report(report))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""Per-crop models behind the interface of one model.
+
+The partitioned pipeline trains one forest per crop, in parallel, on the rows
+of that crop. PartitionedModel routes every row to the forest of its crop. It
+has the `predict` and `predict_proba` of the global forest and is stored the
+same way, with the same scaler and encoders, so predict, batch_predict and
+batch_scoring.py use either model unchanged.
+
+The crop is the first feature. Rows arrive scaled, so its code is recovered
+with the scaler's mean and scale.
+"""
+
+import numpy as np
+
+
+def crop_codes(X, scaler):
+    """The crop code of every scaled row of X."""
+    return _unscale(X, scaler.mean_[0], scaler.scale_[0])
+
+
+def _unscale(X, mean, scale):
+    return np.rint(X[:, 0] * scale + mean).astype(np.int64)
+
+
+class PartitionedModel:
+    """One fitted classifier per crop code, with the global classes."""
+
+    def __init__(self, models, scaler, classes):
+        self.models = dict(models)
+        self.mean = float(scaler.mean_[0])
+        self.scale = float(scaler.scale_[0])
+        self.classes_ = np.asarray(classes)
+
+    def _route(self, X):
+        """(rows, model) for each crop in X."""
+        if not len(X):
+            return []
+        codes = _unscale(X, self.mean, self.scale)
+        unknown = set(np.unique(codes).tolist()) - set(self.models)
+        if unknown:
+            raise ValueError(f"no model for crop codes {sorted(unknown)}")
+        if np.all(codes == codes[0]):
+            # The common case of one request: no gather or scatter
+            return [(slice(None), self.models[int(codes[0])])]
+        return [
+            (np.flatnonzero(codes == code), self.models[code])
+            for code in np.unique(codes).tolist()
+        ]
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        predictions = np.empty(len(X), dtype=self.classes_.dtype)
+        for rows, model in self._route(X):
+            predictions[rows] = model.predict(X[rows])
+        return predictions
+
+    def predict_proba(self, X):
+        """Probabilities over the global classes; a crop's forest may lack some."""
+        X = np.asarray(X, dtype=np.float64)
+        proba = np.zeros((len(X), self.classes_.size))
+        for rows, model in self._route(X):
+            columns = np.searchsorted(self.classes_, model.classes_)
+            proba[np.ix_(np.arange(len(X))[rows], columns)] = model.predict_proba(
+                X[rows]
+            )
+        return proba
@@ -0,0 +1,216 @@
+"""Content-addressed step caching for disease-risk-pipeline.ipynb.
+
+Each pipeline step computes a key: a SHA-256 over its source code and the
+modules of this directory, its parameters and the digests of its input
+artifacts. The outputs of a step are uploaded as one archive (see
+artifacts.py) under `<prefix>/<step>/<key>/`. A manifest.json goes last, with
+the SHA-256 of the archive and of every member, so an entry without a manifest
+is incomplete. When a later run computes the same key and finds the manifest,
+the step skips its work and hands the existing entry to the next step. Only the steps whose code,
+parameters or inputs changed run again.
+
+Kubeflow's own execution cache only keys on a task's parameters. It cannot see
+that the objects behind a path in MinIO changed.
+
+The components embed this directory (`embedded_artifact_path`), so its
+modules can be imported inside them. LocalObjectStore is a directory-backed
+stand-in for the part of the Minio client used here, for tests and local runs.
+"""
+
+import functools
+import hashlib
+import inspect
+import io
+import json
+import os
+import types
+
+import artifacts
+
+MANIFEST = "manifest.json"
+ARCHIVE = "outputs.npz"
+
+# The embedded copy of this directory, inside a component
+LIBRARY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _Response(io.BytesIO):
+    def release_conn(self):
+        pass
+
+
+class LocalObjectStore:
+    """The Minio client calls used by the pipeline, on a local directory.
+
+    Objects live at `root/<bucket>/<name>`.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, name):
+        return os.path.join(self.root, bucket, *name.split("/"))
+
+    def _existing(self, bucket, name):
+        path = self._path(bucket, name)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"{bucket}/{name}")
+        return path
+
+    def put_object(self, bucket, name, data, length, **kwargs):
+        path = self._path(bucket, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".part", "wb") as f:
+            f.write(data.read(length))
+        os.replace(path + ".part", path)
+
+    def get_object(self, bucket, name, offset=0, length=0):
+        with open(self._existing(bucket, name), "rb") as f:
+            f.seek(offset)
+            return _Response(f.read(length or -1))
+
+    def stat_object(self, bucket, name):
+        path = self._existing(bucket, name)
+        # MinIO's ETag of a single-part upload is the MD5 of the content
+        with open(path, "rb") as f:
+            etag = hashlib.md5(f.read()).hexdigest()
+        return types.SimpleNamespace(etag=etag, size=os.path.getsize(path))
+
+
+def is_missing(error):
+    """A missing object, from Minio (S3Error NoSuchKey) or LocalObjectStore."""
+    return isinstance(error, FileNotFoundError) or getattr(error, "code", None) in (
+        "NoSuchKey",
+        "NoSuchObject",
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def library_digest(directory):
+    """SHA-256 over the names and sources of the modules in `directory`."""
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py"):
+            digest.update(name.encode() + b"\0")
+            with open(os.path.join(directory, name), "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def code_digest(func):
+    """SHA-256 of a step function's source, or of its bytecode without one,
+    and of this library, whose helpers the steps call."""
+    func = getattr(func, "python_func", func)
+    try:
+        code = inspect.getsource(func).encode()
+    except (OSError, TypeError):
+        code = func.__code__.co_code + repr(func.__code__.co_consts).encode()
+    return hashlib.sha256(code + library_digest(LIBRARY_DIR).encode()).hexdigest()
+
+
+def object_digest(client, bucket, name):
+    """Digest of an object the pipeline did not write, from its ETag."""
+    return "etag:" + client.stat_object(bucket, name).etag.strip('"')
+
+
+def step_key(code, params, inputs):
+    """The cache key of a step: its code digest, parameters (JSON-able) and
+    input digests by name."""
+    payload = json.dumps(
+        {"code": code, "params": params, "inputs": inputs},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class StepCache:
+    """Cache entries of one step under `<prefix>/<step>/` in a bucket."""
+
+    def __init__(self, client, bucket, prefix, step, enabled=True):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.step = step
+        self.enabled = enabled
+
+    def path(self, key):
+        return f"{self.prefix}/{self.step}/{key}"
+
+    def lookup(self, key):
+        """The manifest of the entry for `key`, or None; prints hit or miss."""
+        manifest = read_manifest(self.client, self.bucket, self.path(key))
+        hit = self.enabled and manifest is not None
+        print(
+            f"cache {'hit' if hit else 'miss'}: {self.step} {key[:12]}"
+            + ("" if self.enabled else " (caching disabled)")
+        )
+        return manifest if hit else None
+
+    def store(self, key, members, params=None, inputs=None):
+        """Upload {name: array or object} as the entry for `key`; return its
+        manifest."""
+        path = self.path(key)
+        data = artifacts.pack(members)
+        artifacts.upload(self.client, self.bucket, f"{path}/{ARCHIVE}", data)
+        manifest = {
+            "step": self.step,
+            "key": key,
+            "params": params or {},
+            "inputs": inputs or {},
+            "archive": {
+                "name": ARCHIVE,
+                "sha256": hashlib.sha256(data).hexdigest(),
+                "bytes": len(data),
+            },
+            "outputs": {
+                name: {"sha256": digest}
+                for name, digest in artifacts.member_digests(data).items()
+            },
+        }
+        # The manifest goes last: it is what makes the entry a hit
+        body = json.dumps(manifest, indent=2).encode()
+        self.client.put_object(
+            self.bucket, f"{path}/{MANIFEST}", io.BytesIO(body), len(body)
+        )
+        return manifest
+
+
+def read_manifest(client, bucket, path):
+    """The manifest of the cache entry at `path`, or None if there is none."""
+    try:
+        response = client.get_object(bucket, f"{path}/{MANIFEST}")
+    except Exception as e:
+        if not is_missing(e):
+            raise
+        return None
+    try:
+        return json.loads(response.read())
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def load_archive(client, bucket, path, manifest=None):
+    """The archive of the cache entry at `path`, checked against its manifest."""
+    manifest = manifest or read_manifest(client, bucket, path)
+    if manifest is None:
+        raise ValueError(f"no cache entry at {path}")
+    archive = manifest["archive"]
+    return artifacts.download(
+        client,
+        bucket,
+        f"{path}/{archive['name']}",
+        size=archive["bytes"],
+        sha256=archive["sha256"],
+    )
+
+
+def load_outputs(client, bucket, path, names=None, manifest=None):
+    """The outputs of the cache entry at `path`, checked against its manifest."""
+    return artifacts.unpack(load_archive(client, bucket, path, manifest), names)
+
+
+def output_digests(manifest, names):
+    """Digests of some outputs of an upstream entry, as inputs of the next step."""
+    return {name: manifest["outputs"][name]["sha256"] for name in names}
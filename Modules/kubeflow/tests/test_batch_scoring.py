@@ -0,0 +1,266 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+KUBEFLOW_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(KUBEFLOW_DIR, "pipeline_lib"))
+sys.path.insert(0, KUBEFLOW_DIR)
+
+import artifacts  # noqa: E402
+import batch_scoring  # noqa: E402
+import local_runner  # noqa: E402
+from step_cache import LocalObjectStore  # noqa: E402
+
+BUCKET = "kubeflow-pipelines"
+
+CROPS = ["wheat", "rice", "maize"]
+
+
+def readings(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "crop_name": rng.choice(CROPS, rows),
+            "temperature": rng.uniform(15, 30, rows),
+            "humidity": rng.uniform(25, 60, rows),
+            "soil_moisture": rng.uniform(35, 65, rows),
+        }
+    )
+
+
+def training_archive():
+    """A model archive in the layout of the training step."""
+    frame = readings(300, seed=1)
+    crop_label_encoder = LabelEncoder().fit(CROPS)
+    risk_label_encoder = LabelEncoder().fit(["low", "medium", "high"])
+    X = frame.assign(crop_name=crop_label_encoder.transform(frame["crop_name"]))
+    scaler = StandardScaler().fit(X)
+    y = (frame["temperature"] > 20).astype(int) + (frame["humidity"] > 45)
+    model = RandomForestClassifier(n_estimators=10, random_state=0)
+    model.fit(scaler.transform(X), y)
+    return artifacts.pack(
+        {
+            "model": model,
+            "scaler": scaler,
+            "crop_label_encoder": crop_label_encoder,
+            "risk_label_encoder": risk_label_encoder,
+        }
+    )
+
+
+def expected_risk(archive, frame):
+    members = artifacts.unpack(archive)
+    X = frame.assign(
+        crop_name=members["crop_label_encoder"].transform(frame["crop_name"])
+    )
+    codes = members["model"].predict(members["scaler"].transform(X))
+    return members["risk_label_encoder"].inverse_transform(codes)
+
+
+class TestScoreFile(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.archive = training_archive()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_rows_keep_input_order(self):
+        frame = readings(1000)
+        frame.to_csv(self.path("readings.csv"), index=False)
+        report = batch_scoring.score_file(
+            self.path("readings.csv"),
+            self.path("scored.csv"),
+            self.archive,
+            workers=2,
+            chunk_rows=97,
+        )
+        scored = pd.read_csv(self.path("scored.csv"))
+        self.assertEqual(list(scored.columns), batch_scoring.OUTPUT_COLUMNS)
+        pd.testing.assert_series_equal(scored["crop_name"], frame["crop_name"])
+        np.testing.assert_allclose(scored["humidity"], frame["humidity"])
+        np.testing.assert_array_equal(
+            scored["disease_risk"], expected_risk(self.archive, frame)
+        )
+        self.assertEqual((report["rows"], report["errors"]), (1000, 0))
+        self.assertEqual(
+            [chunk["chunk"] for chunk in report["chunks"]], list(range(11))
+        )
+
+    def test_invalid_rows_fail_alone(self):
+        frame = readings(6).astype({"temperature": object})
+        frame.loc[1, "crop_name"] = "barley"
+        frame.loc[3, "temperature"] = "n/a"
+        frame.to_csv(self.path("readings.csv"), index=False)
+        report = batch_scoring.score_file(
+            self.path("readings.csv"), self.path("scored.csv"), self.archive, 1
+        )
+        scored = pd.read_csv(self.path("scored.csv"))
+        self.assertEqual(
+            scored["error"].fillna("").tolist(),
+            ["", "unknown crop_name", "", "non-numeric reading", "", ""],
+        )
+        self.assertTrue(scored["disease_risk"][[1, 3]].isna().all())
+        valid = frame.drop(index=[1, 3]).astype({"temperature": float})
+        np.testing.assert_array_equal(
+            scored["disease_risk"].dropna(), expected_risk(self.archive, valid)
+        )
+        self.assertEqual(report["errors"], 2)
+
+    def test_parquet_in_and_out(self):
+        frame = readings(500)
+        frame.to_parquet(self.path("readings.parquet"), index=False)
+        batch_scoring.score_file(
+            self.path("readings.parquet"),
+            self.path("scored.parquet"),
+            self.archive,
+            workers=2,
+            chunk_rows=64,
+        )
+        scored = pd.read_parquet(self.path("scored.parquet"))
+        self.assertEqual(len(scored), 500)
+        np.testing.assert_array_equal(
+            scored["disease_risk"], expected_risk(self.archive, frame)
+        )
+        self.assertTrue(scored["error"].isna().all())
+
+    def test_parquet_without_pyarrow_fails_up_front(self):
+        readings(10).to_csv(self.path("readings.csv"), index=False)
+        with patch.dict(sys.modules, {"pyarrow": None}):
+            with self.assertRaisesRegex(ImportError, "pip install pyarrow"):
+                batch_scoring.score_file(
+                    self.path("readings.csv"),
+                    self.path("scored.parquet"),
+                    self.archive,
+                    1,
+                )
+        self.assertFalse(os.path.exists(self.path("scored.parquet")))
+
+    def test_empty_file(self):
+        readings(0).to_csv(self.path("readings.csv"), index=False)
+        report = batch_scoring.score_file(
+            self.path("readings.csv"), self.path("scored.csv"), self.archive, 1
+        )
+        self.assertEqual(report["rows"], 0)
+        self.assertEqual(
+            list(pd.read_csv(self.path("scored.csv")).columns),
+            batch_scoring.OUTPUT_COLUMNS,
+        )
+
+    def test_cli(self):
+        readings(50).to_csv(self.path("readings.csv"), index=False)
+        with open(self.path("outputs.npz"), "wb") as f:
+            f.write(self.archive)
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            batch_scoring.main(
+                [
+                    self.path("readings.csv"),
+                    self.path("scored.csv"),
+                    "--model",
+                    self.path("outputs.npz"),
+                    "--workers",
+                    "1",
+                    "--report",
+                    self.path("report.json"),
+                ]
+            )
+        self.assertIn("Scored 50 rows (0 errors)", stdout.getvalue())
+        self.assertTrue(os.path.exists(self.path("report.json")))
+
+
+class TestAvailableCpus(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = self.tmp.name
+
+    def write(self, name, text):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def test_cgroup_v2(self):
+        self.write("cpu.max", "250000 100000\n")
+        self.assertEqual(batch_scoring.cgroup_cpu_limit(self.root), 2.5)
+        self.write("cpu.max", "max 100000\n")
+        self.assertIsNone(batch_scoring.cgroup_cpu_limit(self.root))
+
+    def test_cgroup_v1(self):
+        self.write("cpu,cpuacct/cpu.cfs_quota_us", "50000\n")
+        self.write("cpu,cpuacct/cpu.cfs_period_us", "100000\n")
+        self.assertEqual(batch_scoring.cgroup_cpu_limit(self.root), 0.5)
+        self.write("cpu,cpuacct/cpu.cfs_quota_us", "-1\n")
+        self.assertIsNone(batch_scoring.cgroup_cpu_limit(self.root))
+
+    def test_workers_follow_the_quota_not_the_node(self):
+        with patch.object(os, "sched_getaffinity", return_value=set(range(64))):
+            for limit, workers in ((None, 64), (3.5, 3), (0.5, 1)):
+                with self.subTest(limit=limit), patch.object(
+                    batch_scoring, "cgroup_cpu_limit", return_value=limit
+                ):
+                    self.assertEqual(batch_scoring.available_cpus(), workers)
+
+
+class TestBatchPredictComponent(unittest.TestCase):
+    """batch_predict from the notebook, against a LocalObjectStore."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.components = local_runner.load_components(directory=cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.store = LocalObjectStore(tempfile.mkdtemp(dir=self.tmp.name))
+        minio = patch("minio.Minio", lambda *args, **kwargs: self.store)
+        minio.start()
+        self.addCleanup(minio.stop)
+
+    def test_scores_a_file_with_the_trained_model(self):
+        data = self.components.data_preparation.python_func(
+            storage_bucket=BUCKET, data_path="disease-risk"
+        )
+        training = self.components.model_building_training.python_func(
+            storage_bucket=BUCKET, data_path=data.data_path
+        )
+        frame = readings(300)
+        body = frame.to_csv(index=False).encode()
+        self.store.put_object(BUCKET, "readings/day.csv", io.BytesIO(body), len(body))
+
+        result = self.components.batch_predict.python_func(
+            storage_bucket=BUCKET,
+            model_path=training.model_path,
+            readings_path="readings/day.csv",
+            output_path="scores/day.csv",
+            workers=2,
+            chunk_rows=50,
+        )
+        self.assertEqual((result.output_path, result.rows), ("scores/day.csv", 300))
+        scored = pd.read_csv(self.store.get_object(BUCKET, "scores/day.csv"))
+        archive = artifacts.download(
+            self.store, BUCKET, f"{training.model_path}/outputs.npz"
+        )
+        np.testing.assert_array_equal(
+            scored["disease_risk"], expected_risk(archive, frame)
+        )
+        self.store.stat_object(BUCKET, "scores/day.csv.report.json")
+
+
+if __name__ == "__main__":
+    unittest.main()
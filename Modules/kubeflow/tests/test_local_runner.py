@@ -0,0 +1,164 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from kfp import compiler, dsl
+
+KUBEFLOW_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, KUBEFLOW_DIR)
+
+import local_runner  # noqa: E402
+
+READING = {
+    "crop_name": "rice",
+    "temperature": "25",
+    "humidity": "50",
+    "soil_moisture": "60",
+}
+
+
+class TestLocalRunner(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.components = local_runner.load_components(directory=cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.store = tempfile.mkdtemp(dir=self.tmp.name)
+
+    def compile(self, pipeline):
+        path = os.path.join(self.tmp.name, f"{pipeline.name}.yaml")
+        compiler.Compiler().compile(pipeline, path)
+        return local_runner.load_pipeline(path)
+
+    def test_runs_the_disease_risk_pipeline(self):
+        spec = local_runner.load_pipeline(
+            os.path.join(KUBEFLOW_DIR, "disease_risk_pipeline.yaml")
+        )
+        report = local_runner.run_pipeline(spec, READING, self.store, workers=1)
+        self.assertEqual(
+            report["outputs"], {"Output": "The disease risk for rice is high."}
+        )
+        self.assertEqual(
+            list(report["steps"]),
+            ["data-preparation", "model-building-training", "predict"],
+        )
+        for step in report["steps"].values():
+            self.assertGreater(step["wall_seconds"], 0)
+            self.assertGreaterEqual(step["cpu_seconds"], 0)
+            self.assertGreater(step["peak_memory_bytes"], 0)
+        self.assertFalse(report["task_outputs"]["data-preparation"]["cache_hit"])
+
+        # The artifacts, and so the step cache, persist in the store
+        again = local_runner.run_pipeline(spec, READING, self.store, workers=1)
+        self.assertTrue(again["task_outputs"]["data-preparation"]["cache_hit"])
+        self.assertTrue(again["task_outputs"]["model-building-training"]["cache_hit"])
+
+    def test_independent_tasks_run_in_parallel(self):
+        components = self.components
+
+        @dsl.pipeline(name="two-models")
+        def two_models() -> str:
+            models = []
+            for max_rows in (6, 12):
+                data = components.data_preparation(
+                    storage_bucket="kubeflow-pipelines",
+                    data_path="disease-risk",
+                    max_rows=max_rows,
+                )
+                models.append(
+                    components.model_building_training(
+                        storage_bucket="kubeflow-pipelines",
+                        data_path=data.outputs["data_path"],
+                    )
+                )
+            return models[1].outputs["model_path"]
+
+        report = local_runner.run_pipeline(
+            self.compile(two_models), {}, self.store, workers=2
+        )
+        steps = report["steps"]
+        self.assertEqual(len(steps), 4)
+        first, second = steps["data-preparation"], steps["data-preparation-2"]
+        # Both were submitted before either had finished
+        self.assertLess(
+            second["submitted_seconds"],
+            first["submitted_seconds"] + first["wall_seconds"],
+        )
+        self.assertEqual(
+            report["outputs"]["Output"],
+            report["task_outputs"]["model-building-training-2"]["model_path"],
+        )
+
+    def test_parallel_for_trains_one_model_per_crop(self):
+        spec = local_runner.load_pipeline(
+            os.path.join(KUBEFLOW_DIR, "disease_risk_partitioned_pipeline.yaml")
+        )
+        report = local_runner.run_pipeline(spec, READING, self.store, workers=2)
+        self.assertEqual(
+            report["outputs"], {"Output": "The disease risk for rice is high."}
+        )
+        loop = [name for name in report["steps"] if name.startswith("for-loop")]
+        self.assertEqual(len(loop), 3)
+        model_paths = report["task_outputs"]["for-loop-1"][
+            "pipelinechannel--model-building-training-2-model_path"
+        ]
+        self.assertEqual(len(set(model_paths)), 3)
+
+        comparison = json.loads(report["task_outputs"]["compare-models"]["Output"])
+        self.assertEqual(comparison["global"]["models"], 1)
+        self.assertEqual(comparison["partitioned"]["models"], 3)
+        self.assertLessEqual(
+            comparison["partitioned"]["training_wall_seconds"],
+            comparison["partitioned"]["training_seconds"],
+        )
+
+    def test_failed_task_stops_the_run(self):
+        components = self.components
+
+        @dsl.pipeline(name="missing-data")
+        def missing_data() -> str:
+            return components.model_building_training(
+                storage_bucket="kubeflow-pipelines", data_path="missing/data/path"
+            ).outputs["model_path"]
+
+        with self.assertRaisesRegex(RuntimeError, "model-building-training"):
+            local_runner.run_pipeline(self.compile(missing_data), {}, self.store)
+
+    def test_pipeline_arguments(self):
+        spec = local_runner.load_pipeline(
+            os.path.join(KUBEFLOW_DIR, "disease_risk_pipeline.yaml")
+        )
+        arguments = local_runner.pipeline_arguments(
+            spec, {**READING, "use_cache": "false"}
+        )
+        self.assertEqual(arguments["temperature"], 25.0)
+        self.assertEqual(arguments["max_rows"], 0)
+        self.assertIs(arguments["use_cache"], False)
+        with self.assertRaisesRegex(ValueError, "crop_name"):
+            local_runner.pipeline_arguments(spec, {})
+        with self.assertRaisesRegex(ValueError, "unknown"):
+            local_runner.pipeline_arguments(spec, {**READING, "rows": "1"})
+
+
+class TestCompareReports(unittest.TestCase):
+    def report(self, **seconds):
+        return {
+            "steps": {name: {"wall_seconds": value} for name, value in seconds.items()}
+        }
+
+    def test_regressions(self):
+        baseline = self.report(prepare=2.0, train=0.02, predict=1.0)
+        report = self.report(prepare=2.2, train=0.05, predict=1.5, extra=9.0)
+        regressions = local_runner.compare_reports(baseline, report, 0.25)
+        self.assertEqual(regressions, ["predict: 1.50 s, was 1.00 s"])
+
+
+if __name__ == "__main__":
+    unittest.main()
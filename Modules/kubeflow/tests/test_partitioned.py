@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+KUBEFLOW_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(KUBEFLOW_DIR, "pipeline_lib"))
+
+import artifacts  # noqa: E402
+import partitioned  # noqa: E402
+
+
+class TestPartitionedModel(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        crops = rng.integers(0, 3, 600)
+        features = rng.uniform(0, 100, (600, 3))
+        self.scaler = StandardScaler().fit(np.column_stack([crops, features]))
+        self.X = self.scaler.transform(np.column_stack([crops, features]))
+        # Crop 2 only ever has risk 0, so its forest knows one class
+        y = np.where(crops == 2, 0, (features[:, 0] > 50) + (features[:, 1] > 50))
+        codes = partitioned.crop_codes(self.X, self.scaler)
+        np.testing.assert_array_equal(codes, crops)
+        self.forests = {
+            code: RandomForestClassifier(n_estimators=5, random_state=0).fit(
+                self.X[codes == code], y[codes == code]
+            )
+            for code in range(3)
+        }
+        self.model = partitioned.PartitionedModel(
+            self.forests, self.scaler, np.arange(3)
+        )
+        self.codes = codes
+
+    def test_rows_go_to_the_forest_of_their_crop(self):
+        predictions = self.model.predict(self.X)
+        for code, forest in self.forests.items():
+            rows = self.codes == code
+            np.testing.assert_array_equal(
+                predictions[rows], forest.predict(self.X[rows])
+            )
+        np.testing.assert_array_equal(
+            self.model.predict(self.X[:1]),
+            self.forests[self.codes[0]].predict(self.X[:1]),
+        )
+        self.assertEqual(self.model.predict(self.X[:0]).shape, (0,))
+
+    def test_proba_over_the_global_classes(self):
+        proba = self.model.predict_proba(self.X)
+        self.assertEqual(proba.shape, (600, 3))
+        np.testing.assert_allclose(proba.sum(axis=1), 1.0)
+        np.testing.assert_array_equal(proba[self.codes == 2, 0], 1.0)
+
+    def test_unknown_crop(self):
+        model = partitioned.PartitionedModel(
+            {0: self.forests[0]}, self.scaler, np.arange(3)
+        )
+        with self.assertRaisesRegex(ValueError, "crop codes"):
+            model.predict(self.X)
+
+    def test_round_trips_through_an_archive(self):
+        unpacked = artifacts.unpack(artifacts.pack({"model": self.model}))["model"]
+        np.testing.assert_array_equal(
+            unpacked.predict(self.X), self.model.predict(self.X)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+KUBEFLOW_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(KUBEFLOW_DIR, "pipeline_lib"))
+sys.path.insert(0, KUBEFLOW_DIR)
+
+import artifacts  # noqa: E402
+import local_runner  # noqa: E402
+import step_cache  # noqa: E402
+from step_cache import LocalObjectStore, StepCache  # noqa: E402
+
+BUCKET = "kubeflow-pipelines"
+
+
+def put_bytes(store, name, data):
+    store.put_object(BUCKET, name, io.BytesIO(data), len(data))
+
+
+class TestArtifacts(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = LocalObjectStore(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_pack_round_trip(self):
+        members = {
+            "X": np.arange(12.0).reshape(4, 3),
+            "y": np.array([0, 1, 2, 1], dtype=np.uint8),
+            "classes": {"low": 0, "high": 2},
+        }
+        unpacked = artifacts.unpack(artifacts.pack(members))
+        np.testing.assert_array_equal(unpacked["X"], members["X"])
+        np.testing.assert_array_equal(unpacked["y"], members["y"])
+        self.assertEqual(unpacked["classes"], members["classes"])
+        self.assertEqual(set(artifacts.unpack(artifacts.pack(members), ["y"])), {"y"})
+
+    def test_parallel_ranged_download(self):
+        data = np.random.default_rng(0).bytes(10_000)
+        artifacts.upload(self.store, BUCKET, "a/outputs.npz", data, part_size=1024)
+        self.assertEqual(
+            artifacts.download(self.store, BUCKET, "a/outputs.npz", part_size=1024),
+            data,
+        )
+
+    def test_download_checks_sha256(self):
+        put_bytes(self.store, "a/outputs.npz", b"truncated")
+        with self.assertRaises(ValueError):
+            artifacts.download(self.store, BUCKET, "a/outputs.npz", sha256="0" * 64)
+
+
+class TestStepCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = LocalObjectStore(os.path.join(self.tmp.name, "store"))
+        self.outputs = {"model": {"trees": 3}, "X": np.ones((2, 2))}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_miss_then_hit(self):
+        cache = StepCache(self.store, BUCKET, "disease-risk", "training")
+        key = step_cache.step_key("code", {"n": 1}, {"X.npy": "abc"})
+        self.assertIsNone(cache.lookup(key))
+        cache.store(key, self.outputs)
+
+        manifest = cache.lookup(key)
+        self.assertEqual(manifest["key"], key)
+        self.assertEqual(set(manifest["outputs"]), {"model", "X"})
+        loaded = step_cache.load_outputs(self.store, BUCKET, cache.path(key))
+        self.assertEqual(loaded["model"], {"trees": 3})
+        np.testing.assert_array_equal(loaded["X"], self.outputs["X"])
+
+    def test_corrupt_archive_is_rejected(self):
+        cache = StepCache(self.store, BUCKET, "p", "s")
+        key = step_cache.step_key("code", {}, {})
+        cache.store(key, self.outputs)
+        put_bytes(self.store, f"{cache.path(key)}/{step_cache.ARCHIVE}", b"x" * 10)
+        with self.assertRaises(ValueError):
+            step_cache.load_outputs(self.store, BUCKET, cache.path(key))
+
+    def test_disabled_cache_always_misses(self):
+        key = step_cache.step_key("code", {}, {})
+        StepCache(self.store, BUCKET, "p", "s").store(key, self.outputs)
+        self.assertIsNone(StepCache(self.store, BUCKET, "p", "s", False).lookup(key))
+
+    def test_entry_without_manifest_misses(self):
+        cache = StepCache(self.store, BUCKET, "p", "s")
+        key = step_cache.step_key("code", {}, {})
+        put_bytes(self.store, f"{cache.path(key)}/{step_cache.ARCHIVE}", b"archive")
+        self.assertIsNone(cache.lookup(key))
+
+    def test_key_covers_code_params_and_inputs(self):
+        key = step_cache.step_key("code", {"n": 1}, {"X.npy": "abc"})
+        self.assertEqual(key, step_cache.step_key("code", {"n": 1}, {"X.npy": "abc"}))
+        self.assertNotEqual(
+            key, step_cache.step_key("code2", {"n": 1}, {"X.npy": "abc"})
+        )
+        self.assertNotEqual(
+            key, step_cache.step_key("code", {"n": 2}, {"X.npy": "abc"})
+        )
+        self.assertNotEqual(
+            key, step_cache.step_key("code", {"n": 1}, {"X.npy": "abd"})
+        )
+
+    def test_code_digest_covers_the_library(self):
+        def step():
+            return artifacts.pack({})
+
+        with tempfile.TemporaryDirectory() as library:
+            with open(os.path.join(library, "artifacts.py"), "w") as f:
+                f.write("def pack(members):\n    return b''\n")
+            with patch.object(step_cache, "LIBRARY_DIR", library):
+                step_cache.library_digest.cache_clear()
+                before = step_cache.code_digest(step)
+                with open(os.path.join(library, "artifacts.py"), "a") as f:
+                    f.write("# changed\n")
+                step_cache.library_digest.cache_clear()
+                after = step_cache.code_digest(step)
+        step_cache.library_digest.cache_clear()
+        self.assertNotEqual(before, after)
+
+    def test_object_digest_follows_content(self):
+        put_bytes(self.store, "data/a.npy", b"model")
+        before = step_cache.object_digest(self.store, BUCKET, "data/a.npy")
+        put_bytes(self.store, "data/a.npy", b"other model")
+        self.assertNotEqual(
+            before, step_cache.object_digest(self.store, BUCKET, "data/a.npy")
+        )
+
+
+class TestPipelineSteps(unittest.TestCase):
+    """The notebook's components against a LocalObjectStore."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.components = local_runner.load_components(directory=cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.store = LocalObjectStore(tempfile.mkdtemp(dir=self.tmp.name))
+        minio = patch("minio.Minio", lambda *args, **kwargs: self.store)
+        minio.start()
+        self.addCleanup(minio.stop)
+
+    def prepare(self, **params):
+        step = self.components.data_preparation.python_func
+        return step(storage_bucket=BUCKET, data_path="disease-risk", **params)
+
+    def train(self, data_path):
+        step = self.components.model_building_training.python_func
+        return step(storage_bucket=BUCKET, data_path=data_path)
+
+    def upload_dataset(self, seed):
+        """A one-shard .npy dataset in the synthetic_data.py layout."""
+        rng = np.random.default_rng(seed)
+        arrays = {
+            "crop": rng.integers(0, 3, 60).astype(np.uint16),
+            "features": rng.uniform(0, 100, (60, 3)),
+            "risk": np.arange(60, dtype=np.uint8) % 3,
+        }
+        manifest = {
+            "format": "npy",
+            "rows": 60,
+            "crops": ["wheat", "rice", "maize"],
+            "risk_levels": ["low", "medium", "high"],
+            "numeric_features": ["temperature", "humidity", "soil_moisture"],
+            "shards": [{"name": "part-00000", "rows": 60}],
+        }
+        put_bytes(
+            self.store, "datasets/small/manifest.json", json.dumps(manifest).encode()
+        )
+        for part, array in arrays.items():
+            buffer = io.BytesIO()
+            np.save(buffer, array)
+            put_bytes(
+                self.store, f"datasets/small/part-00000.{part}.npy", buffer.getvalue()
+            )
+
+    def test_second_run_reuses_both_steps(self):
+        data = self.prepare()
+        training = self.train(data.data_path)
+        self.assertFalse(data.cache_hit)
+        self.assertFalse(training.cache_hit)
+
+        again = self.prepare()
+        self.assertEqual(again, (data.data_path, True))
+        self.assertEqual(self.train(again.data_path), (training.model_path, True))
+
+        risk = self.components.predict.python_func(
+            crop_name="rice",
+            temperature=25.0,
+            humidity=50.0,
+            soil_moisture=60.0,
+            storage_bucket=BUCKET,
+            model_path=training.model_path,
+        )
+        self.assertEqual(risk, "The disease risk for rice is high.")
+
+    def test_changed_dataset_reruns_both_steps(self):
+        self.upload_dataset(seed=0)
+        data = self.prepare(dataset_path="datasets/small")
+        training = self.train(data.data_path)
+        self.assertTrue(self.prepare(dataset_path="datasets/small").cache_hit)
+
+        self.upload_dataset(seed=1)
+        changed = self.prepare(dataset_path="datasets/small")
+        self.assertFalse(changed.cache_hit)
+        self.assertNotEqual(changed.data_path, data.data_path)
+        retrained = self.train(changed.data_path)
+        self.assertFalse(retrained.cache_hit)
+        self.assertNotEqual(retrained.model_path, training.model_path)
+
+    def test_changed_parameter_misses(self):
+        self.upload_dataset(seed=0)
+        first = self.prepare(dataset_path="datasets/small")
+        fewer = self.prepare(dataset_path="datasets/small", max_rows=30)
+        self.assertFalse(fewer.cache_hit)
+        self.assertNotEqual(first.data_path, fewer.data_path)
+
+    def test_use_cache_false_rebuilds(self):
+        data = self.prepare()
+        rebuilt = self.prepare(use_cache=False)
+        self.assertEqual(rebuilt, (data.data_path, False))
+
+
+if __name__ == "__main__":
+    unittest.main()